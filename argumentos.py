@@ -0,0 +1,140 @@
+import datetime
+import re
+from types import SimpleNamespace
+
+from modelos import normalizar_plataforma, parse_fecha
+
+_RE_ENTERO = re.compile(r"^\d+$")
+_RE_CORREO = re.compile(r"^[^@\s/]+@[^@\s/]+\.[^@\s/]+$")
+_RE_TELEFONO = re.compile(r"^\d{6,15}$")
+_RE_TELEFONO_PARCIAL = re.compile(r"^\d{3,15}$")
+_RE_SEPARADORES_TELEFONO = re.compile(r"[\s()+.-]")
+_RE_HORA = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+
+
+class ErrorArgumentos(Exception):
+    """Argumento inválido; el mensaje está listo para mostrarse al usuario."""
+
+    def __init__(self, mensaje, campo=None, valor=None):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.campo = campo
+        self.valor = valor
+
+
+# --- Validadores: reciben el texto y devuelven el valor ya tipado ---
+
+def texto(valor):
+    return valor.strip()
+
+
+def plataforma(valor):
+    return normalizar_plataforma(valor)
+
+
+def correo(valor):
+    valor = valor.strip()
+    if not _RE_CORREO.match(valor):
+        raise ValueError("correo inválido")
+    return valor
+
+
+def telefono(valor):
+    numero = _RE_SEPARADORES_TELEFONO.sub("", valor)
+    if not _RE_TELEFONO.match(numero):
+        raise ValueError("debe ser un número de teléfono, solo dígitos")
+    return numero
+
+
+def telefono_parcial(valor):
+    numero = _RE_SEPARADORES_TELEFONO.sub("", valor)
+    if not _RE_TELEFONO_PARCIAL.match(numero):
+        raise ValueError("debe ser el número o al menos sus últimos 3 dígitos")
+    return numero
+
+
+def entero_positivo(valor):
+    if not _RE_ENTERO.match(valor) or int(valor) == 0:
+        raise ValueError("debe ser un número entero positivo sin decimales")
+    return int(valor)
+
+
+def entero(valor):
+    if not _RE_ENTERO.match(valor):
+        raise ValueError("debe ser un número entero positivo sin decimales")
+    return int(valor)
+
+
+def fecha(valor):
+    resultado = parse_fecha(valor)
+    if resultado is None:
+        raise ValueError("fecha vacía")
+    return resultado
+
+
+def hora(valor):
+    m = _RE_HORA.match(valor)
+    if not m:
+        raise ValueError("usa el formato hh:mm, por ejemplo 14:30")
+    return datetime.time(int(m.group(1)), int(m.group(2)))
+
+
+def opcion(*permitidas):
+    def validar(valor):
+        valor = valor.strip().lower()
+        if valor not in permitidas:
+            raise ValueError("debe ser " + " o ".join(permitidas))
+        return valor
+    return validar
+
+
+AYUDA_FECHA = "usa el formato dd/mm/aa, por ejemplo 25/05/26"
+
+
+class Arg:
+    __slots__ = ("nombre", "tipo", "opcional", "defecto", "variadico")
+
+    def __init__(self, nombre, tipo=texto, opcional=False, defecto=None, variadico=False):
+        self.nombre = nombre
+        self.tipo = tipo
+        self.opcional = opcional
+        self.defecto = defecto
+        # Toma todas las palabras sobrantes (unidas por espacio)
+        self.variadico = variadico
+
+
+class Esquema:
+    """Argumentos de un comando: se validan una sola vez, antes de tocar la base."""
+
+    def __init__(self, uso, *args):
+        self.uso = uso
+        self.args = args
+        self._obligatorios = sum(1 for a in args if not a.opcional)
+
+    def parse(self, valores):
+        valores = [v for v in valores if v.strip()]
+        if len(valores) < self._obligatorios:
+            raise ErrorArgumentos(f"Uso correcto:\n{self.uso}")
+
+        sobrantes = len(valores) - len(self.args)
+        resultado = {}
+        i = 0
+        for arg in self.args:
+            if arg.variadico:
+                cantidad = max(1, sobrantes + 1)
+                crudo = ' '.join(valores[i:i + cantidad])
+                i += cantidad
+            elif i < len(valores):
+                crudo = valores[i]
+                i += 1
+            else:
+                resultado[arg.nombre] = arg.defecto
+                continue
+
+            try:
+                resultado[arg.nombre] = arg.tipo(crudo)
+            except ValueError as e:
+                detalle = AYUDA_FECHA if arg.tipo is fecha else str(e)
+                raise ErrorArgumentos(f"Valor inválido para {arg.nombre}: '{crudo}' ({detalle}).\n\nUso correcto:\n{self.uso}",
+                                      campo=arg.nombre, valor=crudo)
+        return SimpleNamespace(**resultado)
@@ -0,0 +1,36 @@
+import logging
+import threading
+import time
+
+# Se importa antes que todo lo demás, así el cero es el inicio del proceso
+_INICIO = time.perf_counter()
+
+
+class LineaDeTiempo:
+    """Momentos del arranque (segundos desde que se importó el bot).
+
+    Sirve para ver cuánto tarda el bot en contestar el primer comando
+    después de que la instancia se reinicia y qué etapa se lleva el tiempo.
+    """
+
+    def __init__(self):
+        self.etapas = []
+        self._lock = threading.Lock()
+
+    def marcar(self, etapa):
+        segundos = time.perf_counter() - _INICIO
+        with self._lock:
+            self.etapas.append((etapa, segundos))
+        logging.info(f"Arranque: {etapa} a los {segundos:.3f}s")
+
+    def marcada(self, etapa):
+        return any(e == etapa for e, _ in self.etapas)
+
+    def to_dict(self):
+        return {etapa: round(segundos, 3) for etapa, segundos in self.etapas}
+
+    def texto(self):
+        return "\n".join(f"- {etapa}: {segundos:.3f}s" for etapa, segundos in self.etapas)
+
+
+linea = LineaDeTiempo()
@@ -0,0 +1,117 @@
+import collections
+import heapq
+
+PRIMERA = "primera"
+FIFO = "fifo"
+MENOS_USADA = "menos_usada"
+DOMINIOS = "dominios"
+
+
+def _liberada(cuenta):
+    return cuenta.liberada.timestamp() if cuenta.liberada else 0.0
+
+
+def identidad(correo):
+    """Casilla real detrás de un correo: usuario+alias@dominio -> usuario@dominio."""
+    usuario, _, dominio = correo.lower().partition("@")
+    return usuario.split("+", 1)[0] + "@" + dominio
+
+
+class ColaDisponibles:
+    """Cuentas disponibles por plataforma en un heap ordenado por `clave`.
+
+    Cada vez que una cuenta queda disponible entra con un turno nuevo; las
+    entradas viejas (cuenta vendida, reservada, eliminada o vuelta a
+    encolar) se descartan recién cuando llegan al tope, así tomar la
+    siguiente cuesta O(log n).
+    """
+
+    def __init__(self, clave):
+        self._clave = clave
+        self._heaps = collections.defaultdict(list)
+
+    def agregar(self, cuenta):
+        heapq.heappush(self._heaps[cuenta.plataforma], (self._clave(cuenta), cuenta.turno, cuenta))
+
+    def siguiente(self, plataforma, vigente):
+        heap = self._heaps.get(plataforma)
+        while heap:
+            _, turno, cuenta = heap[0]
+            if vigente(cuenta, turno):
+                return cuenta
+            heapq.heappop(heap)
+        return None
+
+
+class PorIdentidad:
+    """Reparte entre dominios de correo y, dentro de cada dominio, entre casillas (ver identidad()).
+
+    Hay una ronda de dominios por plataforma y en cada dominio una ronda de
+    casillas; de cada casilla sale primero la que lleva más tiempo liberada.
+    Cuando se entrega la cuenta ofrecida pasa al siguiente dominio, y ese
+    dominio, la próxima vez, a su siguiente casilla. Si siguiente() se
+    consulta sin entregar nada, vuelve a ofrecer la misma.
+    """
+
+    def __init__(self):
+        # plataforma -> dominio -> casilla -> heap
+        self._colas = collections.defaultdict(dict)
+        self._dominios = collections.defaultdict(collections.deque)
+        # (plataforma, dominio) -> ronda de casillas
+        self._casillas = {}
+        # plataforma -> (cuenta, turno) que devolvió el último siguiente()
+        self._ofrecida = {}
+
+    def agregar(self, cuenta):
+        casilla = identidad(cuenta.correo)
+        dominio = casilla.partition("@")[2]
+        dominios = self._colas[cuenta.plataforma]
+        if dominio not in dominios:
+            dominios[dominio] = {}
+            self._dominios[cuenta.plataforma].append(dominio)
+            self._casillas[cuenta.plataforma, dominio] = collections.deque()
+        casillas = dominios[dominio]
+        if casilla not in casillas:
+            casillas[casilla] = []
+            self._casillas[cuenta.plataforma, dominio].append(casilla)
+        heapq.heappush(casillas[casilla], (_liberada(cuenta), cuenta.orden, cuenta.turno, cuenta))
+
+    def siguiente(self, plataforma, vigente):
+        dominios = self._dominios.get(plataforma)
+        if not dominios:
+            return None
+        ofrecida = self._ofrecida.pop(plataforma, None)
+        if ofrecida is not None and not vigente(*ofrecida):
+            # Se entregó (o ya no está disponible): le toca al dominio siguiente y, en este, a otra casilla
+            self._casillas[plataforma, dominios[0]].rotate(-1)
+            dominios.rotate(-1)
+
+        colas = self._colas[plataforma]
+        while dominios:
+            dominio = dominios[0]
+            ronda = self._casillas[plataforma, dominio]
+            while ronda:
+                heap = colas[dominio][ronda[0]]
+                while heap and not vigente(heap[0][3], heap[0][2]):
+                    heapq.heappop(heap)
+                if heap:
+                    self._ofrecida[plataforma] = (heap[0][3], heap[0][2])
+                    return heap[0][3]
+                del colas[dominio][ronda.popleft()]
+            dominios.popleft()
+            del colas[dominio], self._casillas[plataforma, dominio]
+        return None
+
+
+POLITICAS = {
+    PRIMERA: lambda: ColaDisponibles(lambda c: c.orden),
+    FIFO: lambda: ColaDisponibles(lambda c: (_liberada(c), c.orden)),
+    MENOS_USADA: lambda: ColaDisponibles(lambda c: (c.usos, _liberada(c), c.orden)),
+    DOMINIOS: PorIdentidad,
+}
+
+
+def crear(politica):
+    if politica not in POLITICAS:
+        raise ValueError(f"Política de asignación desconocida: '{politica}' (usa {', '.join(POLITICAS)})")
+    return POLITICAS[politica]()
@@ -1,36 +1,143 @@
-import json
+from arranque import linea as arranque  # primero: marca el inicio del proceso
 import datetime
 import logging
 import os
 from threading import Thread
 import asyncio
 
-from flask import Flask, jsonify
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
+from telegram.ext import ApplicationBuilder, ContextTypes, TypeHandler
+
+import argumentos
+import asignacion
+import comandos
+import eventos
+from argumentos import Arg, Esquema
+from boveda import Boveda
+from comandos import Pedido
+from historial import deshacer_en
+from inquilinos import PRINCIPAL, Inquilinos
+from notificaciones import CANCELADO, ENTREGADO, ENVIADO, RECORDATORIO, SEGUIMIENTO, VENCIMIENTO
+from modelos import DISPONIBLE, RESERVADO, VENDIDO, Cuenta, formatear_fecha
 
 logging.basicConfig(level=logging.INFO)
+arranque.marcar("imports")
 
 DATA_FILE = 'data.json'
-
-def load_data():
-    try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"cuentas": [], "clientes": {}, "ganancias": {}}
-
-def save_data(data):
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+HISTORIAL_FILE = 'historial.jsonl'
+NOTIFICACIONES_FILE = 'notificaciones.json'
+EVENTOS_FILE = 'eventos.jsonl'
+RESERVA_MINUTOS = int(os.environ.get("RESERVA_MINUTOS", 30))
+ALERTA_STOCK_DIAS = int(os.environ.get("ALERTA_STOCK_DIAS", 3))
+ADMIN_CHAT_ID = os.environ.get("ADMIN_CHAT_ID")
+DIAS_RECORDATORIO = 2
+SEGUIMIENTO_DIAS = int(os.environ.get("SEGUIMIENTO_DIAS", 3))
+NOTIFICAR_HORA = int(os.environ.get("NOTIFICAR_HORA", 9))
+INTEGRIDAD_MINUTOS = int(os.environ.get("INTEGRIDAD_MINUTOS", 30))
+# Con INTEGRIDAD_REPARAR=1 la revisión periódica también corrige lo que tiene una sola lectura posible
+INTEGRIDAD_REPARAR = os.environ.get("INTEGRIDAD_REPARAR") == "1"
+
+MULTI_INQUILINO = os.environ.get("MULTI_INQUILINO") == "1"
+INQUILINOS_DIR = os.environ.get("INQUILINOS_DIR", "inquilinos")
+MAX_INQUILINOS = int(os.environ.get("MAX_INQUILINOS", 10))
+# "chat" (cada grupo o chat privado es una tienda) o "usuario" (cada operador, desde cualquier chat)
+INQUILINO_POR = os.environ.get("INQUILINO_POR", "chat")
+# Chats que siguen usando data.json de la raíz; el del administrador siempre lo es
+CHATS_PRINCIPALES = [c.strip() for c in os.environ.get("CHATS_PRINCIPALES", "").split(",") if c.strip()]
+# Si se define, los updates que llegan se graban (sin datos personales) para reproducirlos con replay.py
+GRABAR_UPDATES = os.environ.get("GRABAR_UPDATES")
+# Token que deben mandar la planilla y el tablero para leer /eventos; sin él, el feed no se expone
+EVENTOS_TOKEN = os.environ.get("EVENTOS_TOKEN")
+# Qué cuenta entrega /comprarcc: primera, fifo (la liberada hace más tiempo), menos_usada o dominios (rota por dominio de correo y, en cada uno, por casilla)
+ASIGNACION = os.environ.get("ASIGNACION", asignacion.PRIMERA)
+if ASIGNACION not in asignacion.POLITICAS:
+    logging.error(f"ASIGNACION='{ASIGNACION}' no existe (usa {', '.join(asignacion.POLITICAS)}); se usa '{asignacion.PRIMERA}'")
+    ASIGNACION = asignacion.PRIMERA
+# Con BOVEDA_CLAVE las contraseñas se guardan cifradas (ver boveda.py); BOVEDA_CACHE es cuántas quedan descifradas en memoria
+BOVEDA_CACHE = int(os.environ.get("BOVEDA_CACHE", 1024))
+# Ids de usuario de Telegram que pueden usar los comandos, separados por coma; vacío = cualquiera
+OPERADORES = [u.strip() for u in os.environ.get("OPERADORES", "").split(",") if u.strip()]
+# Los cambios que llegan dentro de esta ventana se escriben a disco juntos
+GUARDADO_MS = int(os.environ.get("GUARDADO_MS", 200))
+
+inquilinos = Inquilinos(INQUILINOS_DIR, (DATA_FILE, HISTORIAL_FILE, NOTIFICACIONES_FILE, EVENTOS_FILE),
+                        maximo=MAX_INQUILINOS, alerta_dias=ALERTA_STOCK_DIAS,
+                        ids_principales=CHATS_PRINCIPALES + ([ADMIN_CHAT_ID] if ADMIN_CHAT_ID else []),
+                        multi=MULTI_INQUILINO, asignacion=ASIGNACION)
+boveda = Boveda(os.environ.get("BOVEDA_CLAVE"), maximo=BOVEDA_CACHE)
+
+def inquilino_de(update):
+    if INQUILINO_POR == "usuario" and update.effective_user:
+        return inquilinos.id_de(update.effective_user.id)
+    return inquilinos.id_de(update.effective_chat.id if update.effective_chat else None)
+
+def tienda_de(update):
+    return inquilinos.por_id(inquilino_de(update))
+
+def chat_de(tienda):
+    # A dónde mandar lo que el bot envía por su cuenta (alertas, avisos diarios)
+    return ADMIN_CHAT_ID if tienda.id == PRINCIPAL else tienda.id
+
+# Cada comando pasa por estas etapas en orden antes de ejecutarse (ver comandos.py)
+registro = comandos.Registro()
+registro.usar(comandos.errores(), comandos.metricas(registro), comandos.autorizacion(OPERADORES),
+              comandos.argumentos(), comandos.transaccion(tienda_de, GUARDADO_MS / 1000))
+
+def evento_cuenta(cuenta, **datos):
+    # Lo que se publica de una cuenta en el feed de eventos (nunca la contraseña)
+    evento = {"plataforma": cuenta.plataforma, "correo": cuenta.correo, "cliente": cuenta.cliente,
+              "vence": cuenta.fecha_vencimiento.isoformat() if cuenta.fecha_vencimiento else None}
+    evento.update(datos)
+    return evento
+
+def estado_legible(cuenta):
+    return {VENDIDO: "Vendido", RESERVADO: "Reservado"}.get(cuenta.estado, "Disponible")
+
+def url_whatsapp(numero, mensaje):
+    texto_url = mensaje.replace('\n', '%0A').replace(' ', '%20').replace('*', '')
+    return f"https://wa.me/{numero}?text={texto_url}"
 
 def crear_boton_whatsapp(numero, mensaje):
-    texto_url = mensaje.replace('\n', '%0A').replace(' ', '%20').replace('*', '')
-    url = f"https://wa.me/{numero}?text={texto_url}"
-    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("📲 WhatsApp Cliente", url=url)]])
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("📲 WhatsApp Cliente", url=url_whatsapp(numero, mensaje))]])
     return keyboard
 
-async def comandos(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# --- Esquemas de argumentos ---
+# Cada comando valida y convierte sus argumentos una sola vez; los handlers reciben valores ya tipados
+
+CLIENTE = Arg("número_cliente", argumentos.telefono)
+PLATAFORMA = Arg("plataforma", argumentos.plataforma)
+CORREO = Arg("correo")
+FECHA = Arg("fecha_vencimiento", argumentos.fecha)
+GANANCIA = Arg("ganancia", argumentos.entero)
+
+ARGS_AGREGARCC = Esquema("/agregarcc (plataforma) (correo contraseña) / (correo contraseña) / ...",
+                         PLATAFORMA, Arg("cuentas", variadico=True))
+ARGS_COMPRARCC = Esquema("/comprarcc (número_cliente) (plataforma) (fecha_vencimiento) (ganancia)",
+                         Arg("número_cliente", argumentos.telefono, variadico=True), PLATAFORMA, FECHA, GANANCIA)
+ARGS_ASIGNARCC = Esquema("/asignarcc (plataforma) (correo) (número_cliente) (fecha_vencimiento)",
+                         PLATAFORMA, CORREO, CLIENTE, FECHA)
+ARGS_INFO = Esquema("/info (número_cliente o sus últimos dígitos)", Arg("número_cliente", argumentos.telefono_parcial))
+ARGS_RENOVAR = Esquema("/renovar (número_cliente) (plataforma) (correo) (fecha_vencimiento)",
+                       CLIENTE, PLATAFORMA, CORREO, FECHA)
+ARGS_REEMPLAZAR = Esquema("/reemplazar (plataforma) (correo_viejo) (correo_nuevo) (contraseña_nueva)",
+                          PLATAFORMA, Arg("correo_viejo"), Arg("correo_nuevo", argumentos.correo),
+                          Arg("contraseña_nueva"))
+ARGS_ELIMINAR = Esquema("/eliminar (plataforma) (correo)", PLATAFORMA, CORREO)
+ARGS_BUSCARCC = Esquema("/buscarcc (correo_o_plataforma)", Arg("consulta"))
+ARGS_CANCELARCOMPRA = Esquema("/cancelarcompra (número_cliente) (plataforma) (correo)", CLIENTE, PLATAFORMA, CORREO)
+ARGS_RESERVAR = Esquema("/reservar (número_cliente) (plataforma) [minutos]",
+                        CLIENTE, PLATAFORMA, Arg("minutos", argumentos.entero_positivo, opcional=True))
+ARGS_CONFIRMARRESERVA = Esquema("/confirmarreserva (número_cliente) (plataforma) (fecha_vencimiento) (ganancia)",
+                                CLIENTE, PLATAFORMA, FECHA, GANANCIA)
+ARGS_LIBERARRESERVA = Esquema("/liberarreserva (número_cliente) (plataforma)", CLIENTE, PLATAFORMA)
+ARGS_HISTORIAL = Esquema("/historial [cantidad]", Arg("cantidad", argumentos.entero_positivo, opcional=True, defecto=10))
+ARGS_DESHACER = Esquema("/deshacer [cantidad]", Arg("cantidad", argumentos.entero_positivo, opcional=True, defecto=1))
+ARGS_INTEGRIDAD = Esquema("/integridad [reparar]", Arg("accion", argumentos.opcion("reparar"), opcional=True))
+ARGS_RESTAURAR = Esquema("/restaurar (fecha) [hh:mm]", Arg("fecha", argumentos.fecha),
+                         Arg("hora", argumentos.hora, opcional=True, defecto=datetime.time(23, 59, 59)))
+
+@registro.comando("comandos")
+async def ver_comandos(pedido: Pedido):
     texto = """*** COMANDOS PRINCIPALES ***
 
 /comandos - Mostrar comandos
@@ -38,7 +145,7 @@ async def comandos(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /agregarcc (plataforma) (correo contraseña) / (correo contraseña) / ... - Agregar cuentas múltiples
 /comprarcc (número_cliente) (plataforma) (fecha_vencimiento) (ganancia_entera) - Comprar cuenta con ganancia
 /asignarcc (plataforma) (correo) (número_cliente) (fecha_vencimiento) - Asignar cuenta disponible a cliente con fecha
-/info (número_cliente) - Info compras cliente
+/info (número_cliente o sus últimos dígitos) - Ficha del cliente: cuentas, renovaciones, ganancia y próximo vencimiento
 /renovar (número_cliente) (plataforma) (correo) (fecha_vencimiento) - Renovar servicio
 /reemplazar (plataforma) (correo_viejo) (correo_nuevo) (contraseña_nueva) - Reemplazar cuenta
 /vencidos - Listar cuentas vencidas, liberar y sincronizar base
@@ -47,44 +154,47 @@ async def comandos(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /estadisticas - Mostrar resumen de estadísticas
 /buscarcc (correo_o_plataforma) - Buscar cuentas por correo o plataforma
 /cancelarcompra (número_cliente) (plataforma) (correo) - Cancelar compra (liberar cuenta)
+/reservar (número_cliente) (plataforma) [minutos] - Apartar una cuenta mientras el cliente paga
+/confirmarreserva (número_cliente) (plataforma) (fecha_vencimiento) (ganancia_entera) - Confirmar la venta de una reserva
+/liberarreserva (número_cliente) (plataforma) - Liberar una reserva sin vender
+/stock - Disponibilidad por plataforma y cuándo se agotaría
+/historial [cantidad] - Últimas operaciones registradas
+/deshacer [cantidad] - Deshacer las últimas operaciones
+/restaurar (fecha) [hh:mm] - Volver la base al estado de ese momento
+/notificar - Programar recordatorios y enviar los avisos pendientes a clientes
+/avisos - Estado de los avisos a clientes
+/arranque - Tiempos del último arranque del bot
+/integridad [reparar] - Revisar (y corregir) diferencias entre cuentas y clientes
+/metricas - Uso y tiempos de respuesta de cada comando
 """
-    await update.message.reply_text(texto)
-async def basecc(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    cuentas = data["cuentas"]
-    if not cuentas:
-        await update.message.reply_text("No hay cuentas registradas aún.")
+    await pedido.responder(texto)
+@registro.comando("basecc", carga=True)
+async def basecc(pedido: Pedido):
+    data = pedido.data
+    if not data.cuentas:
+        await pedido.responder("No hay cuentas registradas aún.")
         return
 
-    plataformas = {}
-    for c in cuentas:
-        plataforma = c["plataforma"].upper()
-        if plataforma not in plataformas:
-            plataformas[plataforma] = []
-        plataformas[plataforma].append(c)
-
     texto = ""
-    for plataforma, cuentas_plat in plataformas.items():
-        texto += f"-- ({plataforma}) -- ({len(cuentas_plat)})\n"
+    for plataforma, cuentas_plat in data.por_plataforma():
+        if not cuentas_plat:
+            continue
+        texto += f"-- ({plataforma.upper()}) -- ({len(cuentas_plat)})\n"
         for c in cuentas_plat:
-            estado = "Vendido" if c["estado"] == "vendido" else "Disponible"
-            cliente = c["cliente"] if c["cliente"] else "Libre"
-            fecha = c["fecha_vencimiento"] if c["fecha_vencimiento"] else ""
-            texto += f"- {c['correo']}  /  {estado}\n{cliente}  /  {fecha}\n"
+            estado = estado_legible(c)
+            cliente = c.cliente if c.cliente else "Libre"
+            texto += f"- {c.correo}  /  {estado}\n{cliente}  /  {c.fecha_str()}\n"
         texto += "\n"
 
-    await update.message.reply_text(texto.strip())
+    await pedido.responder(texto.strip())
 
-async def agregarcc(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 2:
-        await update.message.reply_text("Uso correcto:\n/agregarcc (plataforma) (correo contraseña) / (correo contraseña) / ...")
-        return
+@registro.comando("agregarcc", ARGS_AGREGARCC, escribe=True)
+async def agregarcc(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
 
-    plataforma = args[0].strip()
-    cuentas_texto = update.message.text.split(' ', 2)[2].strip()
-    cuentas_partes = [c.strip() for c in cuentas_texto.split(' / ') if c.strip()]
+    plataforma = a.plataforma
+    cuentas_partes = [c.strip() for c in a.cuentas.split(' / ') if c.strip()]
 
     cuentas_agregadas = 0
     mensajes_error = []
@@ -94,924 +204,905 @@ async def agregarcc(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if len(partes) < 2:
             mensajes_error.append(f"Formato incorrecto en cuenta: '{cuenta_str}'")
             continue
-        correo = partes[0].strip()
+        try:
+            correo = argumentos.correo(partes[0])
+        except ValueError:
+            mensajes_error.append(f"Correo inválido: '{partes[0]}'")
+            continue
         contraseña = ' '.join(partes[1:]).strip()
 
-        existe = any(c["plataforma"].lower() == plataforma.lower() and c["correo"].lower() == correo.lower() for c in data["cuentas"])
-        if existe:
+        if not data.agregar(Cuenta(plataforma, correo, boveda.cifrar(contraseña))):
             mensajes_error.append(f"La cuenta {correo} ya está registrada.")
             continue
-
-        nueva_cuenta = {
-            "plataforma": plataforma,
-            "correo": correo,
-            "contraseña": contraseña,
-            "estado": "disponible",
-            "cliente": None,
-            "fecha_vencimiento": ""
-        }
-        data["cuentas"].append(nueva_cuenta)
         cuentas_agregadas += 1
 
-    save_data(data)
+    pedido.registrar()
 
     mensaje_respuesta = f"✅ Se agregaron {cuentas_agregadas} cuentas a {plataforma}.\n"
     if mensajes_error:
         mensaje_respuesta += "⚠️ Algunos errores:\n" + "\n".join(mensajes_error)
 
-    await update.message.reply_text(mensaje_respuesta)
+    await pedido.responder(mensaje_respuesta)
 
-async def comprarcc(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-
-    if len(args) < 4:
-        await update.message.reply_text("Uso correcto:\n/comprarcc (número_cliente) (plataforma) (fecha_vencimiento) (ganancia)")
-        return
+@registro.comando("comprarcc", ARGS_COMPRARCC, escribe=True)
+async def comprarcc(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
 
-    ganancia_str = args[-1]
-    fecha_vencimiento = args[-2]
-    plataforma = args[-3]
-    numero_cliente_parts = args[:-3]
-    numero_cliente = ' '.join(numero_cliente_parts).strip()
+    numero_cliente = a.número_cliente
+    plataforma = a.plataforma
+    fecha_vencimiento = a.fecha_vencimiento
+    ganancia = a.ganancia
 
-    if not ganancia_str.isdigit():
-        await update.message.reply_text("Ganancia inválida, debe ser un número entero positivo sin decimales.")
+    cuenta_encontrada = data.primera_disponible(plataforma)
+    if not cuenta_encontrada:
+        await pedido.responder("No hay cuentas disponibles para esa plataforma.")
         return
 
-    ganancia = int(ganancia_str)
-
-    cuenta_encontrada = None
-    for c in data["cuentas"]:
-        if c["plataforma"].lower() == plataforma.lower() and c["estado"] == "disponible":
-            cuenta_encontrada = c
-            break
+    data.vender(cuenta_encontrada, numero_cliente, fecha_vencimiento)
+    data.sumar_ganancia(plataforma, ganancia, numero_cliente)
 
-    if not cuenta_encontrada:
-        await update.message.reply_text("No hay cuentas disponibles para esa plataforma.")
-        return
+    pedido.registrar(evento_cuenta(cuenta_encontrada, ganancia=ganancia))
 
-    correo_cuenta = cuenta_encontrada["correo"].lower()
-    plataforma_cuenta = plataforma.lower()
-    clientes_a_modificar = []
-    for cliente_num, compras in list(data["clientes"].items()):
-        nuevas_compras = [compra for compra in compras
-                         if not (compra["correo"].lower() == correo_cuenta and compra["plataforma"].lower() == plataforma_cuenta)]
-        if len(nuevas_compras) != len(compras):
-            data["clientes"][cliente_num] = nuevas_compras
-            clientes_a_modificar.append(cliente_num)
-
-    for cliente_num in clientes_a_modificar:
-        if len(data["clientes"][cliente_num]) == 0:
-            del data["clientes"][cliente_num]
-
-    cuenta_encontrada["estado"] = "vendido"
-    cuenta_encontrada["cliente"] = numero_cliente
-    cuenta_encontrada["fecha_vencimiento"] = fecha_vencimiento
-
-    if numero_cliente not in data["clientes"]:
-        data["clientes"][numero_cliente] = []
-
-    existe = False
-    for compra in data["clientes"][numero_cliente]:
-        if compra["plataforma"].lower() == plataforma_cuenta and compra["correo"].lower() == correo_cuenta:
-            compra["fecha_vencimiento"] = fecha_vencimiento
-            existe = True
-            break
-    if not existe:
-        data["clientes"][numero_cliente].append({
-            "plataforma": plataforma,
-            "correo": cuenta_encontrada["correo"],
-            "contraseña": cuenta_encontrada["contraseña"],
-            "fecha_vencimiento": fecha_vencimiento
-        })
-
-    if "ganancias" not in data:
-        data["ganancias"] = {}
-    ganancia_actual = data["ganancias"].get(plataforma.lower(), 0)
-    data["ganancias"][plataforma.lower()] = ganancia_actual + ganancia
-
-    save_data(data)
-
-    mensaje = f\"\"\"- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
+    mensaje = f"""- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
        -- *{plataforma.upper()}* --
-correo: {cuenta_encontrada['correo']}
-contraseña: {cuenta_encontrada['contraseña']}
-*Toca renovar:* {fecha_vencimiento}
-\"\"\" 
+correo: {cuenta_encontrada.correo}
+contraseña: {boveda.descifrar(cuenta_encontrada.contraseña)}
+*Toca renovar:* {formatear_fecha(fecha_vencimiento)}
+"""
 
     boton = crear_boton_whatsapp(numero_cliente, mensaje)
-    await update.message.reply_text(mensaje, parse_mode='Markdown', reply_markup=boton)
-async def asignarcc(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 4:
-        await update.message.reply_text("Uso correcto:\n/asignarcc (plataforma) (correo) (número_cliente) (fecha_vencimiento)")
-        return
-
-    plataforma = args[0].strip()
-    correo = args[1].strip()
-    numero_cliente = args[2].strip()
-    fecha_vencimiento = args[3].strip()
-
-    cuenta_a_asignar = None
-    for c in data["cuentas"]:
-        if c["plataforma"].lower() == plataforma.lower() and c["correo"].lower() == correo.lower():
-            cuenta_a_asignar = c
-            break
-
+    await pedido.responder(mensaje, parse_mode='Markdown', reply_markup=boton)
+@registro.comando("asignarcc", ARGS_ASIGNARCC, escribe=True)
+async def asignarcc(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
+
+    plataforma = a.plataforma
+    correo = a.correo
+    numero_cliente = a.número_cliente
+    fecha_vencimiento = a.fecha_vencimiento
+
+    cuenta_a_asignar = data.buscar(plataforma, correo)
     if not cuenta_a_asignar:
-        await update.message.reply_text("No se encontró la cuenta especificada.")
+        await pedido.responder("No se encontró la cuenta especificada.")
         return
 
-    if cuenta_a_asignar["estado"] != "disponible":
-        await update.message.reply_text("La cuenta no está disponible para asignar.")
+    if cuenta_a_asignar.estado != DISPONIBLE:
+        await pedido.responder("La cuenta no está disponible para asignar.")
         return
 
-    correo_cuenta = correo.lower()
-    plataforma_cuenta = plataforma.lower()
-    clientes_a_modificar = []
-    for cliente_num, compras in list(data["clientes"].items()):
-        nuevas_compras = [compra for compra in compras
-                         if not (compra["correo"].lower() == correo_cuenta and compra["plataforma"].lower() == plataforma_cuenta)]
-        if len(nuevas_compras) != len(compras):
-            data["clientes"][cliente_num] = nuevas_compras
-            clientes_a_modificar.append(cliente_num)
-    for cliente_num in clientes_a_modificar:
-        if len(data["clientes"][cliente_num]) == 0:
-            del data["clientes"][cliente_num]
-
-    cuenta_a_asignar["estado"] = "vendido"
-    cuenta_a_asignar["cliente"] = numero_cliente
-    cuenta_a_asignar["fecha_vencimiento"] = fecha_vencimiento
-
-    if numero_cliente not in data["clientes"]:
-        data["clientes"][numero_cliente] = []
-
-    existe = False
-    for compra in data["clientes"][numero_cliente]:
-        if compra["plataforma"].lower() == plataforma_cuenta and compra["correo"].lower() == correo_cuenta:
-            compra["fecha_vencimiento"] = fecha_vencimiento
-            existe = True
-            break
-    if not existe:
-        data["clientes"][numero_cliente].append({
-            "plataforma": plataforma,
-            "correo": correo,
-            "contraseña": cuenta_a_asignar["contraseña"],
-            "fecha_vencimiento": fecha_vencimiento
-        })
-
-    save_data(data)
+    data.vender(cuenta_a_asignar, numero_cliente, fecha_vencimiento)
+
+    pedido.registrar(evento_cuenta(cuenta_a_asignar))
 
     mensaje = f"""Cuenta asignada a cliente {numero_cliente}:
 
 -- *{plataforma.upper()}* --
 Correo: {correo}
 *Estado:* Vendido
-*Fecha de vencimiento:* {fecha_vencimiento}
+*Fecha de vencimiento:* {formatear_fecha(fecha_vencimiento)}
 """
     boton = crear_boton_whatsapp(numero_cliente, mensaje)
-    await update.message.reply_text(mensaje, parse_mode='Markdown', reply_markup=boton)
+    await pedido.responder(mensaje, parse_mode='Markdown', reply_markup=boton)
+
+def dias_para(fecha, hoy):
+    dias = (fecha - hoy).days
+    if dias == 0:
+        return "vence hoy"
+    return f"en {dias} día(s)" if dias > 0 else f"vencida hace {-dias} día(s)"
+
+def texto_compras_cliente(numero_cliente, compras, contraseñas):
+    # Lo que se le manda al cliente por WhatsApp: solo sus cuentas
+    return "\n".join(f"""-- {numero_cliente} --
+- {compra.plataforma}
+- {compra.correo} / {contraseña}
+  - - -   {compra.fecha_str()}   - - -
+""" for compra, contraseña in zip(compras, contraseñas))
+
+def vista_cliente(data, numero_cliente, hoy):
+    """Devuelve (vista para el operador, texto para el cliente); se arma una vez por día y por cambio.
+
+    En memoria queda con las contraseñas como están guardadas (cifradas con
+    BOVEDA_CLAVE); se descifran al pedirla, pasando por la caché de la bóveda.
+    """
+    en_cache = data.vistas.get(numero_cliente)
+    if not (en_cache and en_cache[0] == hoy):
+        en_cache = data.vistas[numero_cliente] = armar_vista(data, numero_cliente, hoy)
+    _, texto, para_cliente, guardadas = en_cache
+    for guardada, contraseña in zip(guardadas, boveda.descifrar_varios(guardadas)):
+        if guardada != contraseña:
+            texto = texto.replace(guardada, contraseña)
+            para_cliente = para_cliente.replace(guardada, contraseña)
+    return texto, para_cliente
+
+def armar_vista(data, numero_cliente, hoy):
+    compras = data.clientes.get(numero_cliente, [])
+    contraseñas = [compra.contraseña for compra in compras]
+    ficha = data.fichas.get(numero_cliente)
+    texto = f"👤 Cliente {numero_cliente}\n\n"
+    texto += f"Cuentas activas ({len(compras)}):\n"
+    for compra, contraseña in zip(compras, contraseñas):
+        vence = f" ({dias_para(compra.fecha_vencimiento, hoy)})" if compra.fecha_vencimiento else ""
+        texto += f"- {compra.plataforma}: {compra.correo} / {contraseña} - vence {compra.fecha_str()}{vence}\n"
+    if not compras:
+        texto += "- Ninguna\n"
+
+    fechas = [c.fecha_vencimiento for c in compras if c.fecha_vencimiento]
+    if fechas:
+        proxima = min(fechas)
+        texto += f"\nPróximo vencimiento: {formatear_fecha(proxima)} ({dias_para(proxima, hoy)})\n"
+
+    if ficha:
+        texto += f"\nCompras: {ficha.compras} · Renovaciones: {ficha.renovadas} · Ganancia total: S/. {ficha.ganancia:.2f}\n"
+        if ficha.primera:
+            texto += f"Cliente desde {formatear_fecha(ficha.primera)} · último movimiento {formatear_fecha(ficha.ultima)}\n"
+        if ficha.renovaciones:
+            texto += "Últimas renovaciones:\n"
+            for dia, plataforma, correo, fecha in reversed(ficha.renovaciones[-5:]):
+                texto += f"- {formatear_fecha(dia)} {plataforma} ({correo}) hasta {formatear_fecha(fecha)}\n"
+
+    para_cliente = texto_compras_cliente(numero_cliente, compras, contraseñas) if compras else None
+    return hoy, texto, para_cliente, contraseñas
+
+@registro.comando("info", ARGS_INFO, carga=True)
+async def info(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
+    hoy = datetime.date.today()
 
-async def info(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 1:
-        await update.message.reply_text("Uso correcto:\n/info (número_cliente)")
+    numeros = data.buscar_clientes(a.número_cliente)
+    if not numeros:
+        await pedido.responder("No se encontró información para ese número de cliente.")
         return
-    numero_cliente = args[0].strip()
-    if numero_cliente not in data["clientes"]:
-        await update.message.reply_text("No se encontró información para ese número de cliente.")
+    if len(numeros) > 1 and numeros[0] != a.número_cliente:
+        texto = "Varios clientes coinciden:\n"
+        texto += "".join(f"- {n}: {len(data.clientes.get(n, []))} cuenta(s) activa(s)\n" for n in numeros)
+        await pedido.responder(texto + "\nUsa /info con más dígitos o con el número completo.")
         return
 
-    mensajes = []
-    for compra in data["clientes"][numero_cliente]:
-        texto = f"""-- {numero_cliente} --
-- {compra['plataforma']}
-- {compra['correo']} / {compra['contraseña']}
-  - - -   {compra['fecha_vencimiento']}   - - -
-"""
-        mensajes.append(texto)
-
-    texto_completo = "\n".join(mensajes)
-    boton = crear_boton_whatsapp(numero_cliente, texto_completo)
-    await update.message.reply_text(texto_completo, reply_markup=boton)
-
-async def renovar(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 4:
-        await update.message.reply_text("Uso correcto:\n/renovar (número_cliente) (plataforma) (correo) (fecha_vencimiento)")
-        return
-    numero_cliente = args[0].strip()
-    plataforma = args[1].strip()
-    correo = args[2].strip()
-    fecha_vencimiento = args[3].strip()
-
-    cuenta_actualizada = None
-    for c in data["cuentas"]:
-        if c["plataforma"].lower() == plataforma.lower() and c["correo"].lower() == correo.lower() and c["cliente"] == numero_cliente:
-            c["fecha_vencimiento"] = fecha_vencimiento
-            cuenta_actualizada = c
-            break
-
-    if not cuenta_actualizada:
-        await update.message.reply_text("No se encontró la cuenta para renovar.")
+    numero_cliente = numeros[0]
+    texto, para_cliente = vista_cliente(data, numero_cliente, hoy)
+    boton = crear_boton_whatsapp(numero_cliente, para_cliente) if para_cliente else None
+    await pedido.responder(texto, reply_markup=boton)
+
+@registro.comando("renovar", ARGS_RENOVAR, escribe=True)
+async def renovar(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
+    numero_cliente = a.número_cliente
+    plataforma = a.plataforma
+    correo = a.correo
+    fecha_vencimiento = a.fecha_vencimiento
+
+    cuenta_actualizada = data.buscar(plataforma, correo)
+    if not cuenta_actualizada or cuenta_actualizada.estado != VENDIDO or cuenta_actualizada.cliente != numero_cliente:
+        await pedido.responder("No se encontró la cuenta para renovar.")
         return
 
-    if numero_cliente in data["clientes"]:
-        for compra in data["clientes"][numero_cliente]:
-            if compra["plataforma"].lower() == plataforma.lower() and compra["correo"].lower() == correo.lower():
-                compra["fecha_vencimiento"] = fecha_vencimiento
-                break
+    data.renovar(cuenta_actualizada, fecha_vencimiento)
 
-    save_data(data)
+    pedido.registrar(evento_cuenta(cuenta_actualizada))
 
     mensaje = f"""- - - SERVICIO RENOVADO DE *{plataforma.upper()}* - - -
 - Correo: {correo}
-- *TOCA RENOVAR:* {fecha_vencimiento}
+- *TOCA RENOVAR:* {formatear_fecha(fecha_vencimiento)}
 /// *GRACIAS POR SU PREFERENCIA* ///
 """
 
     boton = crear_boton_whatsapp(numero_cliente, mensaje)
-import json
-import datetime
-import logging
-import os
-from threading import Thread
-import asyncio
+    await pedido.responder(mensaje, parse_mode='Markdown', reply_markup=boton)
+@registro.comando("reemplazar", ARGS_REEMPLAZAR, escribe=True)
+async def reemplazar(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
+    plataforma = a.plataforma
+    correo_viejo = a.correo_viejo
+    correo_nuevo = a.correo_nuevo
+    contraseña_nueva = a.contraseña_nueva
+
+    cuenta_encontrada = data.buscar(plataforma, correo_viejo)
+    if not cuenta_encontrada:
+        await pedido.responder("No se encontró la cuenta para reemplazar.")
+        return
 
-from flask import Flask, jsonify
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
+    if correo_nuevo.lower() != correo_viejo.lower() and data.buscar(plataforma, correo_nuevo):
+        await pedido.responder(f"La cuenta {correo_nuevo} ya está registrada.")
+        return
 
-logging.basicConfig(level=logging.INFO)
+    cliente_asignado = cuenta_encontrada.cliente
+    data.reemplazar(cuenta_encontrada, correo_nuevo, boveda.cifrar(contraseña_nueva))
 
-DATA_FILE = 'data.json'
+    pedido.registrar(evento_cuenta(cuenta_encontrada, correo_anterior=correo_viejo))
 
-def load_data():
-    try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"cuentas": [], "clientes": {}, "ganancias": {}}
+    mensaje = f"""ACTUALIZACIÓN - *{plataforma.upper()}*
+- Correo: {correo_nuevo}
+- Contraseña: {contraseña_nueva}
+"""
+    boton = crear_boton_whatsapp(cliente_asignado if cliente_asignado else '', mensaje)
+    await pedido.responder(mensaje, parse_mode='Markdown', reply_markup=boton)
 
-def save_data(data):
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+@registro.comando("vencidos", alias=["vencidas"], escribe=True)
+async def vencidos(pedido: Pedido):
+    tienda, data = pedido.tienda, pedido.data
+    hoy = datetime.date.today()
 
-def crear_boton_whatsapp(numero, mensaje):
-    texto_url = mensaje.replace('\n', '%0A').replace(' ', '%20').replace('*', '')
-    url = f"https://wa.me/{numero}?text={texto_url}"
-    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("📲 WhatsApp Cliente", url=url)]])
-    return keyboard
+    cuentas_por_cliente = {}
+    liberadas = []
 
-async def comandos(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    texto = """*** COMANDOS PRINCIPALES ***
+    for c in data.vendidas_vencidas(hoy):
+        numero_cliente = c.cliente
+        if not numero_cliente:
+            logging.warning(f"Cuenta vencida sin cliente asignado: {c.to_dict()}")
+            continue
 
-/comandos - Mostrar comandos
-/basecc - Mostrar todas las cuentas completas
-/agregarcc (plataforma) (correo contraseña) / (correo contraseña) / ... - Agregar cuentas múltiples
-/comprarcc (número_cliente) (plataforma) (fecha_vencimiento) (ganancia_entera) - Comprar cuenta con ganancia
-/asignarcc (plataforma) (correo) (número_cliente) (fecha_vencimiento) - Asignar cuenta disponible a cliente con fecha
-/info (número_cliente) - Info compras cliente
-/renovar (número_cliente) (plataforma) (correo) (fecha_vencimiento) - Renovar servicio
-/reemplazar (plataforma) (correo_viejo) (correo_nuevo) (contraseña_nueva) - Reemplazar cuenta
-/vencidos - Listar cuentas vencidas, liberar y sincronizar base
-/eliminar (plataforma) (correo) - Eliminar cuenta
-/sincronizar - Sincronizar bases clientes y cuentas
-/estadisticas - Mostrar resumen de estadísticas
-/buscarcc (correo_o_plataforma) - Buscar cuentas por correo o plataforma
-/cancelarcompra (número_cliente) (plataforma) (correo) - Cancelar compra (liberar cuenta)
-"""
-    await update.message.reply_text(texto)
-async def basecc(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    cuentas = data["cuentas"]
-    if not cuentas:
-        await update.message.reply_text("No hay cuentas registradas aún.")
-        return
+        if numero_cliente not in cuentas_por_cliente:
+            cuentas_por_cliente[numero_cliente] = []
+        cuentas_por_cliente[numero_cliente].append((c.plataforma, c.correo, c.fecha_vencimiento))
+        liberadas.append(evento_cuenta(c))
 
-    plataformas = {}
-    for c in cuentas:
-        plataforma = c["plataforma"].upper()
-        if plataforma not in plataformas:
-            plataformas[plataforma] = []
-        plataformas[plataforma].append(c)
+        data.liberar(c)
 
-    texto = ""
-    for plataforma, cuentas_plat in plataformas.items():
-        texto += f"-- ({plataforma}) -- ({len(cuentas_plat)})\n"
-        for c in cuentas_plat:
-            estado = "Vendido" if c["estado"] == "vendido" else "Disponible"
-            cliente = c["cliente"] if c["cliente"] else "Libre"
-            fecha = c["fecha_vencimiento"] if c["fecha_vencimiento"] else ""
-            texto += f"- {c['correo']}  /  {estado}\n{cliente}  /  {fecha}\n"
-        texto += "\n"
+    if not cuentas_por_cliente:
+        await pedido.responder("No hay cuentas vencidas para notificar.")
+        return
 
-    await update.message.reply_text(texto.strip())
+    pedido.registrar({"cuentas": liberadas})
 
-async def agregarcc(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 2:
-        await update.message.reply_text("Uso correcto:\n/agregarcc (plataforma) (correo contraseña) / (correo contraseña) / ...")
+    # Un aviso de vencimiento hoy y un seguimiento por si el cliente no renueva
+    for numero_cliente, cuentas_cliente in cuentas_por_cliente.items():
+        fecha = max(f for _, _, f in cuentas_cliente)
+        cuentas = [(p, c) for p, c, _ in cuentas_cliente]
+        tienda.avisos.encolar(VENCIMIENTO, numero_cliente, fecha, hoy, cuentas)
+        tienda.avisos.encolar(SEGUIMIENTO, numero_cliente, fecha, hoy + datetime.timedelta(days=SEGUIMIENTO_DIAS), cuentas)
+    tienda.avisos.guardar()
+
+    await pedido.responder(
+        f"Se liberaron {len(liberadas)} cuentas vencidas de {len(cuentas_por_cliente)} clientes. Enviando avisos..."
+    )
+    programar_envio(pedido.context, tienda, pedido.update.effective_chat.id)
+
+@registro.comando("eliminar", ARGS_ELIMINAR, escribe=True)
+async def eliminar(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
+    plataforma = a.plataforma
+    correo = a.correo
+
+    cuenta_a_eliminar = data.buscar(plataforma, correo)
+    if not cuenta_a_eliminar:
+        await pedido.responder("No se encontró la cuenta para eliminar.")
         return
 
-    plataforma = args[0].strip()
-    cuentas_texto = update.message.text.split(' ', 2)[2].strip()
-    cuentas_partes = [c.strip() for c in cuentas_texto.split(' / ') if c.strip()]
+    cliente = cuenta_a_eliminar.cliente
+    fecha_venc = cuenta_a_eliminar.fecha_str()
+    evento = evento_cuenta(cuenta_a_eliminar)
 
-    cuentas_agregadas = 0
-    mensajes_error = []
+    data.eliminar(cuenta_a_eliminar)
 
-    for cuenta_str in cuentas_partes:
-        partes = cuenta_str.split()
-        if len(partes) < 2:
-            mensajes_error.append(f"Formato incorrecto en cuenta: '{cuenta_str}'")
-            continue
-        correo = partes[0].strip()
-        contraseña = ' '.join(partes[1:]).strip()
+    pedido.registrar(evento)
 
-        existe = any(c["plataforma"].lower() == plataforma.lower() and c["correo"].lower() == correo.lower() for c in data["cuentas"])
-        if existe:
-            mensajes_error.append(f"La cuenta {correo} ya está registrada.")
-            continue
+    if cliente:
+        texto = f"""Asignar cuenta {plataforma}
+({cliente}) // ({fecha_venc})
+"""
+        boton = crear_boton_whatsapp(cliente, texto)
+        await pedido.responder(texto, reply_markup=boton)
+    else:
+        await pedido.responder("Cuenta eliminada correctamente.")
 
-        nueva_cuenta = {
-            "plataforma": plataforma,
-            "correo": correo,
-            "contraseña": contraseña,
-            "estado": "disponible",
-            "cliente": None,
-            "fecha_vencimiento": ""
-        }
-        data["cuentas"].append(nueva_cuenta)
-        cuentas_agregadas += 1
+@registro.comando("sincronizar", escribe=True)
+async def sincronizar(pedido: Pedido):
+    data = pedido.data
 
-    save_data(data)
+    sincronizados = data.sincronizar()
 
-    mensaje_respuesta = f"✅ Se agregaron {cuentas_agregadas} cuentas a {plataforma}.\n"
-    if mensajes_error:
-        mensaje_respuesta += "⚠️ Algunos errores:\n" + "\n".join(mensajes_error)
+    pedido.registrar()
+    await pedido.responder(f"Sincronización completada. Se actualizaron {sincronizados} cuentas y se limpiaron compras inexistentes.")
 
-    await update.message.reply_text(mensaje_respuesta)
+@registro.comando("estadisticas", carga=True)
+async def estadisticas(pedido: Pedido):
+    data = pedido.data
+    hoy = datetime.date.today()
+    dias_para_alerta = 2
 
-async def comprarcc(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
+    ganancias = data.ganancias
+    cuentas = data.cuentas
 
-    if len(args) < 4:
-        await update.message.reply_text("Uso correcto:\n/comprarcc (número_cliente) (plataforma) (fecha_vencimiento) (ganancia)")
-        return
+    texto = "📊 *Estadísticas rápidas* 📊\n\n"
 
-    ganancia_str = args[-1]
-    fecha_vencimiento = args[-2]
-    plataforma = args[-3]
-    numero_cliente_parts = args[:-3]
-    numero_cliente = ' '.join(numero_cliente_parts).strip()
+    texto += "💰 *Total de ingresos por plataforma:*\n"
+    for plataforma in sorted(ganancias.keys()):
+        texto += f"- {plataforma.capitalize()}: S/. {ganancias[plataforma]:.2f}\n"
+    if not ganancias:
+        texto += "- Sin registros aún\n"
+    texto += "\n"
 
-    if not ganancia_str.isdigit():
-        await update.message.reply_text("Ganancia inválida, debe ser un número entero positivo sin decimales.")
-        return
+    total_vendidas = 0
+    proximas = []
+    for c in cuentas:
+        if c.estado != VENDIDO:
+            continue
+        total_vendidas += 1
+        if c.fecha_texto:
+            logging.error(f"Error en fecha vencimiento: '{c.fecha_texto}' de {c.correo}")
+        elif c.fecha_vencimiento:
+            delta = (c.fecha_vencimiento - hoy).days
+            if 0 <= delta <= dias_para_alerta:
+                proximas.append(c)
 
-    ganancia = int(ganancia_str)
+    texto += f"✅ Total cuentas vendidas: {total_vendidas}\n"
 
-    cuenta_encontrada = None
-    for c in data["cuentas"]:
-        if c["plataforma"].lower() == plataforma.lower() and c["estado"] == "disponible":
-            cuenta_encontrada = c
-            break
+    total_disponibles = sum(1 for c in cuentas if c.estado == DISPONIBLE)
+    texto += f"📦 Total cuentas disponibles: {total_disponibles}\n"
 
-    if not cuenta_encontrada:
-        await update.message.reply_text("No hay cuentas disponibles para esa plataforma.")
-        return
+    total_reservadas = sum(1 for c in cuentas if c.estado == RESERVADO)
+    texto += f"⏳ Total cuentas reservadas: {total_reservadas}\n"
 
-    correo_cuenta = cuenta_encontrada["correo"].lower()
-    plataforma_cuenta = plataforma.lower()
-    clientes_a_modificar = []
-    for cliente_num, compras in list(data["clientes"].items()):
-        nuevas_compras = [compra for compra in compras
-                         if not (compra["correo"].lower() == correo_cuenta and compra["plataforma"].lower() == plataforma_cuenta)]
-        if len(nuevas_compras) != len(compras):
-            data["clientes"][cliente_num] = nuevas_compras
-            clientes_a_modificar.append(cliente_num)
-
-    for cliente_num in clientes_a_modificar:
-        if len(data["clientes"][cliente_num]) == 0:
-            del data["clientes"][cliente_num]
-
-    cuenta_encontrada["estado"] = "vendido"
-    cuenta_encontrada["cliente"] = numero_cliente
-    cuenta_encontrada["fecha_vencimiento"] = fecha_vencimiento
-
-    if numero_cliente not in data["clientes"]:
-        data["clientes"][numero_cliente] = []
-
-    existe = False
-    for compra in data["clientes"][numero_cliente]:
-        if compra["plataforma"].lower() == plataforma_cuenta and compra["correo"].lower() == correo_cuenta:
-            compra["fecha_vencimiento"] = fecha_vencimiento
-            existe = True
-            break
-    if not existe:
-        data["clientes"][numero_cliente].append({
-            "plataforma": plataforma,
-            "correo": cuenta_encontrada["correo"],
-            "contraseña": cuenta_encontrada["contraseña"],
-            "fecha_vencimiento": fecha_vencimiento
-        })
-
-    if "ganancias" not in data:
-        data["ganancias"] = {}
-    ganancia_actual = data["ganancias"].get(plataforma.lower(), 0)
-    data["ganancias"][plataforma.lower()] = ganancia_actual + ganancia
-
-    save_data(data)
-
-    mensaje = f\"\"\"- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
-       -- *{plataforma.upper()}* --
-correo: {cuenta_encontrada['correo']}
-contraseña: {cuenta_encontrada['contraseña']}
-*Toca renovar:* {fecha_vencimiento}
-\"\"\" 
+    total_clientes = len(data.clientes)
+    texto += f"👥 Total clientes activos: {total_clientes}\n\n"
 
-    boton = crear_boton_whatsapp(numero_cliente, mensaje)
-    await update.message.reply_text(mensaje, parse_mode='Markdown', reply_markup=boton)
-async def asignarcc(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 4:
-        await update.message.reply_text("Uso correcto:\n/asignarcc (plataforma) (correo) (número_cliente) (fecha_vencimiento)")
-        return
+    texto += f"⏰ *Cuentas próximas a vencer en {dias_para_alerta} días:*\n"
+    if proximas:
+        for c in proximas:
+            texto += f"- {c.plataforma.capitalize()} ({c.correo}) cliente: {c.cliente} vence: {c.fecha_str()}\n"
+    else:
+        texto += "No hay cuentas próximas a vencer.\n"
 
-    plataforma = args[0].strip()
-    correo = args[1].strip()
-    numero_cliente = args[2].strip()
-    fecha_vencimiento = args[3].strip()
+    await pedido.responder(texto, parse_mode="Markdown")
 
-    cuenta_a_asignar = None
-    for c in data["cuentas"]:
-        if c["plataforma"].lower() == plataforma.lower() and c["correo"].lower() == correo.lower():
-            cuenta_a_asignar = c
-            break
+@registro.comando("buscarcc", ARGS_BUSCARCC, carga=True)
+async def buscarcc(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
+    consulta = a.consulta.lower()
 
-    if not cuenta_a_asignar:
-        await update.message.reply_text("No se encontró la cuenta especificada.")
-        return
+    resultados = []
+    for c in data.cuentas:
+        if consulta in c.clave[1] or consulta in c.plataforma:
+            estado = estado_legible(c)
+            cliente = c.cliente if c.cliente else "Libre"
+            resultados.append(f"-- {c.plataforma.capitalize()} --\nCorreo: {c.correo}\nEstado: {estado}\nCliente: {cliente}\n")
 
-    if cuenta_a_asignar["estado"] != "disponible":
-        await update.message.reply_text("La cuenta no está disponible para asignar.")
+    if resultados:
+        await pedido.responder("\n".join(resultados))
+    else:
+        await pedido.responder("No se encontraron cuentas con ese correo o plataforma.")
+
+@registro.comando("cancelarcompra", ARGS_CANCELARCOMPRA, escribe=True)
+async def cancelarcompra(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
+    numero_cliente = a.número_cliente
+    plataforma = a.plataforma
+    correo = a.correo
+
+    cuenta = data.buscar(plataforma, correo)
+    if not cuenta or cuenta.cliente != numero_cliente:
+        await pedido.responder("No se encontró la compra para cancelar.")
         return
 
-    correo_cuenta = correo.lower()
-    plataforma_cuenta = plataforma.lower()
-    clientes_a_modificar = []
-    for cliente_num, compras in list(data["clientes"].items()):
-        nuevas_compras = [compra for compra in compras
-                         if not (compra["correo"].lower() == correo_cuenta and compra["plataforma"].lower() == plataforma_cuenta)]
-        if len(nuevas_compras) != len(compras):
-            data["clientes"][cliente_num] = nuevas_compras
-            clientes_a_modificar.append(cliente_num)
-    for cliente_num in clientes_a_modificar:
-        if len(data["clientes"][cliente_num]) == 0:
-            del data["clientes"][cliente_num]
-
-    cuenta_a_asignar["estado"] = "vendido"
-    cuenta_a_asignar["cliente"] = numero_cliente
-    cuenta_a_asignar["fecha_vencimiento"] = fecha_vencimiento
-
-    if numero_cliente not in data["clientes"]:
-        data["clientes"][numero_cliente] = []
-
-    existe = False
-    for compra in data["clientes"][numero_cliente]:
-        if compra["plataforma"].lower() == plataforma_cuenta and compra["correo"].lower() == correo_cuenta:
-            compra["fecha_vencimiento"] = fecha_vencimiento
-            existe = True
-            break
-    if not existe:
-        data["clientes"][numero_cliente].append({
-            "plataforma": plataforma,
-            "correo": correo,
-            "contraseña": cuenta_a_asignar["contraseña"],
-            "fecha_vencimiento": fecha_vencimiento
-        })
-
-    save_data(data)
-
-    mensaje = f"""Cuenta asignada a cliente {numero_cliente}:
+    evento = evento_cuenta(cuenta)
+    data.liberar(cuenta)
 
--- *{plataforma.upper()}* --
-Correo: {correo}
-*Estado:* Vendido
-*Fecha de vencimiento:* {fecha_vencimiento}
-"""
-    boton = crear_boton_whatsapp(numero_cliente, mensaje)
-    await update.message.reply_text(mensaje, parse_mode='Markdown', reply_markup=boton)
-
-async def info(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 1:
-        await update.message.reply_text("Uso correcto:\n/info (número_cliente)")
-        return
-    numero_cliente = args[0].strip()
-    if numero_cliente not in data["clientes"]:
-        await update.message.reply_text("No se encontró información para ese número de cliente.")
-        return
+    pedido.registrar(evento)
 
-    mensajes = []
-    for compra in data["clientes"][numero_cliente]:
-        texto = f"""-- {numero_cliente} --
-- {compra['plataforma']}
-- {compra['correo']} / {compra['contraseña']}
-  - - -   {compra['fecha_vencimiento']}   - - -
-"""
-        mensajes.append(texto)
+    await pedido.responder(f"Compra cancelada y cuenta liberada para plataforma {plataforma}.")
 
-    texto_completo = "\n".join(mensajes)
-    boton = crear_boton_whatsapp(numero_cliente, texto_completo)
-    await update.message.reply_text(texto_completo, reply_markup=boton)
+@registro.comando("reservar", ARGS_RESERVAR, escribe=True)
+async def reservar(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
+    numero_cliente = a.número_cliente
+    plataforma = a.plataforma
+    minutos = a.minutos or RESERVA_MINUTOS
 
-async def renovar(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 4:
-        await update.message.reply_text("Uso correcto:\n/renovar (número_cliente) (plataforma) (correo) (fecha_vencimiento)")
+    if data.reserva_de(numero_cliente, plataforma):
+        await pedido.responder(f"El cliente {numero_cliente} ya tiene una reserva de {plataforma}.")
         return
-    numero_cliente = args[0].strip()
-    plataforma = args[1].strip()
-    correo = args[2].strip()
-    fecha_vencimiento = args[3].strip()
-
-    cuenta_actualizada = None
-    for c in data["cuentas"]:
-        if c["plataforma"].lower() == plataforma.lower() and c["correo"].lower() == correo.lower() and c["cliente"] == numero_cliente:
-            c["fecha_vencimiento"] = fecha_vencimiento
-            cuenta_actualizada = c
-            break
-
-    if not cuenta_actualizada:
-        await update.message.reply_text("No se encontró la cuenta para renovar.")
+
+    cuenta = data.primera_disponible(plataforma)
+    if not cuenta:
+        await pedido.responder("No hay cuentas disponibles para esa plataforma.")
         return
 
-    if numero_cliente in data["clientes"]:
-        for compra in data["clientes"][numero_cliente]:
-            if compra["plataforma"].lower() == plataforma.lower() and compra["correo"].lower() == correo.lower():
-                compra["fecha_vencimiento"] = fecha_vencimiento
-                break
+    expira = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(minutes=minutos)
+    data.reservar(cuenta, numero_cliente, expira)
 
-    save_data(data)
+    pedido.registrar()
 
-    mensaje = f"""- - - SERVICIO RENOVADO DE *{plataforma.upper()}* - - -
-- Correo: {correo}
-- *TOCA RENOVAR:* {fecha_vencimiento}
-/// *GRACIAS POR SU PREFERENCIA* ///
-"""
+    await pedido.responder(
+        f"Cuenta de {plataforma.upper()} reservada para {numero_cliente} hasta las {expira:%H:%M}.\n"
+        f"Confirma con /confirmarreserva o libérala con /liberarreserva."
+    )
 
-    boton = crear_boton_whatsapp(numero_cliente, mensaje)
-    await update.message.reply_text(mensaje, parse_mode='Markdown', reply_markup=boton)
-async def reemplazar(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 4:
-        await update.message.reply_text("Uso correcto:\n/reemplazar (plataforma) (correo_viejo) (correo_nuevo) (contraseña_nueva)")
-        return
-    plataforma = args[0].strip()
-    correo_viejo = args[1].strip()
-    correo_nuevo = args[2].strip()
-    contraseña_nueva = args[3].strip()
-
-    cliente_asignado = None
-    cuenta_encontrada = None
-    for c in data["cuentas"]:
-        if c["plataforma"].lower() == plataforma.lower() and c["correo"].lower() == correo_viejo.lower():
-            cliente_asignado = c["cliente"]
-            c["correo"] = correo_nuevo
-            c["contraseña"] = contraseña_nueva
-            cuenta_encontrada = c
-            break
+@registro.comando("confirmarreserva", ARGS_CONFIRMARRESERVA, escribe=True)
+async def confirmarreserva(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
+    numero_cliente = a.número_cliente
+    plataforma = a.plataforma
+    fecha_vencimiento = a.fecha_vencimiento
+    ganancia = a.ganancia
 
-    if not cuenta_encontrada:
-        await update.message.reply_text("No se encontró la cuenta para reemplazar.")
+    cuenta = data.reserva_de(numero_cliente, plataforma)
+    if not cuenta:
+        await pedido.responder("No se encontró una reserva vigente para ese cliente y plataforma.")
         return
 
-    if cliente_asignado and cliente_asignado in data["clientes"]:
-        for compra in data["clientes"][cliente_asignado]:
-            if compra["plataforma"].lower() == plataforma.lower() and compra["correo"].lower() == correo_viejo.lower():
-                compra["correo"] = correo_nuevo
-                compra["contraseña"] = contraseña_nueva
-                break
+    data.vender(cuenta, numero_cliente, fecha_vencimiento)
+    data.sumar_ganancia(plataforma, ganancia, numero_cliente)
 
-    save_data(data)
+    pedido.registrar(evento_cuenta(cuenta, ganancia=ganancia))
 
-    mensaje = f"""ACTUALIZACIÓN - *{plataforma.upper()}*
-- Correo: {correo_nuevo}
-- Contraseña: {contraseña_nueva}
+    mensaje = f"""- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
+       -- *{plataforma.upper()}* --
+correo: {cuenta.correo}
+contraseña: {boveda.descifrar(cuenta.contraseña)}
+*Toca renovar:* {formatear_fecha(fecha_vencimiento)}
 """
-    boton = crear_boton_whatsapp(cliente_asignado if cliente_asignado else '', mensaje)
-    await update.message.reply_text(mensaje, parse_mode='Markdown', reply_markup=boton)
-
-async def vencidos(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    hoy = datetime.date.today()
-    telefonos_enviados = set()
-    mensajes_enviados = 0
-    cuentas_modificadas = False
-
-    cuentas_por_cliente = {}
 
-    for c in data["cuentas"]:
-        if c["estado"] == "vendido" and c.get("fecha_vencimiento"):
-            try:
-                try:
-                    fecha_venc = datetime.datetime.strptime(c["fecha_vencimiento"], "%Y-%m-%d").date()
-                except ValueError:
-                    fecha_venc = datetime.datetime.strptime(c["fecha_vencimiento"], "%d/%m/%y").date()
-            except Exception as e:
-                logging.error(f"Error parsing fecha_vencimiento '{c['fecha_vencimiento']}': {e}")
-                continue
+    boton = crear_boton_whatsapp(numero_cliente, mensaje)
+    await pedido.responder(mensaje, parse_mode='Markdown', reply_markup=boton)
 
-            if fecha_venc <= hoy:
-                numero_cliente = c.get("cliente")
-                if not numero_cliente:
-                    logging.warning(f"Cuenta vencida sin cliente asignado: {c}")
-                    continue
+@registro.comando("liberarreserva", ARGS_LIBERARRESERVA, escribe=True)
+async def liberarreserva(pedido: Pedido):
+    a = pedido.args
+    data = pedido.data
+    numero_cliente = a.número_cliente
+    plataforma = a.plataforma
 
-                if numero_cliente not in cuentas_por_cliente:
-                    cuentas_por_cliente[numero_cliente] = []
-                cuentas_por_cliente[numero_cliente].append(c)
+    cuenta = data.reserva_de(numero_cliente, plataforma)
+    if not cuenta:
+        await pedido.responder("No se encontró una reserva vigente para ese cliente y plataforma.")
+        return
 
-                c["estado"] = "disponible"
-                c["cliente"] = None
-                c["fecha_vencimiento"] = ""
+    data.liberar(cuenta)
 
-                if numero_cliente in data["clientes"]:
-                    data["clientes"][numero_cliente] = [
-                        compra for compra in data["clientes"][numero_cliente]
-                        if not (compra["correo"].lower() == c["correo"].lower() and compra["plataforma"].lower() == c["plataforma"].lower())
-                    ]
-                    if len(data["clientes"][numero_cliente]) == 0:
-                        del data["clientes"][numero_cliente]
+    pedido.registrar()
 
-                cuentas_modificadas = True
+    await pedido.responder(f"Reserva liberada para plataforma {plataforma}.")
 
-    if cuentas_modificadas:
-        save_data(data)
+def texto_proyeccion(p):
+    if p.dias_restantes is None:
+        agota = "sin riesgo en los próximos días"
+    elif p.dias_restantes == 0:
+        agota = "*sin stock*"
+    else:
+        agota = f"se agota en ~{p.dias_restantes} día(s)"
+    return f"- {p.plataforma.capitalize()}: {p.disponibles} disponibles, {p.ventas_por_dia:.1f} ventas/día, {agota}\n"
+
+@registro.comando("stock", carga=True)
+async def stock(pedido: Pedido):
+    data = pedido.data
+    # Solo consulta: las alertas las dispara el próximo cambio y salen por avisar_stock_bajo
+    proyecciones = data.disponibilidad.proyecciones(alertar=False)
+    if not proyecciones:
+        await pedido.responder("No hay cuentas registradas aún.")
+        return
 
-    for numero_cliente, cuentas_cliente in cuentas_por_cliente.items():
-        if numero_cliente in telefonos_enviados:
-            continue
+    texto = "📦 *Disponibilidad por plataforma* 📦\n\n"
+    for p in proyecciones:
+        texto += texto_proyeccion(p)
+    await pedido.responder(texto, parse_mode="Markdown")
 
-        if len(cuentas_cliente) == 1:
-            c = cuentas_cliente[0]
-            texto_msg = (
-                f"Buen día, tu servicio de {c['plataforma']} *({c['correo']})* "
-                f"a vencido confirma renovación para evitar cortes innecesarios.\n"
-                "*METODOS DE PAGO*\n"
-                "🟣 YAPE -  926 015 496\n"
-                "      ROSALI E. FLORES\n\n"
-                "*NO COLOCAR NADA EN LA DESCRIPCIÓN DEL PAGO NO LEEMOS ESA INFORMACION.*"
-            )
-        else:
-            texto_msg = "Buen día, tus servicios streaming han vencido\n"
-            for c in cuentas_cliente:
-                texto_msg += f"- {c['correo']} ({c['plataforma']})\n"
-            texto_msg += (
-                "confirma renovación para evitar cortes innecesarios.\n"
-                "*METODOS DE PAGO*\n"
-                "🟣 YAPE -  926 015 496\n"
-                "      ROSALI E. FLORES\n\n"
-                "*NO COLOCAR NADA EN LA DESCRIPCIÓN DEL PAGO NO LEEMOS ESA INFORMACION.*"
-            )
-
-        boton = crear_boton_whatsapp(numero_cliente, texto_msg)
-        await update.message.reply_text(texto_msg, parse_mode='Markdown', reply_markup=boton)
-        telefonos_enviados.add(numero_cliente)
-        mensajes_enviados += 1
-
-    if mensajes_enviados == 0:
-        await update.message.reply_text("No hay cuentas vencidas para notificar.")
-
-async def eliminar(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 2:
-        await update.message.reply_text("Uso correcto:\n/eliminar (plataforma) (correo)")
+async def avisar_stock_bajo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Corre después de cada update (grupo 1) y envía las alertas que dejó la última operación.
+    # No pasa por la autorización: solo mira tiendas ya cargadas, nunca crea una
+    tienda = inquilinos.en_memoria(inquilino_de(update))
+    if tienda is None or tienda.data is None:
+        return
+    alertas = tienda.data.disponibilidad.tomar_alertas()
+    if not alertas:
+        return
+    chat_id = chat_de(tienda) or (update.effective_chat.id if update.effective_chat else None)
+    if not chat_id:
+        logging.warning(f"Alertas de stock sin chat de administrador: {[a.plataforma for a in alertas]}")
         return
-    plataforma = args[0].strip()
-    correo = args[1].strip()
+    texto = "⚠️ *Stock bajo* ⚠️\n\n" + "".join(texto_proyeccion(p) for p in alertas)
+    await context.bot.send_message(chat_id=chat_id, text=texto, parse_mode="Markdown")
+
+def describir_entrada(entrada):
+    return f"#{entrada['id']} {entrada['ts'].replace('T', ' ')} - {entrada['operacion']}"
+
+async def restaurar_entradas(tienda, data, entradas):
+    # Parte del estado actual y aplica las imágenes previas de la más reciente a la más antigua.
+    # `data` ya viene cargado: otro cargar() aquí podría liberar una reserva y agregar al historial
+    # una entrada nueva, que descartar() cortaría en lugar de la última deshecha
+    d = data.to_dict()
+    for entrada in entradas:
+        deshacer_en(d, entrada)
+    tienda.historial.descartar(len(entradas))
+    # Quien lee el feed revierte por su cuenta los eventos de esas operaciones
+    tienda.eventos.publicar("deshacer", {"operaciones": [e["id"] for e in entradas]})
+    await tienda.escribir(tienda.desde_dict(d))
+
+@registro.comando("historial", ARGS_HISTORIAL)
+async def historial(pedido: Pedido):
+    a = pedido.args
+    entradas = pedido.tienda.historial.ultimas(a.cantidad)
+    if not entradas:
+        await pedido.responder("No hay operaciones registradas.")
+        return
+    await pedido.responder("\n".join(describir_entrada(e) for e in entradas))
 
-    cuenta_a_eliminar = None
-    for c in data["cuentas"]:
-        if c["plataforma"].lower() == plataforma.lower() and c["correo"].lower() == correo.lower():
-            cuenta_a_eliminar = c
-            break
+@registro.comando("deshacer", ARGS_DESHACER, carga=True)
+async def deshacer(pedido: Pedido):
+    a = pedido.args
 
-    if not cuenta_a_eliminar:
-        await update.message.reply_text("No se encontró la cuenta para eliminar.")
+    tienda = pedido.tienda
+    entradas = tienda.historial.ultimas(a.cantidad)
+    if not entradas:
+        await pedido.responder("No hay operaciones para deshacer.")
         return
 
-    cliente = cuenta_a_eliminar.get("cliente")
-    fecha_venc = cuenta_a_eliminar.get("fecha_vencimiento", "")
+    await restaurar_entradas(tienda, pedido.data, entradas)
 
-    data["cuentas"].remove(cuenta_a_eliminar)
+    texto = f"Se deshicieron {len(entradas)} operación(es):\n"
+    texto += "\n".join(describir_entrada(e) for e in entradas)
+    await pedido.responder(texto)
 
-    if cliente and cliente in data["clientes"]:
-        data["clientes"][cliente] = [compra for compra in data["clientes"][cliente] if compra["correo"].lower() != correo.lower()]
-        if len(data["clientes"][cliente]) == 0:
-            del data["clientes"][cliente]
+@registro.comando("restaurar", ARGS_RESTAURAR, carga=True)
+async def restaurar(pedido: Pedido):
+    a = pedido.args
+    momento = datetime.datetime.combine(a.fecha, a.hora)
 
-    save_data(data)
+    tienda = pedido.tienda
+    entradas = tienda.historial.posteriores_a(momento)
+    if not entradas:
+        await pedido.responder(f"No hay operaciones posteriores a {momento:%d/%m/%y %H:%M}.")
+        return
+    # Si el historial no llega hasta ese momento, deshacerlo todo no deja la base como estaba entonces
+    antigua = tienda.historial.mas_antigua()
+    if antigua["ts"] > momento.isoformat(timespec="seconds"):
+        await pedido.responder(
+            f"El historial empieza el {antigua['ts'].replace('T', ' ')} (operación #{antigua['id']}); "
+            f"no alcanza para restaurar al {momento:%d/%m/%y %H:%M}.\n"
+            f"Con /deshacer {len(tienda.historial)} la base vuelve a como estaba antes de esa operación."
+        )
+        return
 
-    if cliente:
-        texto = f"""Asignar cuenta {plataforma}
-({cliente}) // ({fecha_venc})
-"""
-        boton = crear_boton_whatsapp(cliente, texto)
-        await update.message.reply_text(texto, reply_markup=boton)
-    else:
-        await update.message.reply_text("Cuenta eliminada correctamente.")
-
-async def sincronizar(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-
-    cuentas = data.get("cuentas", [])
-    clientes = data.get("clientes", {})
-
-    sincronizados = 0
-    for num_cliente, compras in list(clientes.items()):
-        nuevas_compras = []
-        for compra in compras:
-            plataforma = compra.get("plataforma", "").lower()
-            correo = compra.get("correo", "").lower()
-
-            cuenta_encontrada = None
-            for cuenta in cuentas:
-                if cuenta.get("plataforma", "").lower() == plataforma and cuenta.get("correo", "").lower() == correo:
-                    cuenta_encontrada = cuenta
-                    break
-
-            if cuenta_encontrada:
-                cuenta_encontrada["estado"] = "vendido"
-                cuenta_encontrada["cliente"] = num_cliente
-                cuenta_encontrada["fecha_vencimiento"] = compra.get("fecha_vencimiento", "")
-                sincronizados += 1
-                nuevas_compras.append(compra)
-
-        if nuevas_compras:
-            data["clientes"][num_cliente] = nuevas_compras
+    await restaurar_entradas(tienda, pedido.data, entradas)
+
+    await pedido.responder(
+        f"Base restaurada al {momento:%d/%m/%y %H:%M}. Se deshicieron {len(entradas)} operación(es)."
+    )
+
+# --- Avisos a clientes ---
+
+def programar_recordatorios(tienda, data, hoy):
+    """Encola recordatorios para las ventas que vencen en los próximos días."""
+    nuevos = 0
+    for dias in range(1, DIAS_RECORDATORIO + 1):
+        fecha = hoy + datetime.timedelta(days=dias)
+        por_cliente = {}
+        for c in data.vendidas_que_vencen(fecha):
+            if c.cliente:
+                por_cliente.setdefault(c.cliente, []).append((c.plataforma, c.correo))
+        for numero_cliente, cuentas in por_cliente.items():
+            para = fecha - datetime.timedelta(days=DIAS_RECORDATORIO)
+            if tienda.avisos.encolar(RECORDATORIO, numero_cliente, fecha, para, cuentas):
+                nuevos += 1
+    return nuevos
+
+def cuentas_vigentes(data, trabajo):
+    # Descarta lo que dejó de aplicar desde que se encoló el aviso
+    vigentes = []
+    for plataforma, correo in trabajo.cuentas:
+        cuenta = data.buscar(plataforma, correo)
+        if trabajo.tipo == RECORDATORIO:
+            if cuenta and cuenta.estado == VENDIDO and cuenta.cliente == trabajo.cliente \
+                    and cuenta.fecha_vencimiento == trabajo.fecha:
+                vigentes.append((plataforma, correo))
+        elif trabajo.tipo == SEGUIMIENTO:
+            if not (cuenta and cuenta.cliente == trabajo.cliente):
+                vigentes.append((plataforma, correo))
         else:
-            del data["clientes"][num_cliente]
-
-    save_data(data)
-    await update.message.reply_text(f"Sincronización completada. Se actualizaron {sincronizados} cuentas y se limpiaron compras inexistentes.")
-
-async def estadisticas(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    hoy = datetime.date.today()
-    dias_para_alerta = 2
-
-    ganancias = data.get("ganancias", {})
-    cuentas = data.get("cuentas", [])
-    clientes = data.get("clientes", {})
-
-    texto = "📊 *Estadísticas rápidas* 📊\n\n"
-
-    texto += "💰 *Total de ingresos por plataforma:*\n"
-    for plataforma in sorted(ganancias.keys()):
-        texto += f"- {plataforma.capitalize()}: S/. {ganancias[plataforma]:.2f}\n"
-    if not ganancias:
-        texto += "- Sin registros aún\n"
-    texto += "\n"
-
-    total_vendidas = sum(1 for c in cuentas if c["estado"] == "vendido")
-    texto += f"✅ Total cuentas vendidas: {total_vendidas}\n"
-
-    total_disponibles = sum(1 for c in cuentas if c["estado"] == "disponible")
-    texto += f"📦 Total cuentas disponibles: {total_disponibles}\n"
-
-    total_clientes = len(clientes)
-    texto += f"👥 Total clientes activos: {total_clientes}\n\n"
-
-    texto += f"⏰ *Cuentas próximas a vencer en {dias_para_alerta} días:*\n"
-    proximas = []
-    for c in cuentas:
-        if c["estado"] == "vendido" and c.get("fecha_vencimiento"):
+            vigentes.append((plataforma, correo))
+    return vigentes
+
+def teclado_pagina(trabajos):
+    filas = []
+    for t in trabajos:
+        filas.append([InlineKeyboardButton(f"📲 {t.cliente} ({t.tipo})", url=url_whatsapp(t.cliente, t.texto())),
+                      InlineKeyboardButton("✅", callback_data=f"aviso:{t.id}")])
+    return InlineKeyboardMarkup(filas)
+
+async def enviar_pendientes(bot, tienda, chat_id):
+    # Un solo envío a la vez por tienda; cada página se marca como entregada apenas sale
+    avisos = tienda.avisos
+    async with tienda.lock_envio:
+        data = await tienda.abrir()
+        trabajos = []
+        for t in avisos.pendientes(datetime.date.today()):
+            t.cuentas = cuentas_vigentes(data, t)
+            if t.cuentas:
+                trabajos.append(t)
+            else:
+                avisos.marcar(t, CANCELADO)
+
+        paginas = list(avisos.paginas(trabajos))
+        for i, pagina in enumerate(paginas, 1):
+            texto = f"📨 Avisos a clientes ({i}/{len(paginas)})\n\n"
+            for t in pagina:
+                detalle = ", ".join(f"{p} ({c})" for p, c in t.cuentas)
+                texto += f"- {t.cliente} · {t.tipo}: {detalle}\n"
             try:
-                try:
-                    fecha_venc = datetime.datetime.strptime(c["fecha_vencimiento"], "%Y-%m-%d").date()
-                except ValueError:
-                    fecha_venc = datetime.datetime.strptime(c["fecha_vencimiento"], "%d/%m/%y").date()
-                delta = (fecha_venc - hoy).days
-                if 0 <= delta <= dias_para_alerta:
-                    proximas.append((c["plataforma"], c["correo"], c["cliente"], c["fecha_vencimiento"]))
+                await bot.send_message(chat_id=chat_id, text=texto, reply_markup=teclado_pagina(pagina))
             except Exception as e:
-                logging.error(f"Error en fecha vencimiento: {e}")
-
-    if proximas:
-        for p in proximas:
-            texto += f"- {p[0].capitalize()} ({p[1]}) cliente: {p[2]} vence: {p[3]}\n"
-    else:
-        texto += "No hay cuentas próximas a vencer.\n"
-
-    await update.message.reply_text(texto, parse_mode="Markdown")
-
-async def buscarcc(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 1:
-        await update.message.reply_text("Uso correcto:\n/buscarcc (correo_o_plataforma)")
+                logging.error(f"Error enviando página de avisos: {e}")
+                break
+            for t in pagina:
+                avisos.marcar(t, ENTREGADO)
+            avisos.guardar()
+            # Pausa corta entre páginas para no chocar con el límite de Telegram
+            await asyncio.sleep(1)
+        avisos.guardar()
+        return len(trabajos)
+
+def programar_envio(context, tienda, chat_id):
+    # No bloquea el comando: las páginas salen en segundo plano. La tienda queda en uso desde ya y hasta
+    # que termine el envío; si se descargara antes, otra Tienda del mismo inquilino pisaría la cola de avisos
+    tienda.tomar()
+    tarea = context.application.create_task(enviar_pendientes(context.bot, tienda, chat_id))
+    tarea.add_done_callback(lambda _: tienda.soltar())
+
+@registro.comando("notificar", carga=True)
+async def notificar(pedido: Pedido):
+    tienda, data = pedido.tienda, pedido.data
+    hoy = datetime.date.today()
+    nuevos = programar_recordatorios(tienda, data, hoy)
+    tienda.avisos.guardar()
+    pendientes = len(tienda.avisos.pendientes(hoy))
+    if not pendientes:
+        await pedido.responder("No hay avisos pendientes para hoy.")
         return
-    consulta = args[0].strip().lower()
-
-    resultados = []
-    for c in data["cuentas"]:
-        if consulta in c["correo"].lower() or consulta in c["plataforma"].lower():
-            estado = "Vendido" if c["estado"] == "vendido" else "Disponible"
-            cliente = c["cliente"] if c["cliente"] else "Libre"
-            resultados.append(f"-- {c['plataforma'].capitalize()} --\nCorreo: {c['correo']}\nEstado: {estado}\nCliente: {cliente}\n")
-
-    if resultados:
-        await update.message.reply_text("\n".join(resultados))
-    else:
-        await update.message.reply_text("No se encontraron cuentas con ese correo o plataforma.")
-
-async def cancelarcompra(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    data = load_data()
-    args = context.args
-    if len(args) < 3:
-        await update.message.reply_text("Uso correcto:\n/cancelarcompra (número_cliente) (plataforma) (correo)")
+    await pedido.responder(f"Recordatorios nuevos: {nuevos}. Enviando {pendientes} avisos pendientes...")
+    programar_envio(pedido.context, tienda, pedido.update.effective_chat.id)
+
+@registro.boton("aviso", r"^aviso:\d+$")
+async def confirmar_aviso(pedido: Pedido):
+    query = pedido.update.callback_query
+    # Solo si la tienda sigue en memoria: un botón viejo no debe cargar (ni descargar) tiendas
+    tienda = inquilinos.en_memoria(inquilino_de(pedido.update))
+    trabajo = tienda.avisos.get(int(query.data.split(":", 1)[1])) if tienda else None
+    if not trabajo:
+        await pedido.responder("Aviso no encontrado")
         return
-    numero_cliente = args[0].strip()
-    plataforma = args[1].strip()
-    correo = args[2].strip()
-
-    cuenta = None
-    for c in data["cuentas"]:
-        if c["plataforma"].lower() == plataforma.lower() and c["correo"].lower() == correo.lower() and c["cliente"] == numero_cliente:
-            cuenta = c
-            break
-    if not cuenta:
-        await update.message.reply_text("No se encontró la compra para cancelar.")
+    tienda.avisos.marcar(trabajo, ENVIADO)
+    tienda.avisos.guardar()
+    await pedido.responder(f"Aviso a {trabajo.cliente} marcado como enviado")
+
+    filas = [[InlineKeyboardButton("✔️", callback_data=b.callback_data) if b.callback_data == query.data else b
+              for b in fila] for fila in query.message.reply_markup.inline_keyboard]
+    await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup(filas))
+
+@registro.comando("avisos")
+async def estado_avisos(pedido: Pedido):
+    resumen = pedido.tienda.avisos.resumen()
+    if not resumen:
+        await pedido.responder("No hay avisos registrados.")
         return
+    texto = "📨 *Avisos a clientes* 📨\n\n"
+    for tipo, estados in sorted(resumen.items()):
+        texto += f"- {tipo.capitalize()}: " + ", ".join(f"{n} {estado}" for estado, n in sorted(estados.items())) + "\n"
+    await pedido.responder(texto, parse_mode="Markdown")
+
+async def avisos_diarios(application):
+    # Cada día a NOTIFICAR_HORA programa los recordatorios y envía lo pendiente a cada tienda
+    while True:
+        ahora = datetime.datetime.now()
+        siguiente = ahora.replace(hour=NOTIFICAR_HORA, minute=0, second=0, microsecond=0)
+        if siguiente <= ahora:
+            siguiente += datetime.timedelta(days=1)
+        await asyncio.sleep((siguiente - ahora).total_seconds())
+        for id in inquilinos.ids():
+            try:
+                tienda = inquilinos.por_id(id)
+                if not chat_de(tienda):
+                    continue
+                with tienda.en_uso():
+                    programar_recordatorios(tienda, await tienda.abrir(), datetime.date.today())
+                    tienda.avisos.guardar()
+                    await enviar_pendientes(application.bot, tienda, chat_de(tienda))
+            except Exception as e:
+                logging.error(f"Error en avisos diarios de {id}: {e}")
+
+async def vigilar_reservas():
+    # Duerme hasta la próxima reserva por vencer (como máximo un minuto) y la libera.
+    # Solo revisa las tiendas en memoria: las demás liberan sus reservas al cargarse
+    while True:
+        espera = 60
+        for tienda in inquilinos.cargadas():
+            try:
+                proxima = (await tienda.abrir()).proxima_reserva()
+            except Exception as e:
+                logging.error(f"Error liberando reservas vencidas de {tienda.id}: {e}")
+                proxima = None
+            if proxima is not None:
+                espera = min(espera, max(1, (proxima - datetime.datetime.now()).total_seconds()))
+        await asyncio.sleep(espera)
+
+@registro.comando("arranque")
+async def ver_arranque(pedido: Pedido):
+    await pedido.responder("⏱️ Arranque del bot:\n" + arranque.texto())
+
+@registro.comando("metricas")
+async def ver_metricas(pedido: Pedido):
+    texto = "📈 Comandos desde el último arranque:\n\n"
+    for nombre, m in sorted(registro.metricas.items(), key=lambda item: -item[1].llamadas):
+        d = m.to_dict()
+        texto += f"- /{nombre}: {d['llamadas']} llamada(s), {d['errores']} error(es), p50 {d['p50_ms']} ms, p95 {d['p95_ms']} ms\n"
+    await pedido.responder(texto)
+
+async def marcar_primer_comando(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Corre antes que los handlers (grupo -1); solo deja registro la primera vez
+    if not arranque.marcada("primer comando"):
+        arranque.marcar("primer comando")
+        logging.info("Arranque:\n" + arranque.texto())
+
+# --- Integridad de cuentas y clientes ---
+
+def texto_integridad(tienda, reparadas=None):
+    anomalias = tienda.verificador.anomalias()
+    # Sin Markdown: los correos suelen traer guiones bajos
+    texto = "🩺 Integridad de la base 🩺\n\n"
+    if reparadas:
+        texto += f"Se corrigieron {reparadas} anomalía(s).\n"
+    if not anomalias:
+        return texto + "Cuentas y clientes coinciden."
+    for tipo, n in sorted(tienda.verificador.resumen().items()):
+        texto += f"- {tipo.capitalize()}: {n}\n"
+    texto += "\n" + "\n".join(a.texto() for a in anomalias[:20])
+    if len(anomalias) > 20:
+        texto += f"\n... y {len(anomalias) - 20} más"
+    return texto
+
+async def reparar_integridad(tienda, data):
+    # Si mientras se revisaba la base se recargó (p. ej. /restaurar), se deja para la próxima pasada
+    if tienda.cargar() is not data:
+        return 0
+    reparadas = tienda.verificador.reparar(data)
+    if reparadas:
+        await tienda.guardar(data, "integridad")
+        tienda.verificador.revisar_ya(data)
+    return reparadas
+
+@registro.comando("integridad", ARGS_INTEGRIDAD, carga=True)
+async def integridad(pedido: Pedido):
+    a = pedido.args
+    tienda, data = pedido.tienda, pedido.data
+    await tienda.verificador.revisar(data)
+    reparadas = await reparar_integridad(tienda, data) if a.accion == "reparar" else None
+    await pedido.responder(texto_integridad(tienda, reparadas))
+
+async def vigilar_integridad(application):
+    # Revisa solo lo que cambió desde la pasada anterior; avisa cuando aparece algo nuevo
+    while True:
+        await asyncio.sleep(INTEGRIDAD_MINUTOS * 60)
+        for tienda in inquilinos.cargadas():
+            # Mientras se revisaba otra tienda esta pudo descargarse; la que la reemplace se revisa en la próxima pasada
+            if inquilinos.en_memoria(tienda.id) is not tienda:
+                continue
+            try:
+                # La revisión va por lotes con awaits de por medio: que no se descargue a la mitad
+                with tienda.en_uso():
+                    data = await tienda.abrir()
+                    nuevas = await tienda.verificador.revisar(data)
+                    reparadas = await reparar_integridad(tienda, data) if INTEGRIDAD_REPARAR and nuevas else 0
+                    if nuevas and chat_de(tienda):
+                        await application.bot.send_message(chat_id=chat_de(tienda),
+                                                           text=texto_integridad(tienda, reparadas))
+                    elif nuevas:
+                        logging.warning(f"[{tienda.id}] Anomalías de integridad: {[a.texto() for a in nuevas]}")
+            except Exception as e:
+                logging.error(f"Error revisando integridad de {tienda.id}: {e}")
 
-    cuenta["estado"] = "disponible"
-    cuenta["cliente"] = None
-    cuenta["fecha_vencimiento"] = ""
-
-    if numero_cliente in data["clientes"]:
-        data["clientes"][numero_cliente] = [compra for compra in data["clientes"][numero_cliente]
-                                           if not (compra["plataforma"].lower() == plataforma.lower() and compra["correo"].lower() == correo.lower())]
-        if len(data["clientes"][numero_cliente]) == 0:
-            del data["clientes"][numero_cliente]
-
-    save_data(data)
+async def iniciar_tareas(application):
+    arranque.marcar("bot inicializado")
+    application.create_task(vigilar_reservas())
+    if INTEGRIDAD_MINUTOS > 0:
+        application.create_task(vigilar_integridad(application))
+    if ADMIN_CHAT_ID or MULTI_INQUILINO:
+        application.create_task(avisos_diarios(application))
 
-    await update.message.reply_text(f"Compra cancelada y cuenta liberada para plataforma {plataforma}.")
+async def guardar_al_salir(application):
+    # Los guardados programados que aún no se escribieron
+    await inquilinos.vaciar()
 
 # --- Servidor Flask para keep-alive ---
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    return jsonify(status="ok")
 
 def run_flask():
+    # Flask se importa en su propio hilo para no demorar el arranque del bot
+    from flask import Flask, abort, jsonify, request
+    app = Flask(__name__)
+
+    @app.route('/')
+    def home():
+        return jsonify(status="ok")
+
+    @app.route('/arranque')
+    def tiempos_arranque():
+        return jsonify(arranque.to_dict())
+
+    @app.route('/metricas')
+    def metricas_comandos():
+        return jsonify({nombre: m.to_dict() for nombre, m in list(registro.metricas.items())})
+
+    def feed_pedido():
+        # Sin EVENTOS_TOKEN configurado el feed no existe para afuera
+        if not EVENTOS_TOKEN or request.headers.get("Authorization") != f"Bearer {EVENTOS_TOKEN}":
+            abort(404)
+        try:
+            return eventos.abrir(inquilinos.archivo_eventos(request.args.get("tienda", PRINCIPAL)), maximo=MAX_INQUILINOS)
+        except ValueError:
+            abort(400)
+
+    def entero(nombre, defecto):
+        try:
+            return int(request.args.get(nombre, defecto))
+        except ValueError:
+            abort(400)
+
+    @app.route('/eventos')
+    def leer_eventos():
+        feed = feed_pedido()
+        lote = feed.leer(entero("desde", 0), min(entero("limite", 100), 1000))
+        return jsonify(eventos=lote, ultimo=feed.ultimo)
+
+    @app.route('/eventos/<consumidor>')
+    def eventos_pendientes(consumidor):
+        # Lo que el consumidor aún no confirmó; para avanzar, POST a .../confirmar con el último offset procesado
+        feed = feed_pedido()
+        lote = feed.pendientes(consumidor, min(entero("limite", 100), 1000))
+        return jsonify(eventos=lote, posicion=feed.posicion(consumidor), ultimo=feed.ultimo)
+
+    @app.route('/eventos/<consumidor>/confirmar', methods=['POST'])
+    def confirmar_eventos(consumidor):
+        feed = feed_pedido()
+        try:
+            feed.confirmar(consumidor, int((request.get_json(silent=True) or {}).get("offset")))
+        except (TypeError, ValueError) as e:
+            return jsonify(error=str(e)), 400
+        return jsonify(posicion=feed.posicion(consumidor))
+
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port)
 
-async def main():
+def crear_aplicacion(token, base_url=None):
+    # Los comandos de una tienda no esperan a los de otra
+    builder = ApplicationBuilder().token(token).concurrent_updates(True).post_init(iniciar_tareas) \
+        .post_shutdown(guardar_al_salir)
+    if base_url:
+        # replay.py apunta el bot a un servidor falso en vez de Telegram
+        builder = builder.base_url(base_url)
+    application = builder.build()
+
+    # Añadir todos los handlers
+    if GRABAR_UPDATES:
+        from grabacion import Grabadora
+        application.add_handler(TypeHandler(Update, Grabadora(GRABAR_UPDATES).grabar), group=-2)
+    application.add_handler(TypeHandler(Update, marcar_primer_comando), group=-1)
+    for handler in registro.handlers():
+        application.add_handler(handler)
+    application.add_handler(TypeHandler(Update, avisar_stock_bajo), group=1)
+    return application
+
+def main():
     TOKEN = os.environ.get("TOKEN")
     if not TOKEN:
         print("ERROR: La variable de entorno TOKEN no está definida")
         return
 
+    # El inventario principal se lee e indexa mientras el bot se conecta con Telegram
+    inquilinos.por_id(PRINCIPAL).precargar(arranque)
     Thread(target=run_flask).start()
 
-    application = ApplicationBuilder().token(TOKEN).build()
-
-    # Añadir todos los handlers
-    application.add_handler(CommandHandler("comandos", comandos))
-    application.add_handler(CommandHandler("basecc", basecc))
-    application.add_handler(CommandHandler("agregarcc", agregarcc))
-    application.add_handler(CommandHandler("comprarcc", comprarcc))
-    application.add_handler(CommandHandler("asignarcc", asignarcc))
-    application.add_handler(CommandHandler("info", info))
-    application.add_handler(CommandHandler("renovar", renovar))
-    application.add_handler(CommandHandler("reemplazar", reemplazar))
-    application.add_handler(CommandHandler("vencidos", vencidos))
-    application.add_handler(CommandHandler("vencidas", vencidos))  # Alias con s
-    application.add_handler(CommandHandler("eliminar", eliminar))
-    application.add_handler(CommandHandler("sincronizar", sincronizar))
-    application.add_handler(CommandHandler("estadisticas", estadisticas))
-    application.add_handler(CommandHandler("buscarcc", buscarcc))
-    application.add_handler(CommandHandler("cancelarcompra", cancelarcompra))
+    application = crear_aplicacion(TOKEN)
 
     print("Bot corriendo...")
-    await application.run_polling()
+    # run_polling gestiona su propio event loop; no se puede llamar dentro de asyncio.run
+    application.run_polling()
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    main()
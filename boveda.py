@@ -0,0 +1,251 @@
+"""Contraseñas cifradas en data.json.
+
+Con BOVEDA_CLAVE definida, las contraseñas se guardan como "enc:v1:<token>"
+(Fernet) tanto en cuentas como en las compras de los clientes y en el
+historial, y se descifran recién al mostrarlas. Sin clave todo sigue en
+texto plano, como siempre.
+
+Uso:
+    python boveda.py clave                           # genera una clave nueva
+    BOVEDA_CLAVE=... python boveda.py cifrar data.json   # cifra lo que aún está en texto plano
+    BOVEDA_CLAVE=... python boveda.py medir --datos data.json   # costo por comando
+
+`cifrar` reescribe, además de data.json, el historial.jsonl de su misma
+carpeta y los de cada inquilino (--inquilinos): el historial guarda
+imágenes previas de cuentas y compras, y /deshacer las devolvería a
+data.json en texto plano. Los ids de las operaciones no cambian, así que
+/deshacer y /restaurar siguen funcionando igual. Va con el bot detenido.
+
+Para rotar la clave se ponen varias separadas por coma: se cifra con la
+primera y se descifra con cualquiera.
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import time
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+except ImportError:
+    Fernet = None
+
+PREFIJO = "enc:v1:"
+ILEGIBLE = "🔒 (no se pudo descifrar)"
+
+
+def cifrada(valor):
+    return isinstance(valor, str) and valor.startswith(PREFIJO)
+
+
+class Boveda:
+    """Cifra y descifra contraseñas; guarda en memoria las últimas `maximo` descifradas.
+
+    Sin clave no hace nada: cifrar() devuelve el texto tal cual. Los
+    valores en texto plano (datos de antes de activar la clave) se
+    devuelven como están.
+    """
+
+    def __init__(self, clave=None, maximo=1024):
+        self.maximo = maximo
+        self._cache = collections.OrderedDict()
+        self._fernet = None
+        if clave:
+            if Fernet is None:
+                raise RuntimeError("BOVEDA_CLAVE requiere el paquete 'cryptography' (pip install cryptography)")
+            self._fernet = MultiFernet([Fernet(k.strip().encode()) for k in clave.split(",") if k.strip()])
+
+    @property
+    def activa(self):
+        return self._fernet is not None
+
+    def cifrar(self, texto):
+        if not self.activa or cifrada(texto):
+            return texto
+        valor = PREFIJO + self._fernet.encrypt(texto.encode('utf-8')).decode('ascii')
+        self._guardar(valor, texto)
+        return valor
+
+    def _guardar(self, valor, texto):
+        self._cache[valor] = texto
+        self._cache.move_to_end(valor)
+        while len(self._cache) > self.maximo:
+            self._cache.popitem(last=False)
+
+    def _abrir(self, valor):
+        if not self.activa:
+            logging.error("Hay contraseñas cifradas pero no se definió BOVEDA_CLAVE")
+            return ILEGIBLE
+        try:
+            return self._fernet.decrypt(valor[len(PREFIJO):].encode('ascii')).decode('utf-8')
+        except InvalidToken:
+            logging.error("Contraseña cifrada con una clave que no está en BOVEDA_CLAVE")
+            return ILEGIBLE
+
+    def descifrar(self, valor):
+        if not cifrada(valor):
+            return valor
+        texto = self._cache.get(valor)
+        if texto is None:
+            texto = self._abrir(valor)
+            if texto is not ILEGIBLE:
+                self._guardar(valor, texto)
+        else:
+            self._cache.move_to_end(valor)
+        return texto
+
+    def descifrar_varios(self, valores):
+        """Descifra una lista de una pasada.
+
+        Las que ya están en memoria salen de ahí. Las demás solo se guardan
+        si el lote es chico: un listado grande no debe desplazar a las
+        contraseñas que usan los comandos de todos los días.
+        """
+        valores = list(valores)
+        faltan = {v for v in valores if cifrada(v) and v not in self._cache}
+        abiertas = {v: self._abrir(v) for v in faltan}
+        if len(faltan) <= self.maximo // 4:
+            for v, texto in abiertas.items():
+                if texto is not ILEGIBLE:
+                    self._guardar(v, texto)
+        return [abiertas[v] if v in abiertas else self.descifrar(v) for v in valores]
+
+    def cifrar_datos(self, data):
+        """Cifra las contraseñas en texto plano de un data.json ya leído; devuelve cuántas cifró."""
+        registros = data.get("cuentas", []) + [c for compras in data.get("clientes", {}).values() for c in compras]
+        return self._cifrar_registros(registros)
+
+    def cifrar_entrada(self, entrada):
+        """Lo mismo para las imágenes previas de una entrada del historial."""
+        registros = [antes for _, _, antes, _ in entrada.get("cuentas", []) if antes]
+        registros += [c for _, antes in entrada.get("clientes", []) if antes for c in antes]
+        return self._cifrar_registros(registros)
+
+    def _cifrar_registros(self, registros):
+        cifradas = 0
+        for registro in registros:
+            contraseña = registro.get("contraseña")
+            if contraseña and not cifrada(contraseña):
+                registro["contraseña"] = self.cifrar(contraseña)
+                cifradas += 1
+        return cifradas
+
+
+# --- Línea de comandos ---
+
+def _reescribir(ruta, contenido):
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+
+def cifrar_archivos(boveda, data_file, historial_file):
+    """Cifra data.json y su historial.jsonl (los que existan); devuelve cuántas contraseñas cifró."""
+    cifradas = 0
+    if os.path.exists(data_file):
+        with open(data_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        n = boveda.cifrar_datos(data)
+        if n:
+            _reescribir(data_file, json.dumps(data, ensure_ascii=False, indent=4))
+        cifradas += n
+    if os.path.exists(historial_file):
+        lineas = []
+        n = 0
+        with open(historial_file, 'r', encoding='utf-8') as f:
+            for linea in f:
+                if not linea.strip():
+                    continue
+                entrada = json.loads(linea)
+                n += boveda.cifrar_entrada(entrada)
+                lineas.append(json.dumps(entrada, ensure_ascii=False) + "\n")
+        if n:
+            _reescribir(historial_file, "".join(lineas))
+        cifradas += n
+    return cifradas
+
+
+def medir(boveda, datos, repeticiones):
+    """Lo que agrega la bóveda a cada comando, con la caché fría y caliente."""
+    with open(datos, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    contraseñas = [c.get("contraseña") or "x" for c in data.get("cuentas", [])] or ["clave1234"]
+    clientes = [[c.get("contraseña") or "x" for c in compras] for compras in data.get("clientes", {}).values()] or [contraseñas[:2]]
+
+    def tiempo(funcion):
+        t = time.perf_counter()
+        for i in range(repeticiones):
+            funcion(i)
+        return (time.perf_counter() - t) / repeticiones * 1e6
+
+    cifradas = [boveda.cifrar(c) for c in contraseñas]
+    por_cliente = [[boveda.cifrar(c) for c in compras] for compras in clientes]
+
+    def frio(funcion):
+        def medida(i):
+            boveda._cache.clear()
+            funcion(i)
+        return medida
+
+    filas = [
+        ("/agregarcc (por cuenta)", tiempo(lambda i: boveda.cifrar(contraseñas[i % len(contraseñas)]))),
+        ("/comprarcc, caché fría", tiempo(frio(lambda i: boveda.descifrar(cifradas[i % len(cifradas)])))),
+        ("/comprarcc, caché caliente", tiempo(lambda i: boveda.descifrar(cifradas[i % min(len(cifradas), boveda.maximo)]))),
+        ("/info, caché fría", tiempo(frio(lambda i: boveda.descifrar_varios(por_cliente[i % len(por_cliente)])))),
+        ("/info, caché caliente", tiempo(lambda i: boveda.descifrar_varios(por_cliente[i % len(por_cliente)]))),
+    ]
+    boveda._cache.clear()
+    t = time.perf_counter()
+    boveda.descifrar_varios(cifradas)
+    todas = (time.perf_counter() - t) * 1000
+
+    print(f"Costo de la bóveda ({repeticiones} repeticiones, caché de {boveda.maximo}):")
+    for nombre, micro in filas:
+        print(f"  {nombre:<32} {micro:8.1f} µs")
+    print(f"  {f'todas las contraseñas ({len(cifradas)})':<32} {todas:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Contraseñas cifradas de data.json.")
+    sub = parser.add_subparsers(dest="accion", required=True)
+    sub.add_parser("clave", help="genera una clave para BOVEDA_CLAVE")
+    p_cifrar = sub.add_parser("cifrar", help="cifra las contraseñas que siguen en texto plano")
+    p_cifrar.add_argument("archivo", nargs="?", default="data.json")
+    p_cifrar.add_argument("--inquilinos", default="inquilinos", help="carpeta con un data.json por inquilino")
+    p_medir = sub.add_parser("medir", help="mide cuánto agrega la bóveda a cada comando")
+    p_medir.add_argument("--datos", default="data.json")
+    p_medir.add_argument("--repeticiones", type=int, default=2000)
+    args = parser.parse_args()
+
+    if Fernet is None:
+        print("Falta el paquete 'cryptography' (pip install cryptography)", file=sys.stderr)
+        return 1
+    if args.accion == "clave":
+        print(Fernet.generate_key().decode('ascii'))
+        return 0
+
+    clave = os.environ.get("BOVEDA_CLAVE")
+    if args.accion == "medir":
+        medir(Boveda(clave or Fernet.generate_key().decode('ascii')), args.datos, args.repeticiones)
+        return 0
+    if not clave:
+        print("Definí BOVEDA_CLAVE (python boveda.py clave genera una)", file=sys.stderr)
+        return 1
+    # Con el bot detenido: reescribe los archivos completos
+    boveda = Boveda(clave)
+    carpetas = [os.path.dirname(args.archivo)]
+    if os.path.isdir(args.inquilinos):
+        carpetas += [os.path.join(args.inquilinos, d) for d in sorted(os.listdir(args.inquilinos))
+                     if os.path.isdir(os.path.join(args.inquilinos, d))]
+    for i, carpeta in enumerate(carpetas):
+        data_file = args.archivo if i == 0 else os.path.join(carpeta, "data.json")
+        cifradas = cifrar_archivos(boveda, data_file, os.path.join(carpeta, "historial.jsonl"))
+        print(f"Se cifraron {cifradas} contraseñas en {data_file} y su historial")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
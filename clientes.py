@@ -0,0 +1,95 @@
+import bisect
+import collections
+import datetime
+
+MAX_RENOVACIONES = 20
+MIN_PARCIAL = 3
+
+
+class FichaCliente:
+    """Lo que un cliente hizo a lo largo del tiempo (las compras vigentes están en clientes)."""
+
+    __slots__ = ("compras", "renovadas", "ganancia", "renovaciones", "primera", "ultima")
+
+    def __init__(self, compras=0, renovadas=0, ganancia=0, renovaciones=None, primera=None, ultima=None):
+        self.compras = compras
+        self.renovadas = renovadas
+        self.ganancia = ganancia
+        # Solo las últimas MAX_RENOVACIONES: [(día, plataforma, correo, nueva fecha de vencimiento)]
+        self.renovaciones = renovaciones or []
+        self.primera = primera
+        self.ultima = ultima
+
+    @classmethod
+    def from_dict(cls, d):
+        fecha = lambda s: datetime.date.fromisoformat(s) if s else None
+        return cls(d.get("compras", 0), d.get("renovadas", 0), d.get("ganancia", 0),
+                   [(fecha(r[0]), r[1], r[2], fecha(r[3])) for r in d.get("renovaciones", [])],
+                   fecha(d.get("primera")), fecha(d.get("ultima")))
+
+    def to_dict(self):
+        iso = lambda f: f.isoformat() if f else None
+        return {"compras": self.compras, "renovadas": self.renovadas, "ganancia": self.ganancia,
+                "renovaciones": [[iso(dia), plataforma, correo, iso(fecha)]
+                                 for dia, plataforma, correo, fecha in self.renovaciones],
+                "primera": iso(self.primera), "ultima": iso(self.ultima)}
+
+    def registrar_compra(self, hoy):
+        self.compras += 1
+        self.primera = self.primera or hoy
+        self.ultima = hoy
+
+    def registrar_renovacion(self, hoy, plataforma, correo, fecha_vencimiento):
+        self.renovadas += 1
+        self.renovaciones.append((hoy, plataforma, correo, fecha_vencimiento))
+        del self.renovaciones[:-MAX_RENOVACIONES]
+        self.ultima = hoy
+
+
+class IndiceClientes:
+    """Números de cliente para buscar por terminación o por una parte del número.
+
+    Las terminaciones se buscan con bisect sobre los números invertidos y
+    ordenados; las partes sueltas, intersectando los trigramas de la
+    consulta. Solo crece: quien consulta descarta los números que ya no
+    tienen compras ni ficha.
+    """
+
+    def __init__(self):
+        self._numeros = set()
+        self._invertidos = []
+        self._trigramas = collections.defaultdict(set)
+
+    def agregar(self, numero):
+        if numero in self._numeros:
+            return
+        self._numeros.add(numero)
+        bisect.insort(self._invertidos, numero[::-1])
+        for i in range(len(numero) - 2):
+            self._trigramas[numero[i:i + 3]].add(numero)
+
+    def _por_terminacion(self, consulta):
+        prefijo = consulta[::-1]
+        i = bisect.bisect_left(self._invertidos, prefijo)
+        while i < len(self._invertidos) and self._invertidos[i].startswith(prefijo):
+            yield self._invertidos[i][::-1]
+            i += 1
+
+    def _por_parte(self, consulta):
+        conjuntos = sorted((self._trigramas.get(consulta[i:i + 3], set()) for i in range(len(consulta) - 2)), key=len)
+        candidatos = set.intersection(*conjuntos) if conjuntos else set()
+        return sorted(n for n in candidatos if consulta in n)
+
+    def buscar(self, consulta):
+        """Primero el número exacto, luego los que terminan así y luego los que lo contienen."""
+        if consulta in self._numeros:
+            yield consulta
+        vistos = {consulta}
+        parciales = [self._por_terminacion(consulta)]
+        if len(consulta) >= MIN_PARCIAL:
+            parciales.append(self._por_parte(consulta))
+        for numeros in parciales:
+            for numero in numeros:
+                if numero not in vistos:
+                    vistos.add(numero)
+                    yield numero
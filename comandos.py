@@ -0,0 +1,245 @@
+"""Registro de comandos y etapas comunes (errores, métricas, autorización, argumentos, transacción).
+
+Sobre cuándo queda cada cosa en disco: Pedido.registrar() escribe de inmediato
+la operación en historial.jsonl y su evento en eventos.jsonl, pero data.json
+se escribe hasta GUARDADO_MS después, junto con los cambios que lleguen en
+esa ventana. Si el proceso muere ahí (no al apagarse normal, que escribe lo
+pendiente), el historial y el feed pueden tener operaciones que data.json no
+alcanzó a guardar: quien lea /eventos vería ventas que al reiniciar no están.
+Es el precio de no escribir el archivo completo en cada venta; con
+GUARDADO_MS=0 la ventana es solo lo que tarda la escritura.
+"""
+import collections
+import logging
+import time
+
+from telegram.ext import CallbackQueryHandler, CommandHandler
+
+from argumentos import ErrorArgumentos
+
+# Telegram no acepta mensajes más largos
+LIMITE_MENSAJE = 4096
+# Ni avisos de botón (answerCallbackQuery) de más de esto
+LIMITE_AVISO = 200
+
+
+def partir(texto, limite=LIMITE_MENSAJE):
+    """Parte un texto largo en trozos de hasta `limite` caracteres, de preferencia entre líneas."""
+    trozos = []
+    while len(texto) > limite:
+        corte = texto.rfind("\n", 0, limite)
+        if corte <= 0:
+            corte = limite
+        trozos.append(texto[:corte])
+        texto = texto[corte:].lstrip("\n")
+    trozos.append(texto)
+    return trozos
+
+
+class Comando:
+    __slots__ = ("nombre", "funcion", "esquema", "alias", "carga", "escribe", "patron")
+
+    def __init__(self, nombre, funcion, esquema=None, alias=(), carga=False, escribe=False, patron=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.esquema = esquema
+        self.alias = alias
+        # carga: necesita el inventario; escribe: puede cambiarlo (solo entonces se guarda)
+        self.carga = carga or escribe
+        self.escribe = escribe
+        # Solo los botones: callback_data que atienden (ver Registro.boton)
+        self.patron = patron
+
+
+class Pedido:
+    """Lo que recibe un comando: el update, sus argumentos ya validados y la tienda."""
+
+    def __init__(self, comando, update, context):
+        self.comando = comando
+        self.update = update
+        self.context = context
+        self.args = None
+        self.tienda = None
+        self.data = None
+        # Segundos que espera el guardado para juntar cambios (lo fija la etapa transaccion)
+        self.espera = 0.2
+
+    async def responder(self, texto, reply_markup=None, **kwargs):
+        if self.update.callback_query is not None:
+            # Se apretó un botón: la respuesta es el aviso corto que Telegram muestra sobre el chat
+            await self.update.callback_query.answer(texto[:LIMITE_AVISO])
+            return
+        # Los botones van con el último trozo
+        trozos = partir(texto)
+        for i, trozo in enumerate(trozos, 1):
+            await self.update.message.reply_text(trozo, reply_markup=reply_markup if i == len(trozos) else None,
+                                                 **kwargs)
+
+    def registrar(self, evento=None):
+        """Cierra la operación en el historial (y el feed de eventos) y programa el guardado.
+
+        Va apenas se hizo el cambio, antes de cualquier await: así otro comando
+        sobre la misma tienda no mezcla sus cambios con los de este, y con el
+        guardado pendiente la tienda no se descarga de memoria hasta escribirse.
+        """
+        if not self.comando.escribe:
+            raise RuntimeError(f"/{self.comando.nombre} no está registrado como comando que escribe")
+        self.tienda.registrar(self.data, self.comando.nombre, evento)
+        self.tienda.programar_guardado(self.data, self.espera)
+
+
+class Metrica:
+    __slots__ = ("llamadas", "errores", "tiempos")
+
+    def __init__(self, muestras=500):
+        self.llamadas = 0
+        self.errores = 0
+        self.tiempos = collections.deque(maxlen=muestras)
+
+    def percentil(self, p):
+        ordenados = sorted(self.tiempos)
+        return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))] if ordenados else 0.0
+
+    def to_dict(self):
+        return {"llamadas": self.llamadas, "errores": self.errores,
+                "p50_ms": round(self.percentil(50) * 1000, 1), "p95_ms": round(self.percentil(95) * 1000, 1)}
+
+
+class Registro:
+    """Comandos del bot y las etapas por las que pasa cada uno.
+
+    Cada etapa es `async def etapa(pedido, siguiente)` y decide si sigue
+    (await siguiente()) o corta ahí; la última llama al comando. Así la
+    autorización, los argumentos, la carga y el guardado de la tienda se
+    escriben una vez y no en cada handler.
+    """
+
+    def __init__(self):
+        self.etapas = []
+        self.comandos = {}
+        self.metricas = collections.defaultdict(Metrica)
+
+    def usar(self, *etapas):
+        self.etapas.extend(etapas)
+
+    def comando(self, nombre, esquema=None, alias=(), carga=False, escribe=False):
+        def registrar(funcion):
+            self.comandos[nombre] = Comando(nombre, funcion, esquema, alias, carga, escribe)
+            return funcion
+        return registrar
+
+    async def ejecutar(self, comando, update, context):
+        pedido = Pedido(comando, update, context)
+
+        async def paso(i):
+            if i == len(self.etapas):
+                await comando.funcion(pedido)
+            else:
+                await self.etapas[i](pedido, lambda: paso(i + 1))
+
+        await paso(0)
+
+    def boton(self, nombre, patron):
+        """Como comando(), para los botones cuyo callback_data calza con `patron`.
+
+        Pasan por las mismas etapas (errores, métricas, autorización), pero
+        no cargan la tienda: responden a un mensaje que ya se envió y la
+        buscan ellos en memoria.
+        """
+        def registrar(funcion):
+            self.comandos[nombre] = Comando(nombre, funcion, patron=patron)
+            return funcion
+        return registrar
+
+    def handlers(self):
+        for comando in self.comandos.values():
+            async def callback(update, context, comando=comando):
+                await self.ejecutar(comando, update, context)
+            if comando.patron is not None:
+                yield CallbackQueryHandler(callback, pattern=comando.patron)
+            else:
+                yield CommandHandler([comando.nombre, *comando.alias], callback)
+
+
+# --- Etapas ---
+
+def errores():
+    async def etapa(pedido, siguiente):
+        try:
+            await siguiente()
+        except Exception:
+            try:
+                await pedido.responder("⚠️ Ocurrió un error procesando el comando. Revisa los datos e inténtalo de nuevo.")
+            except Exception:
+                pass
+            # Sigue hasta el manejador de errores de la Application, que lo registra
+            raise
+    return etapa
+
+
+def autorizacion(permitidos):
+    """Solo los usuarios de `permitidos`; sin lista, cualquiera (como siempre)."""
+    permitidos = {str(p) for p in permitidos}
+
+    async def etapa(pedido, siguiente):
+        usuario = pedido.update.effective_user
+        if permitidos and (usuario is None or str(usuario.id) not in permitidos):
+            logging.warning(f"/{pedido.comando.nombre} rechazado para el usuario {usuario.id if usuario else '?'}")
+            await pedido.responder("⛔ No tienes permiso para usar este bot.")
+            return
+        await siguiente()
+    return etapa
+
+
+def metricas(registro, lento=1.0):
+    """Llamadas, errores y tiempos por comando; avisa en el log de los que tardan más de `lento` segundos."""
+    async def etapa(pedido, siguiente):
+        metrica = registro.metricas[pedido.comando.nombre]
+        metrica.llamadas += 1
+        inicio = time.perf_counter()
+        try:
+            await siguiente()
+        except Exception:
+            metrica.errores += 1
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio
+            metrica.tiempos.append(segundos)
+            if segundos > lento:
+                logging.warning(f"/{pedido.comando.nombre} tardó {segundos:.2f}s")
+    return etapa
+
+
+def argumentos():
+    async def etapa(pedido, siguiente):
+        if pedido.comando.esquema is not None:
+            try:
+                pedido.args = pedido.comando.esquema.parse(pedido.context.args)
+            except ErrorArgumentos as e:
+                await pedido.responder(e.mensaje)
+                return
+        await siguiente()
+    return etapa
+
+
+def transaccion(tienda_de, espera=0.2):
+    """Carga la tienda antes del comando y la deja en uso hasta que termina.
+
+    En uso no se descarga de memoria (p. ej. mientras sale la respuesta), así
+    el siguiente comando del inquilino no arma otra Tienda desde un archivo
+    atrasado. Los comandos de solo lectura nunca escriben el archivo; los
+    cambios que llegan dentro de `espera` segundos comparten una escritura
+    (ver Pedido.registrar).
+    """
+    async def etapa(pedido, siguiente):
+        if pedido.comando.patron is not None:
+            # Un botón no crea ni carga una tienda (ver Registro.boton)
+            await siguiente()
+            return
+        pedido.tienda = tienda_de(pedido.update)
+        pedido.espera = espera
+        with pedido.tienda.en_uso():
+            if pedido.comando.carga:
+                pedido.data = await pedido.tienda.abrir()
+            await siguiente()
+    return etapa
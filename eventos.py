@@ -0,0 +1,143 @@
+import collections
+import datetime
+import json
+import logging
+import os
+import threading
+
+_abiertos = collections.OrderedDict()
+_lock_abiertos = threading.Lock()
+
+
+def abrir(ruta, maximo=10):
+    """Feed de `ruta` para el servidor web, que corre en otro hilo.
+
+    Guarda como máximo `maximo` abiertos y descarta el que lleva más tiempo
+    sin pedirse. Cada Tienda tiene su propio Feed, que vive lo que ella; los
+    dos leen lo que el otro agregó al archivo (ver Feed._indexar).
+    """
+    ruta = os.path.abspath(ruta)
+    with _lock_abiertos:
+        feed = _abiertos.get(ruta)
+        if feed is None:
+            feed = _abiertos[ruta] = Feed(ruta)
+        _abiertos.move_to_end(ruta)
+        while len(_abiertos) > maximo:
+            _abiertos.popitem(last=False)
+        return feed
+
+
+class Feed:
+    """Eventos de cambios del inventario en JSONL, solo se agregan al final.
+
+    Cada evento lleva un offset correlativo (1, 2, 3...) y se guarda en
+    memoria dónde empieza cada línea, así leer desde un offset va directo
+    a esa posición del archivo sin recorrerlo. Los consumidores (planilla,
+    tablero) guardan hasta qué offset procesaron con confirmar() y piden
+    solo lo nuevo con pendientes().
+    """
+
+    def __init__(self, ruta):
+        self.ruta = os.path.abspath(ruta)
+        self.ruta_cursores = os.path.splitext(self.ruta)[0] + ".cursores.json"
+        self._posiciones = []
+        self._primero = 1
+        # Hasta qué byte del archivo está indexado
+        self._fin = 0
+        self._lock = threading.Lock()
+        self._indexar()
+        self._cursores = self._cargar_cursores()
+
+    def _indexar(self):
+        """Agrega las posiciones de las líneas escritas desde la última vez, por este u otro Feed del archivo."""
+        try:
+            tamaño = os.path.getsize(self.ruta)
+        except FileNotFoundError:
+            return
+        if tamaño < self._fin:
+            # Archivo reemplazado por uno más corto: se indexa de nuevo
+            self._posiciones, self._primero, self._fin = [], 1, 0
+        if tamaño == self._fin:
+            return
+        with open(self.ruta, 'rb') as f:
+            f.seek(self._fin)
+            posicion = self._fin
+            for linea in f:
+                if not linea.endswith(b"\n"):
+                    # Línea a medio escribir: se indexa la próxima vez
+                    break
+                if linea.strip():
+                    if not self._posiciones:
+                        try:
+                            self._primero = json.loads(linea)["offset"]
+                        except (json.JSONDecodeError, KeyError):
+                            logging.error(f"Primera línea de {self.ruta} ilegible")
+                    self._posiciones.append(posicion)
+                posicion += len(linea)
+        self._fin = posicion
+
+    def _cargar_cursores(self):
+        try:
+            with open(self.ruta_cursores, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            logging.error(f"{self.ruta_cursores} ilegible; los consumidores vuelven a empezar")
+            return {}
+
+    @property
+    def ultimo(self):
+        """Offset del último evento (0 si todavía no hay ninguno)."""
+        return self._primero + len(self._posiciones) - 1
+
+    def publicar(self, tipo, datos, operacion=None):
+        with self._lock:
+            self._indexar()
+            evento = {"offset": self.ultimo + 1,
+                      "ts": datetime.datetime.now().isoformat(timespec="seconds"),
+                      "tipo": tipo,
+                      "operacion": operacion}
+            evento.update(datos)
+            linea = (json.dumps(evento, ensure_ascii=False) + "\n").encode('utf-8')
+            if not self._posiciones:
+                os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            with open(self.ruta, 'ab') as f:
+                self._posiciones.append(f.tell())
+                f.write(linea)
+                self._fin = f.tell()
+        return evento
+
+    def leer(self, desde=0, limite=100):
+        """Hasta `limite` eventos posteriores al offset `desde`, en orden."""
+        with self._lock:
+            self._indexar()
+            i = max(desde + 1 - self._primero, 0)
+            if i >= len(self._posiciones) or limite <= 0:
+                return []
+            fin = self._posiciones[i + limite] if i + limite < len(self._posiciones) else self._fin
+            with open(self.ruta, 'rb') as f:
+                f.seek(self._posiciones[i])
+                bloque = f.read(fin - self._posiciones[i])
+        return [json.loads(linea) for linea in bloque.splitlines() if linea.strip()]
+
+    # --- Cursores de los consumidores ---
+
+    def posicion(self, consumidor):
+        return self._cursores.get(consumidor, 0)
+
+    def pendientes(self, consumidor, limite=100):
+        return self.leer(self.posicion(consumidor), limite)
+
+    def confirmar(self, consumidor, offset):
+        """Marca como procesado hasta `offset` inclusive (también sirve para volver atrás)."""
+        with self._lock:
+            self._indexar()
+            if not 0 <= offset <= self.ultimo:
+                raise ValueError(f"offset fuera de rango (0 a {self.ultimo})")
+            self._cursores[consumidor] = offset
+            os.makedirs(os.path.dirname(self.ruta_cursores), exist_ok=True)
+            tmp = self.ruta_cursores + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._cursores, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.ruta_cursores)
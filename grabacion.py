@@ -0,0 +1,90 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import time
+
+_RE_CORREO = re.compile(r"[^@\s/]+@[^@\s/]+\.[^@\s/]+")
+# Números con o sin separadores ("987654321", "+51 987 654 321"), sin tocar fechas como 30/12/26
+_RE_TELEFONO = re.compile(r"(?<![\w-])(?<!\d/)\+?\d{1,4}(?:[ .-]?\d{3,})+(?![\w/-])")
+_CAMPOS_NOMBRE = ("first_name", "last_name", "username", "title")
+_CAMPOS_PERSONA = ("from", "chat", "user", "sender_chat")
+_CAMPOS_TEXTO = ("text", "data", "url", "caption")
+
+
+class Grabadora:
+    """Guarda en JSONL los updates que recibe el bot, sin datos personales.
+
+    Correos, teléfonos, contraseñas, nombres e ids se reemplazan por
+    seudónimos estables durante la grabación (el mismo cliente siempre da
+    el mismo seudónimo), así replay.py reproduce el mismo tráfico sin
+    exponer a nadie. La sal es aleatoria y no se guarda.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._sal = os.urandom(16)
+
+    def _hash(self, valor):
+        return hmac.new(self._sal, str(valor).encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _telefono(self, valor):
+        # Se reemplaza dígito por dígito y se conservan los separadores
+        digitos = re.sub(r"\D", "", valor)
+        if not 6 <= len(digitos) <= 15:
+            return valor
+        h = int(self._hash(digitos), 16)
+        nuevos = iter(str((h >> (4 * i)) % 10) for i in range(len(digitos)))
+        return re.sub(r"\d", lambda m: next(nuevos), valor)
+
+    def _id(self, valor):
+        seudonimo = int(self._hash(valor)[:12], 16) % 10 ** 10 + 1
+        return -seudonimo if valor < 0 else seudonimo
+
+    def _clave(self, palabra):
+        return f"clave{self._hash(palabra)[:6]}" if palabra else palabra
+
+    def limpiar_texto(self, texto):
+        texto = _RE_CORREO.sub(lambda m: f"u{self._hash(m.group().lower())[:10]}@ejemplo.com", texto)
+        texto = _RE_TELEFONO.sub(lambda m: self._telefono(m.group()), texto)
+        palabras = texto.split(" ")
+        comando = palabras[0].split("@")[0]
+        if comando == "/agregarcc":
+            # (plataforma) (correo contraseña) / (correo contraseña) / ...: tras cada correo va su contraseña
+            tras_correo = False
+            for i, palabra in enumerate(palabras):
+                if palabra == "/":
+                    tras_correo = False
+                elif tras_correo:
+                    palabras[i] = self._clave(palabra)
+                elif palabra.endswith("@ejemplo.com"):
+                    tras_correo = True
+        elif comando == "/reemplazar" and len(palabras) > 4:
+            palabras[4:] = [self._clave(p) for p in palabras[4:]]
+        return " ".join(palabras)
+
+    def limpiar(self, valor, campo=None):
+        if isinstance(valor, dict):
+            limpio = {}
+            for k, v in valor.items():
+                if k in _CAMPOS_NOMBRE:
+                    limpio[k] = "x"
+                elif k == "id" and campo in _CAMPOS_PERSONA and isinstance(v, int):
+                    limpio[k] = self._id(v)
+                elif k == "entities":
+                    # Solo importa el comando; los demás rangos apuntan a texto que cambió de largo
+                    limpio[k] = [e for e in v if e.get("type") == "bot_command" and e.get("offset") == 0]
+                else:
+                    limpio[k] = self.limpiar(v, k)
+            return limpio
+        if isinstance(valor, list):
+            return [self.limpiar(v, campo) for v in valor]
+        if isinstance(valor, str) and campo in _CAMPOS_TEXTO:
+            return self.limpiar_texto(valor)
+        return valor
+
+    async def grabar(self, update, context):
+        linea = json.dumps({"t": time.time(), "update": self.limpiar(update.to_dict())}, ensure_ascii=False)
+        with open(self.ruta, 'a', encoding='utf-8') as f:
+            f.write(linea + "\n")
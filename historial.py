@@ -0,0 +1,154 @@
+import datetime
+import json
+import logging
+import os
+
+
+def _clave(d):
+    return (d.get("plataforma", "").lower(), d.get("correo", "").lower())
+
+
+def deshacer_en(data, entrada):
+    """Aplica sobre data (formato de data.json) las imágenes previas de una entrada."""
+    cuentas = data["cuentas"]
+    for plataforma, correo, antes, indice in entrada.get("cuentas", []):
+        clave = (plataforma, correo)
+        pos = next((i for i, d in enumerate(cuentas) if _clave(d) == clave), None)
+        if antes is None:
+            if pos is not None:
+                del cuentas[pos]
+        elif pos is not None:
+            cuentas[pos] = antes
+        else:
+            cuentas.insert(min(indice, len(cuentas)), antes)
+
+    clientes = data["clientes"]
+    for numero, antes in entrada.get("clientes", []):
+        if antes is None:
+            clientes.pop(numero, None)
+        else:
+            clientes[numero] = antes
+
+    fichas = data.setdefault("fichas", {})
+    for numero, antes in entrada.get("fichas", []):
+        if antes is None:
+            fichas.pop(numero, None)
+        else:
+            fichas[numero] = antes
+
+    if "ganancias" in entrada:
+        data["ganancias"] = entrada["ganancias"]
+
+    ventas = data.get("ventas", {})
+    for plataforma, momento in entrada.get("ventas", []):
+        if momento in ventas.get(plataforma, []):
+            ventas[plataforma].remove(momento)
+            if not ventas[plataforma]:
+                del ventas[plataforma]
+    if "ventas" in data and not data["ventas"]:
+        del data["ventas"]
+
+
+class Historial:
+    """Registro de operaciones en JSONL con solo lo que cada una cambió.
+
+    Cada línea guarda la imagen previa de las cuentas, clientes y ganancias
+    que tocó una operación (nada más) y las ventas que agregó, así deshacer
+    es aplicar esas imágenes en orden inverso y quitar las líneas del final
+    del archivo. Se conservan como máximo `maximo` operaciones.
+    """
+
+    def __init__(self, ruta, maximo=500):
+        self.ruta = ruta
+        self.maximo = maximo
+        self._offsets = []
+        self._siguiente_id = 1
+        self._cargar_offsets()
+
+    def _cargar_offsets(self):
+        self._offsets = []
+        if not os.path.exists(self.ruta):
+            return
+        ultima = None
+        with open(self.ruta, 'rb') as f:
+            offset = 0
+            for linea in f:
+                if linea.strip():
+                    self._offsets.append(offset)
+                    ultima = linea
+                offset += len(linea)
+        if ultima:
+            try:
+                self._siguiente_id = json.loads(ultima)["id"] + 1
+            except (json.JSONDecodeError, KeyError):
+                logging.error(f"Última línea de {self.ruta} ilegible")
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def registrar(self, operacion, cambios):
+        entrada = {"id": self._siguiente_id,
+                   "ts": datetime.datetime.now().isoformat(timespec="seconds"),
+                   "operacion": operacion}
+        entrada.update(cambios)
+        linea = (json.dumps(entrada, ensure_ascii=False) + "\n").encode('utf-8')
+        if not self._offsets:
+            # La carpeta de un inquilino se crea recién con su primera escritura
+            os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with open(self.ruta, 'ab') as f:
+            self._offsets.append(f.tell())
+            f.write(linea)
+        self._siguiente_id += 1
+        if len(self._offsets) > self.maximo:
+            self._recortar()
+        return entrada
+
+    def _recortar(self):
+        # Descarta la mitad más antigua de una vez para no reescribir en cada operación
+        desde = self._offsets[len(self._offsets) - self.maximo // 2]
+        with open(self.ruta, 'rb') as f:
+            f.seek(desde)
+            resto = f.read()
+        tmp = self.ruta + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(resto)
+        os.replace(tmp, self.ruta)
+        self._cargar_offsets()
+
+    def ultimas(self, n):
+        """Devuelve las últimas n entradas, la más reciente primero."""
+        if not self._offsets or n <= 0:
+            return []
+        desde = self._offsets[-min(n, len(self._offsets))]
+        with open(self.ruta, 'rb') as f:
+            f.seek(desde)
+            entradas = [json.loads(linea) for linea in f if linea.strip()]
+        return list(reversed(entradas))
+
+    def mas_antigua(self):
+        """La entrada más vieja que se conserva (las anteriores se descartaron al recortar), o None."""
+        if not self._offsets:
+            return None
+        with open(self.ruta, 'rb') as f:
+            f.seek(self._offsets[0])
+            return json.loads(f.readline())
+
+    def posteriores_a(self, momento):
+        """Entradas registradas después de `momento`, la más reciente primero."""
+        limite = momento.isoformat(timespec="seconds")
+        entradas = []
+        for entrada in self.ultimas(len(self._offsets)):
+            if entrada["ts"] <= limite:
+                break
+            entradas.append(entrada)
+        return entradas
+
+    def descartar(self, n):
+        """Quita las últimas n entradas del archivo (ya deshechas)."""
+        n = min(n, len(self._offsets))
+        if n <= 0:
+            return
+        corte = self._offsets[-n]
+        with open(self.ruta, 'r+b') as f:
+            f.truncate(corte)
+        del self._offsets[-n:]
@@ -0,0 +1,284 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import logging
+import os
+import re
+
+import eventos
+from asignacion import PRIMERA
+from historial import Historial
+from integridad import Verificador
+from modelos import Inventario
+from notificaciones import Notificaciones
+
+PRINCIPAL = "principal"
+
+
+class Tienda:
+    """Inventario, historial y avisos de un inquilino (un revendedor).
+
+    El inventario queda en memoria mientras su data.json no cambie por fuera
+    del bot. La lectura (abrir) y la escritura del archivo se hacen en un
+    hilo aparte para que un inventario grande no frene los comandos de
+    otros inquilinos; al guardar, en el loop solo se toma la foto, que
+    reutiliza lo que no cambió (ver Inventario.to_dict). Quien la use a lo
+    largo de varios awaits (un comando, un envío de avisos) la toma con
+    en_uso() para que no se descargue mientras tanto.
+    """
+
+    def __init__(self, id, data_file, historial_file, notificaciones_file, eventos_file, alerta_dias=3,
+                 asignacion=PRIMERA):
+        self.id = id
+        self.data_file = data_file
+        self.historial = Historial(historial_file)
+        self.avisos = Notificaciones(notificaciones_file)
+        # Propio de la tienda: se libera con ella cuando se descarga de memoria
+        self.eventos = eventos.Feed(eventos_file)
+        self.verificador = Verificador()
+        self.alerta_dias = alerta_dias
+        self.asignacion = asignacion
+        self.data = None
+        self._mtime = None
+        self._precarga = None
+        self._escrituras = 0
+        self._usos = 0
+        # Guardado programado que todavía no empezó (ver programar_guardado)
+        self._guardado = None
+        self._lock_escritura = asyncio.Lock()
+        self._lock_carga = asyncio.Lock()
+        self.lock_envio = asyncio.Lock()
+
+    @property
+    def escribiendo(self):
+        # Con una escritura en curso o por hacer, el archivo está atrasado; lo de memoria es lo más nuevo
+        return self._escrituras > 0 or self._guardado is not None or self._lock_escritura.locked()
+
+    @property
+    def ocupada(self):
+        return self._usos > 0 or self.escribiendo
+
+    def tomar(self):
+        self._usos += 1
+
+    def soltar(self):
+        self._usos -= 1
+
+    @contextlib.contextmanager
+    def en_uso(self):
+        self.tomar()
+        try:
+            yield self
+        finally:
+            self.soltar()
+
+    def _mtime_data(self):
+        try:
+            return os.stat(self.data_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _leer(self, linea=None):
+        mtime = self._mtime_data()
+        try:
+            with open(self.data_file, 'r', encoding='utf-8') as f:
+                crudo = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            crudo = None
+        if linea:
+            linea.marcar(f"carga {self.id}")
+        data = self.desde_dict(crudo or {})
+        if linea:
+            linea.marcar(f"índice {self.id}")
+        return mtime, data
+
+    def desde_dict(self, d):
+        return Inventario.from_dict(d, alerta_dias=self.alerta_dias, asignacion=self.asignacion)
+
+    def precargar(self, linea=None):
+        """Lee e indexa el inventario en otro hilo; cargar() lo espera si aún no terminó."""
+        if self.data is None and self._precarga is None:
+            hilo = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"precarga-{self.id}")
+            self._precarga = hilo.submit(self._leer, linea)
+            hilo.shutdown(wait=False)
+
+    def _desactualizada(self):
+        return self.data is None or (not self.escribiendo and self._mtime != self._mtime_data())
+
+    async def abrir(self):
+        """Como cargar(), pero si hay que leer el archivo lo lee e indexa en otro hilo."""
+        with self.en_uso():
+            async with self._lock_carga:
+                if self._precarga is not None:
+                    self._mtime, self.data = await asyncio.wrap_future(self._precarga)
+                    self._precarga = None
+                elif self._desactualizada():
+                    mtime, data = await asyncio.to_thread(self._leer)
+                    # Si mientras tanto se cambió lo de memoria, eso es lo más nuevo
+                    if self.data is None or not self.escribiendo:
+                        self._mtime, self.data = mtime, data
+            return self.cargar()
+
+    def cargar(self):
+        """Deja el inventario listo para una operación; lee el archivo aquí mismo si no se usó abrir()."""
+        if self._precarga is not None:
+            self._mtime, self.data = self._precarga.result()
+            self._precarga = None
+        if self._desactualizada():
+            self._mtime, self.data = self._leer()
+
+        data = self.data
+        data.iniciar_operacion()
+        liberadas = data.expirar_reservas(datetime.datetime.now())
+        if liberadas:
+            logging.info(f"[{self.id}] Reservas vencidas liberadas: {[c.correo for c in liberadas]}")
+            self.registrar(data, "reservas vencidas")
+            self.programar_guardado(data)
+        # Lo que cambie desde aquí hasta el próximo guardar queda como una operación del historial
+        data.iniciar_operacion()
+        return data
+
+    def registrar(self, data, operacion, evento=None):
+        cambios = data.terminar_operacion()
+        entrada = self.historial.registrar(operacion, cambios) if cambios else None
+        if evento is not None:
+            # Se publica junto con el historial: el id de la operación permite seguir un /deshacer
+            self.eventos.publicar(operacion, evento, entrada["id"] if entrada else None)
+        return entrada
+
+    async def guardar(self, data, operacion, evento=None):
+        self.registrar(data, operacion, evento)
+        await self.escribir(data)
+
+    async def escribir(self, data):
+        # La foto se toma ahora (sin awaits de por medio) y el JSON se arma y escribe en otro hilo
+        foto = data.to_dict()
+        self.data = data
+        self._escrituras += 1
+        try:
+            async with self._lock_escritura:
+                await asyncio.to_thread(self._escribir_archivo, foto)
+                self._mtime = self._mtime_data()
+        finally:
+            self._escrituras -= 1
+
+    def programar_guardado(self, data, espera=0.2):
+        """Escribe el archivo dentro de `espera` segundos; los cambios que lleguen antes van en la misma escritura."""
+        self.data = data
+        if self._guardado is not None:
+            return
+        try:
+            self._guardado = asyncio.get_running_loop().create_task(self._guardar_luego(espera))
+        except RuntimeError:
+            self._escribir_archivo(data.to_dict())
+            self._mtime = self._mtime_data()
+
+    async def _guardar_luego(self, espera):
+        try:
+            await asyncio.sleep(espera)
+        finally:
+            if self._guardado is asyncio.current_task():
+                self._guardado = None
+        # Se guarda lo último que haya en memoria, con todos los cambios acumulados
+        await self.escribir(self.data)
+
+    async def vaciar(self):
+        """Escribe ya el guardado programado, si hay uno (p. ej. al apagar el bot)."""
+        if self._guardado is not None:
+            self._guardado.cancel()
+            self._guardado = None
+            await self.escribir(self.data)
+
+    def _escribir_archivo(self, foto):
+        if self._mtime is None:
+            # Primera vez que se guarda: la carpeta del inquilino puede no existir todavía
+            os.makedirs(os.path.dirname(self.data_file) or ".", exist_ok=True)
+        tmp = self.data_file + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(foto, f, ensure_ascii=False, indent=4)
+        os.replace(tmp, self.data_file)
+
+
+class Inquilinos:
+    """Tiendas por chat (o usuario), cargadas al primer uso.
+
+    Se guardan como máximo `maximo` en memoria; al pasarse se descarta la
+    que lleva más tiempo sin usarse y no está ocupada (en uso o con algo por
+    escribir), así nunca hay dos Tienda del mismo inquilino a la vez. La
+    carpeta de un inquilino se crea con su primera escritura, no al verlo.
+    """
+
+    def __init__(self, carpeta, principal, maximo=10, alerta_dias=3, ids_principales=(), multi=False,
+                 asignacion=PRIMERA):
+        self.carpeta = carpeta
+        # (data_file, historial_file, notificaciones_file, eventos_file) del inquilino principal
+        self.principal = principal
+        self.maximo = maximo
+        self.alerta_dias = alerta_dias
+        self.ids_principales = {str(i) for i in ids_principales}
+        self.multi = multi
+        self.asignacion = asignacion
+        self._tiendas = collections.OrderedDict()
+
+    def id_de(self, chat_id):
+        chat_id = str(chat_id)
+        if not self.multi or chat_id in self.ids_principales:
+            return PRINCIPAL
+        return chat_id
+
+    def de(self, chat_id):
+        return self.por_id(self.id_de(chat_id))
+
+    def por_id(self, id):
+        tienda = self._tiendas.get(id)
+        if tienda is not None:
+            self._tiendas.move_to_end(id)
+            return tienda
+
+        if id == PRINCIPAL:
+            tienda = Tienda(id, *self.principal, alerta_dias=self.alerta_dias, asignacion=self.asignacion)
+        else:
+            carpeta = os.path.join(self.carpeta, id)
+            tienda = Tienda(id, os.path.join(carpeta, "data.json"), os.path.join(carpeta, "historial.jsonl"),
+                            os.path.join(carpeta, "notificaciones.json"), self.archivo_eventos(id),
+                            alerta_dias=self.alerta_dias, asignacion=self.asignacion)
+        self._tiendas[id] = tienda
+        self._desalojar()
+        return tienda
+
+    def en_memoria(self, id):
+        """La tienda de `id` solo si ya está cargada; no la crea ni la marca como usada."""
+        return self._tiendas.get(id)
+
+    def archivo_eventos(self, id):
+        """Ruta del feed de eventos de un inquilino, sin cargar su tienda (la usa el servidor web)."""
+        if id == PRINCIPAL:
+            return self.principal[3]
+        if not re.fullmatch(r"-?\d+", id):
+            raise ValueError(f"Inquilino inválido: '{id}'")
+        return os.path.join(self.carpeta, id, "eventos.jsonl")
+
+    def _desalojar(self):
+        for id in list(self._tiendas):
+            if len(self._tiendas) <= self.maximo:
+                break
+            if not self._tiendas[id].ocupada:
+                logging.info(f"Inquilino {id} descargado de memoria")
+                del self._tiendas[id]
+
+    async def vaciar(self):
+        for tienda in self.cargadas():
+            await tienda.vaciar()
+
+    def cargadas(self):
+        return list(self._tiendas.values())
+
+    def ids(self):
+        """Todos los inquilinos con datos en disco, estén o no en memoria."""
+        ids = [PRINCIPAL]
+        if self.multi and os.path.isdir(self.carpeta):
+            ids += sorted(d for d in os.listdir(self.carpeta) if os.path.isdir(os.path.join(self.carpeta, d)))
+        return ids
@@ -0,0 +1,172 @@
+import asyncio
+import collections
+
+from modelos import DISPONIBLE, VENDIDO
+
+HUERFANA = "compra sin cuenta"
+SIN_COMPRA = "vendida sin compra"
+SIN_CLIENTE = "vendida sin cliente"
+DOBLE_VENTA = "vendida dos veces"
+NO_COINCIDE = "compra no coincide"
+FECHA_ILEGIBLE = "fecha ilegible"
+
+
+class Anomalia:
+    __slots__ = ("tipo", "clave", "cliente", "detalle")
+
+    def __init__(self, tipo, clave, cliente=None, detalle=""):
+        self.tipo = tipo
+        # (plataforma, correo) de la cuenta afectada
+        self.clave = clave
+        self.cliente = cliente
+        self.detalle = detalle
+
+    def texto(self):
+        plataforma, correo = self.clave
+        cliente = f" [{self.cliente}]" if self.cliente else ""
+        detalle = f": {self.detalle}" if self.detalle else ""
+        return f"{self.tipo}{cliente} {correo} ({plataforma}){detalle}"
+
+
+class Verificador:
+    """Revisa que cuentas y clientes digan lo mismo, solo donde hubo cambios.
+
+    El inventario anota qué cuentas y clientes se tocaron; cada revisión
+    toma esos cambios y vuelve a mirar solo esos registros (y los del otro
+    lado que apuntan a ellos). La primera vez, o si el inventario se
+    recargó, revisa todo. Las anomalías quedan guardadas por registro, así
+    se limpian solas cuando el registro se corrige.
+    """
+
+    def __init__(self, lote=500):
+        self.lote = lote
+        self._data = None
+        # clave de cuenta -> clientes que la tienen entre sus compras
+        self._compradores = collections.defaultdict(set)
+        self._claves_de = {}
+        self._anomalias = {}
+
+    def _pasos(self, data, nuevas):
+        if data is not self._data:
+            self._data = data
+            self._compradores.clear()
+            self._claves_de.clear()
+            self._anomalias.clear()
+            data.tomar_cambios()
+            cuentas, clientes = {c.clave for c in data.cuentas}, set(data.clientes)
+        else:
+            cuentas, clientes = data.tomar_cambios()
+
+        # El índice inverso se actualiza de una vez, antes de ceder el control
+        for numero in clientes:
+            for clave in self._claves_de.pop(numero, ()):
+                self._compradores[clave].discard(numero)
+                cuentas.add(clave)
+            claves = [compra.clave for compra in data.clientes.get(numero, ())]
+            if claves:
+                self._claves_de[numero] = claves
+            for clave in claves:
+                self._compradores[clave].add(numero)
+                cuentas.add(clave)
+        for clave in cuentas:
+            clientes.update(self._compradores.get(clave, ()))
+
+        registros = [("cuenta", clave) for clave in cuentas] + [("cliente", numero) for numero in clientes]
+        for i in range(0, len(registros), self.lote):
+            # Sin pausas dentro del lote: cada registro se revisa contra un estado fijo
+            for registro in registros[i:i + self.lote]:
+                tipo, id = registro
+                encontradas = self._revisar_cuenta(data, id) if tipo == "cuenta" else self._revisar_cliente(data, id)
+                anteriores = {a.texto() for a in self._anomalias.get(registro, ())}
+                if encontradas:
+                    self._anomalias[registro] = encontradas
+                    nuevas.extend(a for a in encontradas if a.texto() not in anteriores)
+                else:
+                    self._anomalias.pop(registro, None)
+                if tipo == "cuenta" and not self._compradores.get(id):
+                    self._compradores.pop(id, None)
+            yield
+
+    async def revisar(self, data):
+        """Revisa lo que cambió y devuelve las anomalías que aparecieron en esta pasada."""
+        nuevas = []
+        for _ in self._pasos(data, nuevas):
+            # Entre lotes los comandos siguen corriendo; lo que toquen se revisa en la próxima pasada
+            await asyncio.sleep(0)
+        return nuevas
+
+    def revisar_ya(self, data):
+        nuevas = []
+        for _ in self._pasos(data, nuevas):
+            pass
+        return nuevas
+
+    def _revisar_cuenta(self, data, clave):
+        cuenta = data.cuenta_por_clave(clave)
+        if cuenta is None:
+            return []
+        anomalias = []
+        compradores = self._compradores.get(clave, ())
+        if cuenta.estado == VENDIDO:
+            if not cuenta.cliente:
+                anomalias.append(Anomalia(SIN_CLIENTE, clave))
+            elif cuenta.cliente not in compradores:
+                anomalias.append(Anomalia(SIN_COMPRA, clave, cuenta.cliente))
+            if cuenta.fecha_texto:
+                anomalias.append(Anomalia(FECHA_ILEGIBLE, clave, cuenta.cliente, f"'{cuenta.fecha_texto}'"))
+        if len(compradores) > 1:
+            anomalias.append(Anomalia(DOBLE_VENTA, clave, cuenta.cliente, ", ".join(sorted(compradores))))
+        return anomalias
+
+    def _revisar_cliente(self, data, numero):
+        anomalias = []
+        for compra in data.clientes.get(numero, ()):
+            cuenta = data.cuenta_por_clave(compra.clave)
+            if cuenta is None:
+                anomalias.append(Anomalia(HUERFANA, compra.clave, numero))
+            elif cuenta.estado != VENDIDO or cuenta.cliente != numero:
+                anomalias.append(Anomalia(NO_COINCIDE, compra.clave, numero,
+                                          f"la cuenta figura {cuenta.estado} a {cuenta.cliente or 'nadie'}"))
+            if compra.fecha_texto:
+                anomalias.append(Anomalia(FECHA_ILEGIBLE, compra.clave, numero, f"'{compra.fecha_texto}'"))
+        return anomalias
+
+    def anomalias(self):
+        return [a for encontradas in self._anomalias.values() for a in encontradas]
+
+    def resumen(self):
+        return collections.Counter(a.tipo for a in self.anomalias())
+
+    def reparar(self, data):
+        """Corrige lo que tiene una sola lectura posible; devuelve cuántas se corrigieron.
+
+        La cuenta manda: si dice a quién se vendió, las compras de otros se
+        quitan. Las fechas ilegibles y las compras de cuentas reservadas
+        quedan para revisión manual.
+        """
+        reparadas = 0
+        for a in self.anomalias():
+            cuenta = data.cuenta_por_clave(a.clave)
+            if a.tipo == HUERFANA and cuenta is None and data.compra(a.cliente, a.clave):
+                data.quitar_compra(a.cliente, a.clave)
+            elif a.tipo == SIN_CLIENTE and cuenta and cuenta.estado == VENDIDO and not cuenta.cliente:
+                data.liberar(cuenta)
+            elif a.tipo == SIN_COMPRA and cuenta and cuenta.estado == VENDIDO and cuenta.cliente \
+                    and not data.compra(cuenta.cliente, a.clave):
+                data.agregar_compra(cuenta.cliente, cuenta)
+            elif a.tipo == DOBLE_VENTA and cuenta and cuenta.estado == VENDIDO:
+                for numero in list(self._compradores.get(a.clave, ())):
+                    if numero != cuenta.cliente:
+                        data.quitar_compra(numero, a.clave)
+            elif a.tipo == NO_COINCIDE and cuenta and data.compra(a.cliente, a.clave):
+                if cuenta.estado == VENDIDO and cuenta.cliente != a.cliente:
+                    data.quitar_compra(a.cliente, a.clave)
+                elif cuenta.estado == DISPONIBLE and self._compradores.get(a.clave) == {a.cliente}:
+                    # Igual que /sincronizar: la compra del único cliente que la tiene manda
+                    data.aplicar_compra(a.cliente, data.compra(a.cliente, a.clave), cuenta)
+                else:
+                    continue
+            else:
+                continue
+            reparadas += 1
+        return reparadas
@@ -0,0 +1,559 @@
+import datetime
+import logging
+import sys
+
+from asignacion import PRIMERA, crear as crear_asignador
+from clientes import FichaCliente, IndiceClientes
+from pronostico import Disponibilidad
+from reservas import ColaReservas
+
+DISPONIBLE = "disponible"
+VENDIDO = "vendido"
+RESERVADO = "reservado"
+
+# Formatos aceptados al leer; siempre se guarda con FORMATO_FECHA
+FORMATOS_FECHA = ("%d/%m/%y", "%Y-%m-%d")
+FORMATO_FECHA = "%d/%m/%y"
+
+
+def normalizar_plataforma(plataforma):
+    # Se normaliza una sola vez al entrar; luego las comparaciones son entre cadenas internadas
+    return sys.intern(plataforma.strip().lower())
+
+
+def clave_cuenta(plataforma, correo):
+    return (normalizar_plataforma(plataforma), correo.strip().lower())
+
+
+def parse_fecha(texto):
+    if isinstance(texto, datetime.date):
+        return texto
+    texto = (texto or "").strip()
+    if not texto:
+        return None
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha inválida: '{texto}'")
+
+
+def formatear_fecha(fecha):
+    return fecha.strftime(FORMATO_FECHA) if fecha else ""
+
+
+def _fecha_desde_json(texto, origen):
+    """Devuelve (fecha, texto_original). Si la fecha guardada no se puede
+    interpretar se conserva el texto tal cual para no perderlo al guardar."""
+    try:
+        return parse_fecha(texto), None
+    except ValueError as e:
+        logging.error(f"Error parsing fecha_vencimiento en {origen}: {e}")
+        return None, texto
+
+
+class Cuenta:
+    __slots__ = ("plataforma", "correo", "clave", "contraseña", "estado", "cliente",
+                 "fecha_vencimiento", "fecha_texto", "reserva_expira", "usos", "liberada", "orden", "turno", "foto")
+
+    def __init__(self, plataforma, correo, contraseña, estado=DISPONIBLE, cliente=None,
+                 fecha_vencimiento=None, fecha_texto=None, reserva_expira=None, usos=0, liberada=None):
+        self.plataforma = normalizar_plataforma(plataforma)
+        self.correo = correo
+        self.clave = (self.plataforma, correo.lower())
+        self.contraseña = contraseña
+        self.estado = sys.intern(estado)
+        self.cliente = cliente
+        self.fecha_vencimiento = fecha_vencimiento
+        self.fecha_texto = fecha_texto
+        self.reserva_expira = reserva_expira
+        # Veces que se vendió y cuándo volvió a quedar disponible (para repartir el uso)
+        self.usos = usos
+        self.liberada = liberada
+        # Solo en memoria: orden de llegada y turno en la cola de disponibles (ver asignacion.py)
+        self.orden = 0
+        self.turno = 0
+        # Último to_dict(), mientras la cuenta no cambie (ver Inventario.to_dict)
+        self.foto = None
+
+    @classmethod
+    def from_dict(cls, d):
+        fecha, texto = _fecha_desde_json(d.get("fecha_vencimiento"), d.get("correo"))
+        reserva_expira = d.get("reserva_expira")
+        if reserva_expira:
+            reserva_expira = datetime.datetime.fromisoformat(reserva_expira)
+        liberada = d.get("liberada")
+        if liberada:
+            liberada = datetime.datetime.fromisoformat(liberada)
+        return cls(d.get("plataforma", ""), d.get("correo", ""), d.get("contraseña", ""),
+                   estado=d.get("estado", DISPONIBLE), cliente=d.get("cliente"),
+                   fecha_vencimiento=fecha, fecha_texto=texto, reserva_expira=reserva_expira,
+                   usos=d.get("usos", 0), liberada=liberada)
+
+    def to_dict(self):
+        d = {
+            "plataforma": self.plataforma,
+            "correo": self.correo,
+            "contraseña": self.contraseña,
+            "estado": self.estado,
+            "cliente": self.cliente,
+            "fecha_vencimiento": self.fecha_texto or formatear_fecha(self.fecha_vencimiento)
+        }
+        if self.reserva_expira:
+            d["reserva_expira"] = self.reserva_expira.isoformat(timespec="seconds")
+        if self.usos:
+            d["usos"] = self.usos
+        if self.liberada:
+            d["liberada"] = self.liberada.isoformat(timespec="seconds")
+        return d
+
+    def fecha_str(self):
+        return self.fecha_texto or formatear_fecha(self.fecha_vencimiento)
+
+    def cambiar_correo(self, correo):
+        self.correo = correo
+        self.clave = (self.plataforma, correo.lower())
+
+
+class Compra:
+    __slots__ = ("plataforma", "correo", "clave", "contraseña", "fecha_vencimiento", "fecha_texto")
+
+    def __init__(self, plataforma, correo, contraseña, fecha_vencimiento=None, fecha_texto=None):
+        self.plataforma = normalizar_plataforma(plataforma)
+        self.correo = correo
+        self.clave = (self.plataforma, correo.lower())
+        self.contraseña = contraseña
+        self.fecha_vencimiento = fecha_vencimiento
+        self.fecha_texto = fecha_texto
+
+    @classmethod
+    def from_dict(cls, d):
+        fecha, texto = _fecha_desde_json(d.get("fecha_vencimiento"), d.get("correo"))
+        return cls(d.get("plataforma", ""), d.get("correo", ""), d.get("contraseña", ""),
+                   fecha_vencimiento=fecha, fecha_texto=texto)
+
+    @classmethod
+    def desde_cuenta(cls, cuenta):
+        return cls(cuenta.plataforma, cuenta.correo, cuenta.contraseña, cuenta.fecha_vencimiento)
+
+    def to_dict(self):
+        return {
+            "plataforma": self.plataforma,
+            "correo": self.correo,
+            "contraseña": self.contraseña,
+            "fecha_vencimiento": self.fecha_texto or formatear_fecha(self.fecha_vencimiento)
+        }
+
+    def fecha_str(self):
+        return self.fecha_texto or formatear_fecha(self.fecha_vencimiento)
+
+
+class Inventario:
+    """Cuentas, compras por cliente y ganancias ya tipadas.
+
+    Mantiene un índice por (plataforma, correo) y las cuentas agrupadas por
+    plataforma, así los comandos no recorren ni vuelven a pasar a minúsculas
+    toda la lista en cada llamada. Todo cambio de estado pasa por
+    _actualizar para que los contadores de disponibilidad sigan al día.
+    """
+
+    def __init__(self, alerta_dias=3, asignacion=PRIMERA):
+        self.cuentas = []
+        self.clientes = {}
+        self.ganancias = {}
+        self.fichas = {}
+        self.disponibilidad = Disponibilidad(alerta_dias)
+        self.indice_clientes = IndiceClientes()
+        # Vistas ya armadas por cliente (con las contraseñas cifradas); se descartan apenas se toca algo de ese cliente
+        self.vistas = {}
+        self._indice = {}
+        self._por_plataforma = {}
+        self._reservas = ColaReservas()
+        # Cuentas disponibles por plataforma, en el orden en que se entregan
+        self._disponibles = crear_asignador(asignacion)
+        self._orden = 0
+        self._turno = 0
+        self._por_vencimiento = {}
+        self._antes = None
+        # Lo que cambió desde la última revisión de integridad (ver integridad.py)
+        self._cuentas_cambiadas = set()
+        self._clientes_cambiados = set()
+        # to_dict() ya armado de las compras y fichas que no cambiaron
+        self._fotos_clientes = {}
+        self._fotos_fichas = {}
+
+    @classmethod
+    def from_dict(cls, data, **kwargs):
+        inv = cls(**kwargs)
+        for d in data.get("cuentas", []):
+            inv._indexar(Cuenta.from_dict(d))
+        for numero, compras in data.get("clientes", {}).items():
+            inv.clientes[numero] = [Compra.from_dict(d) for d in compras]
+        inv._clientes_cambiados.update(inv.clientes)
+        inv.ganancias = {normalizar_plataforma(p): v for p, v in data.get("ganancias", {}).items()}
+        inv.disponibilidad.ventas_desde_dict(data.get("ventas", {}))
+        inv.fichas = {numero: FichaCliente.from_dict(d) for numero, d in data.get("fichas", {}).items()}
+        for numero in list(inv.clientes) + list(inv.fichas):
+            inv.indice_clientes.agregar(numero)
+        return inv
+
+    def to_dict(self):
+        """Foto para guardar. Solo se vuelve a armar lo que cambió desde la anterior.
+
+        Lo de adentro (cada cuenta, las compras de cada cliente, cada ficha) se
+        reutiliza entre fotos y nunca se modifica: cuando algo cambia se arma
+        uno nuevo. Así la foto es barata de tomar y se puede pasar a JSON en
+        otro hilo mientras el inventario sigue cambiando.
+        """
+        fotos_clientes = self._fotos_clientes
+        for numero, compras in self.clientes.items():
+            if numero not in fotos_clientes:
+                fotos_clientes[numero] = [compra.to_dict() for compra in compras]
+        data = {
+            "cuentas": [c.foto or self._foto_cuenta(c) for c in self.cuentas],
+            "clientes": {numero: fotos_clientes[numero] for numero in self.clientes},
+            "ganancias": dict(self.ganancias)
+        }
+        ventas = self.disponibilidad.ventas_a_dict()
+        if ventas:
+            data["ventas"] = ventas
+        if self.fichas:
+            fotos_fichas = self._fotos_fichas
+            for numero, ficha in self.fichas.items():
+                if numero not in fotos_fichas:
+                    fotos_fichas[numero] = ficha.to_dict()
+            data["fichas"] = {numero: fotos_fichas[numero] for numero in self.fichas}
+        return data
+
+    @staticmethod
+    def _foto_cuenta(cuenta):
+        cuenta.foto = cuenta.to_dict()
+        return cuenta.foto
+
+    # --- Registro de cambios para el historial ---
+
+    def iniciar_operacion(self):
+        self._antes = {"cuentas": {}, "clientes": {}, "fichas": {}}
+
+    def terminar_operacion(self):
+        """Devuelve las imágenes previas de lo que cambió desde iniciar_operacion."""
+        antes, self._antes = self._antes, None
+        if not antes:
+            return None
+        cambios = {}
+        if antes["cuentas"]:
+            cambios["cuentas"] = [[plataforma, correo, previa, indice if indice is not None else len(self.cuentas)]
+                                  for (plataforma, correo), (previa, indice) in antes["cuentas"].items()]
+        if antes["clientes"]:
+            cambios["clientes"] = [[numero, previa] for numero, previa in antes["clientes"].items()]
+        if antes["fichas"]:
+            cambios["fichas"] = [[numero, previa] for numero, previa in antes["fichas"].items()]
+        if "ganancias" in antes:
+            cambios["ganancias"] = antes["ganancias"]
+        if "ventas" in antes:
+            cambios["ventas"] = antes["ventas"]
+        return cambios or None
+
+    def _tocar_cuenta(self, cuenta, con_posicion=False):
+        cuenta.foto = None
+        self._cuentas_cambiadas.add(cuenta.clave)
+        if self._antes is None:
+            return
+        previa = self._antes["cuentas"].get(cuenta.clave)
+        if previa is None:
+            existe = self._indice.get(cuenta.clave) is cuenta
+            previa = [cuenta.to_dict() if existe else None, None]
+            self._antes["cuentas"][cuenta.clave] = previa
+        # La posición solo hace falta para reinsertar cuentas quitadas (cuesta O(n))
+        if con_posicion and previa[0] is not None and previa[1] is None:
+            previa[1] = self.cuentas.index(cuenta)
+
+    def _tocar_cliente(self, numero):
+        self._clientes_cambiados.add(numero)
+        self.vistas.pop(numero, None)
+        self._fotos_clientes.pop(numero, None)
+        if self._antes is None or numero in self._antes["clientes"]:
+            return
+        compras = self.clientes.get(numero)
+        self._antes["clientes"][numero] = [c.to_dict() for c in compras] if compras is not None else None
+
+    def _tocar_ficha(self, numero):
+        self.vistas.pop(numero, None)
+        self._fotos_fichas.pop(numero, None)
+        if self._antes is None or numero in self._antes["fichas"]:
+            return
+        ficha = self.fichas.get(numero)
+        self._antes["fichas"][numero] = ficha.to_dict() if ficha is not None else None
+
+    # --- Cuentas ---
+
+    def buscar(self, plataforma, correo):
+        return self._indice.get(clave_cuenta(plataforma, correo))
+
+    def cuenta_por_clave(self, clave):
+        return self._indice.get(clave)
+
+    def por_plataforma(self):
+        return self._por_plataforma.items()
+
+    def cuentas_de(self, plataforma):
+        return self._por_plataforma.get(normalizar_plataforma(plataforma), [])
+
+    def _indexar(self, cuenta):
+        if cuenta.clave in self._indice:
+            return False
+        self._tocar_cuenta(cuenta)
+        self._orden += 1
+        cuenta.orden = self._orden
+        self.cuentas.append(cuenta)
+        self._indice[cuenta.clave] = cuenta
+        self._por_plataforma.setdefault(cuenta.plataforma, []).append(cuenta)
+        self._contar(cuenta, 1)
+        if cuenta.estado == RESERVADO and cuenta.reserva_expira:
+            self._reservas.agregar(cuenta)
+        return True
+
+    def agregar(self, cuenta):
+        if not self._indexar(cuenta):
+            return False
+        self.disponibilidad.proyectar(cuenta.plataforma)
+        return True
+
+    def quitar(self, cuenta):
+        self._tocar_cuenta(cuenta, con_posicion=True)
+        self.cuentas.remove(cuenta)
+        del self._indice[cuenta.clave]
+        self._por_plataforma[cuenta.plataforma].remove(cuenta)
+        self._contar(cuenta, -1)
+
+    def cambiar_correo(self, cuenta, correo_nuevo):
+        # Para el historial es como quitar la clave vieja y agregar la nueva en el mismo lugar
+        self._tocar_cuenta(cuenta, con_posicion=True)
+        del self._indice[cuenta.clave]
+        cuenta.cambiar_correo(correo_nuevo)
+        self._tocar_cuenta(cuenta)
+        self._indice[cuenta.clave] = cuenta
+        if cuenta.estado == DISPONIBLE:
+            # Con otro correo puede pasar a otra casilla (política "dominios")
+            self._encolar(cuenta)
+
+    def primera_disponible(self, plataforma):
+        """La próxima cuenta disponible según la política de asignación, sin recorrer la plataforma."""
+        return self._disponibles.siguiente(normalizar_plataforma(plataforma), self._vigente)
+
+    def _encolar(self, cuenta):
+        # Las entradas anteriores de la cuenta quedan viejas y se descartan al llegar al tope
+        self._turno += 1
+        cuenta.turno = self._turno
+        self._disponibles.agregar(cuenta)
+
+    def _vigente(self, cuenta, turno):
+        return cuenta.turno == turno and cuenta.estado == DISPONIBLE and self._indice.get(cuenta.clave) is cuenta
+
+    def _contar(self, cuenta, signo):
+        if cuenta.estado == DISPONIBLE:
+            self.disponibilidad.disponible(cuenta.plataforma, signo)
+            if signo > 0:
+                self._encolar(cuenta)
+        elif cuenta.estado == VENDIDO:
+            self.disponibilidad.vencimiento(cuenta.plataforma, cuenta.fecha_vencimiento, signo)
+            if cuenta.fecha_vencimiento:
+                if signo > 0:
+                    self._por_vencimiento.setdefault(cuenta.fecha_vencimiento, set()).add(cuenta)
+                else:
+                    vencen = self._por_vencimiento.get(cuenta.fecha_vencimiento)
+                    if vencen is not None:
+                        vencen.discard(cuenta)
+                        if not vencen:
+                            del self._por_vencimiento[cuenta.fecha_vencimiento]
+
+    def vendidas_que_vencen(self, fecha):
+        return list(self._por_vencimiento.get(fecha, ()))
+
+    def vendidas_vencidas(self, hoy):
+        # Recorre solo las fechas ya cumplidas, no todas las cuentas
+        return [c for fecha in sorted(f for f in self._por_vencimiento if f <= hoy)
+                for c in sorted(self._por_vencimiento[fecha], key=lambda c: c.clave)]
+
+    def _actualizar(self, cuenta, estado, cliente=None, fecha_vencimiento=None, fecha_texto=None):
+        self._tocar_cuenta(cuenta)
+        self._contar(cuenta, -1)
+        if estado == DISPONIBLE and cuenta.estado != DISPONIBLE:
+            cuenta.liberada = datetime.datetime.now()
+        cuenta.estado = estado
+        cuenta.cliente = cliente
+        cuenta.fecha_vencimiento = fecha_vencimiento
+        cuenta.fecha_texto = fecha_texto
+        cuenta.reserva_expira = None
+        self._contar(cuenta, 1)
+
+    # --- Operaciones que tocan las dos copias (cuentas y clientes) ---
+
+    def vender(self, cuenta, numero_cliente, fecha_vencimiento, momento=None):
+        momento = momento or datetime.datetime.now()
+        # Una cuenta solo puede figurar en las compras de un cliente: la de su dueño anterior se quita.
+        # Una compra suelta en otro cliente (datos inconsistentes) la encuentra /integridad
+        if cuenta.cliente:
+            self.quitar_compra(cuenta.cliente, cuenta.clave)
+
+        self._actualizar(cuenta, VENDIDO, numero_cliente, fecha_vencimiento)
+        cuenta.usos += 1
+        self.agregar_compra(numero_cliente, cuenta)
+        self.ficha(numero_cliente).registrar_compra(momento.date())
+        if self._antes is not None:
+            # Las ventas solo se agregan: basta anotar cuáles para quitarlas al deshacer
+            self._antes.setdefault("ventas", []).append([cuenta.plataforma, momento.isoformat(timespec="seconds")])
+        self.disponibilidad.venta(cuenta.plataforma, momento)
+        self.disponibilidad.proyectar(cuenta.plataforma)
+
+    def liberar(self, cuenta):
+        if cuenta.cliente:
+            self.quitar_compra(cuenta.cliente, cuenta.clave)
+        self._actualizar(cuenta, DISPONIBLE)
+        self.disponibilidad.proyectar(cuenta.plataforma)
+
+    def renovar(self, cuenta, fecha_vencimiento):
+        self._actualizar(cuenta, cuenta.estado, cuenta.cliente, fecha_vencimiento)
+        if cuenta.cliente:
+            self.ficha(cuenta.cliente).registrar_renovacion(datetime.date.today(), cuenta.plataforma,
+                                                            cuenta.correo, fecha_vencimiento)
+        compra = self.compra(cuenta.cliente, cuenta.clave)
+        if compra:
+            self._tocar_cliente(cuenta.cliente)
+            compra.fecha_vencimiento = fecha_vencimiento
+            compra.fecha_texto = None
+        self.disponibilidad.proyectar(cuenta.plataforma)
+
+    def reemplazar(self, cuenta, correo_nuevo, contraseña_nueva):
+        clave_vieja = cuenta.clave
+        self.cambiar_correo(cuenta, correo_nuevo)
+        cuenta.contraseña = contraseña_nueva
+        compra = self.compra(cuenta.cliente, clave_vieja)
+        if compra:
+            self._tocar_cliente(cuenta.cliente)
+            compra.correo = correo_nuevo
+            compra.clave = cuenta.clave
+            compra.contraseña = contraseña_nueva
+
+    def eliminar(self, cuenta):
+        self._tocar_cuenta(cuenta)
+        if cuenta.cliente:
+            self.quitar_compra(cuenta.cliente, cuenta.clave)
+        cuenta.reserva_expira = None
+        self.quitar(cuenta)
+        self.disponibilidad.proyectar(cuenta.plataforma)
+
+    def sincronizar(self):
+        """Marca como vendidas las cuentas que figuran en compras de clientes y
+        descarta las compras de cuentas que ya no existen."""
+        sincronizados = 0
+        plataformas = set()
+        for num_cliente, compras in list(self.clientes.items()):
+            self._tocar_cliente(num_cliente)
+            nuevas_compras = []
+            for compra in compras:
+                cuenta = self._indice.get(compra.clave)
+                if cuenta:
+                    self.aplicar_compra(num_cliente, compra, cuenta)
+                    plataformas.add(cuenta.plataforma)
+                    sincronizados += 1
+                    nuevas_compras.append(compra)
+
+            if nuevas_compras:
+                self.clientes[num_cliente] = nuevas_compras
+            else:
+                del self.clientes[num_cliente]
+
+        for plataforma in plataformas:
+            self.disponibilidad.proyectar(plataforma)
+        return sincronizados
+
+    def aplicar_compra(self, numero_cliente, compra, cuenta):
+        """Deja la cuenta como la dice la compra del cliente (vendida a él, con esa fecha)."""
+        self._actualizar(cuenta, VENDIDO, numero_cliente, compra.fecha_vencimiento, compra.fecha_texto)
+
+    def tomar_cambios(self):
+        """Devuelve (claves de cuentas, números de clientes) tocados desde la última llamada."""
+        cambios = (self._cuentas_cambiadas, self._clientes_cambiados)
+        self._cuentas_cambiadas, self._clientes_cambiados = set(), set()
+        return cambios
+
+    # --- Reservas ---
+
+    def reservar(self, cuenta, numero_cliente, expira):
+        self._actualizar(cuenta, RESERVADO, numero_cliente)
+        cuenta.reserva_expira = expira
+        self._reservas.agregar(cuenta)
+        self.disponibilidad.proyectar(cuenta.plataforma)
+
+    def proxima_reserva(self):
+        return self._reservas.proxima()
+
+    def reserva_de(self, numero_cliente, plataforma):
+        for c in self.cuentas_de(plataforma):
+            if c.estado == RESERVADO and c.cliente == numero_cliente:
+                return c
+        return None
+
+    def expirar_reservas(self, ahora):
+        """Libera las reservas vencidas y devuelve las cuentas liberadas."""
+        vencidas = self._reservas.vencidas(ahora)
+        for cuenta in vencidas:
+            self.liberar(cuenta)
+        return vencidas
+
+    # --- Compras por cliente ---
+
+    def compra(self, numero_cliente, clave):
+        for compra in self.clientes.get(numero_cliente, ()):
+            if compra.clave == clave:
+                return compra
+        return None
+
+    def agregar_compra(self, numero_cliente, cuenta):
+        self._tocar_cliente(numero_cliente)
+        self.clientes.setdefault(numero_cliente, []).append(Compra.desde_cuenta(cuenta))
+        self.indice_clientes.agregar(numero_cliente)
+
+    def quitar_compra(self, numero_cliente, clave):
+        compras = self.clientes.get(numero_cliente)
+        if compras is None:
+            return
+        nuevas = [compra for compra in compras if compra.clave != clave]
+        if len(nuevas) == len(compras):
+            return
+        self._tocar_cliente(numero_cliente)
+        if nuevas:
+            self.clientes[numero_cliente] = nuevas
+        else:
+            del self.clientes[numero_cliente]
+
+    def sumar_ganancia(self, plataforma, monto, numero_cliente=None):
+        plataforma = normalizar_plataforma(plataforma)
+        if self._antes is not None and "ganancias" not in self._antes:
+            self._antes["ganancias"] = dict(self.ganancias)
+        self.ganancias[plataforma] = self.ganancias.get(plataforma, 0) + monto
+        if numero_cliente:
+            self.ficha(numero_cliente).ganancia += monto
+
+    # --- Fichas de clientes ---
+
+    def ficha(self, numero_cliente):
+        """Ficha del cliente para modificarla (se crea si no existe)."""
+        self._tocar_ficha(numero_cliente)
+        ficha = self.fichas.get(numero_cliente)
+        if ficha is None:
+            ficha = self.fichas[numero_cliente] = FichaCliente()
+            self.indice_clientes.agregar(numero_cliente)
+        return ficha
+
+    def buscar_clientes(self, consulta, limite=10):
+        """Clientes cuyo número es, termina en o contiene `consulta`."""
+        encontrados = []
+        for numero in self.indice_clientes.buscar(consulta):
+            if numero in self.clientes or numero in self.fichas:
+                encontrados.append(numero)
+                if len(encontrados) == limite:
+                    break
+        return encontrados
@@ -0,0 +1,168 @@
+import datetime
+import json
+import logging
+import os
+
+from modelos import formatear_fecha
+
+RECORDATORIO = "recordatorio"
+VENCIMIENTO = "vencimiento"
+SEGUIMIENTO = "seguimiento"
+
+PENDIENTE = "pendiente"
+ENTREGADO = "entregado"
+ENVIADO = "enviado"
+CANCELADO = "cancelado"
+
+METODOS_PAGO = (
+    "*METODOS DE PAGO*\n"
+    "🟣 YAPE -  926 015 496\n"
+    "      ROSALI E. FLORES\n\n"
+    "*NO COLOCAR NADA EN LA DESCRIPCIÓN DEL PAGO NO LEEMOS ESA INFORMACION.*"
+)
+
+
+class Trabajo:
+    __slots__ = ("id", "tipo", "cliente", "fecha", "para", "cuentas", "estado", "actualizado")
+
+    def __init__(self, id, tipo, cliente, fecha, para, cuentas, estado=PENDIENTE, actualizado=None):
+        self.id = id
+        self.tipo = tipo
+        self.cliente = cliente
+        # fecha de vencimiento a la que se refiere el aviso
+        self.fecha = fecha
+        # día desde el que se puede enviar
+        self.para = para
+        # [(plataforma, correo), ...]
+        self.cuentas = cuentas
+        self.estado = estado
+        self.actualizado = actualizado
+
+    @property
+    def clave(self):
+        return (self.cliente, self.tipo, self.fecha)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["id"], d["tipo"], d["cliente"], datetime.date.fromisoformat(d["fecha"]),
+                   datetime.date.fromisoformat(d["para"]), [tuple(c) for c in d["cuentas"]],
+                   estado=d["estado"], actualizado=d.get("actualizado"))
+
+    def to_dict(self):
+        return {"id": self.id, "tipo": self.tipo, "cliente": self.cliente,
+                "fecha": self.fecha.isoformat(), "para": self.para.isoformat(),
+                "cuentas": [list(c) for c in self.cuentas], "estado": self.estado,
+                "actualizado": self.actualizado}
+
+    def texto(self):
+        fecha = formatear_fecha(self.fecha)
+        varias = len(self.cuentas) > 1
+        if self.tipo == RECORDATORIO:
+            estado = f"vencen el {fecha}" if varias else f"vence el {fecha}"
+        elif self.tipo == SEGUIMIENTO:
+            estado = f"vencieron el {fecha}" if varias else f"venció el {fecha}"
+        else:
+            estado = "han vencido" if varias else "a vencido"
+
+        if varias:
+            texto = f"Buen día, tus servicios streaming {estado}\n"
+            texto += "".join(f"- {correo} ({plataforma})\n" for plataforma, correo in self.cuentas)
+        else:
+            plataforma, correo = self.cuentas[0]
+            texto = f"Buen día, tu servicio de {plataforma} *({correo})* {estado} "
+
+        if self.tipo == SEGUIMIENTO:
+            texto += "¿deseas renovarlo? escríbenos y lo activamos hoy mismo.\n"
+        else:
+            texto += "confirma renovación para evitar cortes innecesarios.\n"
+        return texto + METODOS_PAGO
+
+
+class Notificaciones:
+    """Cola persistente de avisos a clientes.
+
+    Cada aviso se identifica por (cliente, tipo, fecha de vencimiento), así
+    correr dos veces el mismo proceso no duplica avisos. Los pendientes se
+    envían al operador en páginas de `tam_pagina` clientes y se marcan como
+    entregados; pasan a enviados cuando el operador confirma cada uno.
+    """
+
+    def __init__(self, ruta, tam_pagina=10, dias_conservar=30):
+        self.ruta = ruta
+        self.tam_pagina = tam_pagina
+        self.dias_conservar = dias_conservar
+        self._trabajos = {}
+        self._por_clave = {}
+        self._siguiente_id = 1
+        self._cargar()
+
+    def _cargar(self):
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError as e:
+            logging.error(f"No se pudo leer {self.ruta}: {e}")
+            return
+        for d in data.get("trabajos", []):
+            trabajo = Trabajo.from_dict(d)
+            self._trabajos[trabajo.id] = trabajo
+            self._por_clave[trabajo.clave] = trabajo
+        self._siguiente_id = data.get("siguiente_id", len(self._trabajos) + 1)
+
+    def guardar(self):
+        self._purgar()
+        data = {"siguiente_id": self._siguiente_id,
+                "trabajos": [t.to_dict() for t in self._trabajos.values()]}
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        tmp = self.ruta + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.ruta)
+
+    def _purgar(self):
+        limite = datetime.date.today() - datetime.timedelta(days=self.dias_conservar)
+        for trabajo in list(self._trabajos.values()):
+            if trabajo.estado != PENDIENTE and trabajo.para < limite:
+                del self._trabajos[trabajo.id]
+                self._por_clave.pop(trabajo.clave, None)
+
+    def encolar(self, tipo, cliente, fecha, para, cuentas):
+        """Agrega un aviso; devuelve None si ya existía uno igual."""
+        clave = (cliente, tipo, fecha)
+        existente = self._por_clave.get(clave)
+        if existente:
+            # Si aún no salió, se suman las cuentas nuevas del mismo cliente
+            if existente.estado == PENDIENTE:
+                for c in cuentas:
+                    if c not in existente.cuentas:
+                        existente.cuentas.append(c)
+            return None
+        trabajo = Trabajo(self._siguiente_id, tipo, cliente, fecha, para, list(cuentas))
+        self._siguiente_id += 1
+        self._trabajos[trabajo.id] = trabajo
+        self._por_clave[clave] = trabajo
+        return trabajo
+
+    def get(self, id):
+        return self._trabajos.get(id)
+
+    def pendientes(self, hoy):
+        return sorted((t for t in self._trabajos.values() if t.estado == PENDIENTE and t.para <= hoy),
+                      key=lambda t: (t.para, t.id))
+
+    def paginas(self, trabajos):
+        for i in range(0, len(trabajos), self.tam_pagina):
+            yield trabajos[i:i + self.tam_pagina]
+
+    def marcar(self, trabajo, estado):
+        trabajo.estado = estado
+        trabajo.actualizado = datetime.datetime.now().isoformat(timespec="seconds")
+
+    def resumen(self):
+        conteo = {}
+        for t in self._trabajos.values():
+            conteo.setdefault(t.tipo, {}).setdefault(t.estado, 0)
+            conteo[t.tipo][t.estado] += 1
+        return conteo
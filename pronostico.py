@@ -0,0 +1,111 @@
+import collections
+import datetime
+
+VENTANA_VENTAS_DIAS = 7
+HORIZONTE_DIAS = 14
+
+
+class Proyeccion:
+    __slots__ = ("plataforma", "disponibles", "ventas_por_dia", "dias_restantes")
+
+    def __init__(self, plataforma, disponibles, ventas_por_dia, dias_restantes):
+        self.plataforma = plataforma
+        self.disponibles = disponibles
+        self.ventas_por_dia = ventas_por_dia
+        # None si con el ritmo actual no se agota dentro del horizonte
+        self.dias_restantes = dias_restantes
+
+
+class Disponibilidad:
+    """Contadores por plataforma que el inventario actualiza en cada cambio.
+
+    Lleva las cuentas disponibles, cuántas ventas vencen cada día y las
+    ventas recientes. Con eso proyecta cuándo se acaba cada plataforma sin
+    recorrer las cuentas: recalcular una plataforma cuesta O(HORIZONTE_DIAS).
+    """
+
+    def __init__(self, alerta_dias=3):
+        self.alerta_dias = alerta_dias
+        self._disponibles = collections.Counter()
+        self._vencimientos = collections.defaultdict(collections.Counter)
+        self._ventas = collections.defaultdict(collections.deque)
+        self._proyecciones = {}
+        self._alertadas = set()
+        self._alertas = []
+
+    # --- Contadores ---
+
+    def disponible(self, plataforma, delta):
+        self._disponibles[plataforma] += delta
+
+    def vencimiento(self, plataforma, fecha, delta):
+        if fecha is None:
+            return
+        por_fecha = self._vencimientos[plataforma]
+        por_fecha[fecha] += delta
+        if por_fecha[fecha] <= 0:
+            del por_fecha[fecha]
+
+    def venta(self, plataforma, momento):
+        self._ventas[plataforma].append(momento)
+
+    def ventas_a_dict(self):
+        return {p: [m.isoformat(timespec="seconds") for m in ventas]
+                for p, ventas in self._ventas.items() if ventas}
+
+    def ventas_desde_dict(self, data):
+        for plataforma, momentos in data.items():
+            for m in momentos:
+                self.venta(plataforma, datetime.datetime.fromisoformat(m))
+
+    # --- Proyección ---
+
+    def _ventas_por_dia(self, plataforma, ahora):
+        ventas = self._ventas[plataforma]
+        limite = ahora - datetime.timedelta(days=VENTANA_VENTAS_DIAS)
+        while ventas and ventas[0] < limite:
+            ventas.popleft()
+        return len(ventas) / VENTANA_VENTAS_DIAS
+
+    def proyectar(self, plataforma, ahora=None, alertar=True):
+        """Proyección de una plataforma; con alertar=False no toca las alertas pendientes (solo consulta)."""
+        ahora = ahora or datetime.datetime.now()
+        hoy = ahora.date()
+        disponibles = self._disponibles[plataforma]
+        ritmo = self._ventas_por_dia(plataforma, ahora)
+
+        dias_restantes = None
+        if disponibles <= 0:
+            dias_restantes = 0
+        elif ritmo > 0:
+            # Las cuentas que vencen vuelven al stock ese día (cuando se corre /vencidos)
+            por_fecha = self._vencimientos[plataforma]
+            stock = disponibles
+            for dia in range(HORIZONTE_DIAS):
+                stock += por_fecha.get(hoy + datetime.timedelta(days=dia), 0) - ritmo
+                if stock <= 0:
+                    dias_restantes = dia + 1
+                    break
+
+        proyeccion = Proyeccion(plataforma, disponibles, ritmo, dias_restantes)
+        self._proyecciones[plataforma] = proyeccion
+        if alertar:
+            self._revisar_alerta(proyeccion)
+        return proyeccion
+
+    def proyecciones(self, alertar=True):
+        return [self.proyectar(p, alertar=alertar) for p in sorted(set(self._disponibles) | set(self._ventas))]
+
+    def _revisar_alerta(self, proyeccion):
+        plataforma = proyeccion.plataforma
+        en_riesgo = proyeccion.dias_restantes is not None and proyeccion.dias_restantes <= self.alerta_dias
+        if en_riesgo and plataforma not in self._alertadas:
+            self._alertadas.add(plataforma)
+            self._alertas.append(proyeccion)
+        elif not en_riesgo:
+            # Se vuelve a avisar solo después de que la plataforma se recupere
+            self._alertadas.discard(plataforma)
+
+    def tomar_alertas(self):
+        alertas, self._alertas = self._alertas, []
+        return alertas
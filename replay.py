@@ -0,0 +1,292 @@
+"""Reproduce tráfico grabado contra el bot y mide cómo responde.
+
+Uso:
+    GRABAR_UPDATES=trafico.jsonl python bot.py            # graba updates reales (sin datos personales)
+    python replay.py trafico.jsonl --datos data.json --velocidad 10 --concurrencia 8
+    python replay.py --generar 500 --datos data.json > sintetico.jsonl
+
+Los updates se entregan a la misma Application que arma main(), pero el
+bot habla con un servidor falso de la Bot API en localhost y trabaja sobre
+una copia de los datos en una carpeta temporal. Al final informa
+throughput, latencias (p50/p95/p99) y si cuentas y clientes quedaron
+consistentes.
+
+Los ids de chat y de usuario de una grabación son seudónimos, así que se
+reproduce todo sobre la tienda principal y sin OPERADORES (que rechazaría
+cada update). Con --inquilinos se reparte por chat como con
+MULTI_INQUILINO=1, cada chat con su propia copia de --datos; sirve con
+tráfico sintético, cuyos chats se eligen con --chats.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOKEN_FALSO = "123456:replay"
+
+
+# --- Servidor falso de la Bot API ---
+
+class ApiFalsa(BaseHTTPRequestHandler):
+    llamadas = collections.Counter()
+    latencia = 0.0
+    _siguiente_mensaje = 1
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _parametros(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        cuerpo = self.rfile.read(largo).decode('utf-8') if largo else ""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(cuerpo or "{}")
+        return {k: v[0] for k, v in urllib.parse.parse_qs(cuerpo).items()}
+
+    def _mensaje(self, p):
+        with ApiFalsa._lock:
+            id = ApiFalsa._siguiente_mensaje
+            ApiFalsa._siguiente_mensaje += 1
+        chat_id = int(p.get("chat_id") or 1)
+        mensaje = {"message_id": id, "date": int(time.time()), "text": p.get("text", ""),
+                   "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"}}
+        if p.get("reply_markup"):
+            mensaje["reply_markup"] = json.loads(p["reply_markup"])
+        return mensaje
+
+    def do_POST(self):
+        metodo = self.path.rsplit("/", 1)[-1]
+        p = self._parametros()
+        with ApiFalsa._lock:
+            ApiFalsa.llamadas[metodo] += 1
+        if ApiFalsa.latencia:
+            time.sleep(ApiFalsa.latencia)
+
+        if metodo == "getMe":
+            resultado = {"id": 123456, "is_bot": True, "first_name": "replay", "username": "replay_bot"}
+        elif metodo in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            resultado = self._mensaje(p)
+        elif metodo == "getUpdates":
+            resultado = []
+        else:
+            resultado = True
+
+        cuerpo = json.dumps({"ok": True, "result": resultado}).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+def iniciar_api_falsa(latencia):
+    ApiFalsa.latencia = latencia
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ApiFalsa)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+# --- Consistencia ---
+
+def revisar_consistencia(data):
+    """Problemas entre cuentas y clientes: ventas dobles y copias que no coinciden."""
+    from integridad import Verificador
+
+    problemas = [f"cuenta repetida {n} veces: {clave}"
+                 for clave, n in collections.Counter(c.clave for c in data.cuentas).items() if n > 1]
+    verificador = Verificador()
+    verificador.revisar_ya(data)
+    return problemas + [a.texto() for a in verificador.anomalias()]
+
+
+# --- Reproducción ---
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+async def reproducir(bot, grabacion, velocidad, concurrencia, latencia_api):
+    from telegram import Update
+
+    servidor = iniciar_api_falsa(latencia_api)
+    application = bot.crear_aplicacion(TOKEN_FALSO, base_url=f"http://127.0.0.1:{servidor.server_port}/bot")
+    errores = []
+
+    async def anotar_error(update, context):
+        errores.append(repr(context.error))
+
+    application.add_error_handler(anotar_error)
+    await application.initialize()
+
+    latencias = []
+    limite = asyncio.Semaphore(concurrencia)
+
+    async def procesar(d):
+        async with limite:
+            update = Update.de_json(d, application.bot)
+            t = time.perf_counter()
+            await application.process_update(update)
+            latencias.append(time.perf_counter() - t)
+
+    t0 = grabacion[0]["t"] if grabacion else 0
+    inicio = time.perf_counter()
+    tareas = []
+    for entrada in grabacion:
+        if velocidad:
+            espera = (entrada["t"] - t0) / velocidad - (time.perf_counter() - inicio)
+            if espera > 0:
+                await asyncio.sleep(espera)
+        tareas.append(asyncio.create_task(procesar(entrada["update"])))
+    await asyncio.gather(*tareas)
+    duracion = time.perf_counter() - inicio
+
+    # Envíos en segundo plano (avisos, escrituras) que dejaron los comandos
+    pendientes = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    if pendientes:
+        await asyncio.wait(pendientes, timeout=30)
+
+    await application.shutdown()
+    servidor.shutdown()
+    return latencias, duracion, errores
+
+
+def informe(bot, latencias, duracion, errores):
+    n = len(latencias)
+    print(f"Updates procesados: {n} en {duracion:.2f}s ({n / duracion if duracion else 0:.1f}/s)")
+    print("Latencia (ms): " + ", ".join(f"p{p}={percentil(latencias, p) * 1000:.1f}" for p in (50, 95, 99))
+          + f", máx={max(latencias, default=0) * 1000:.1f}")
+    print("Llamadas a la API: " + ", ".join(f"{m}={c}" for m, c in sorted(ApiFalsa.llamadas.items())))
+    if errores:
+        print(f"Errores en handlers: {len(errores)}")
+        for e, c in collections.Counter(errores).most_common(5):
+            print(f"  {c} x {e}")
+
+    from modelos import Inventario
+    problemas_totales = 0
+    for id in bot.inquilinos.ids():
+        tienda = bot.inquilinos.por_id(id)
+        data = tienda.cargar()
+        problemas = revisar_consistencia(data)
+        try:
+            with open(tienda.data_file, 'r', encoding='utf-8') as f:
+                en_disco = Inventario.from_dict(json.load(f)).to_dict()
+        except FileNotFoundError:
+            en_disco = None
+        if en_disco is not None and en_disco != data.to_dict():
+            problemas.append("lo guardado en disco no coincide con lo que hay en memoria")
+        problemas_totales += len(problemas)
+        print(f"[{id}] {len(data.cuentas)} cuentas, {len(data.clientes)} clientes: "
+              + ("consistente" if not problemas else f"{len(problemas)} problema(s)"))
+        for p in problemas[:20]:
+            print(f"  - {p}")
+    return 1 if problemas_totales or errores else 0
+
+
+def cargar_grabacion(ruta):
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return sorted((json.loads(linea) for linea in f if linea.strip()), key=lambda e: e["t"])
+
+
+# --- Tráfico sintético ---
+
+def generar(n, datos, ritmo, chats):
+    """Tráfico de prueba con la mezcla habitual de comandos sobre las plataformas de `datos`."""
+    try:
+        with open(datos, 'r', encoding='utf-8') as f:
+            plataformas = sorted({c["plataforma"].lower() for c in json.load(f).get("cuentas", [])})
+    except FileNotFoundError:
+        plataformas = []
+    plataformas = plataformas or ["netflix"]
+    clientes = [f"9{random.randint(10000000, 99999999)}" for _ in range(max(5, n // 10))]
+    vence = time.strftime("%d/%m/%y", time.localtime(time.time() + 30 * 86400))
+
+    mezcla = [
+        (30, lambda: f"/comprarcc {random.choice(clientes)} {random.choice(plataformas)} {vence} {random.randint(5, 15)}"),
+        (15, lambda: f"/info {random.choice(clientes)}"),
+        (10, lambda: f"/reservar {random.choice(clientes)} {random.choice(plataformas)} 5"),
+        (10, lambda: f"/liberarreserva {random.choice(clientes)} {random.choice(plataformas)}"),
+        (10, lambda: "/stock"),
+        (10, lambda: f"/buscarcc {random.choice(plataformas)}"),
+        (5, lambda: "/estadisticas"),
+        (5, lambda: "/historial 5"),
+        (5, lambda: "/agregarcc " + random.choice(plataformas) + " "
+         + " / ".join(f"g{random.getrandbits(32):x}@ejemplo.com clave" for _ in range(3))),
+    ]
+    pesos = [p for p, _ in mezcla]
+
+    t = time.time()
+    for i in range(1, n + 1):
+        t += random.expovariate(ritmo)
+        texto = random.choices(mezcla, weights=pesos)[0][1]()
+        chat = random.choice(chats)
+        comando = texto.split()[0]
+        update = {"update_id": i, "message": {
+            "message_id": i, "date": int(t), "text": texto,
+            "chat": {"id": chat, "type": "private"},
+            "from": {"id": chat, "is_bot": False, "first_name": "x"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(comando)}]}}
+        print(json.dumps({"t": t, "update": update}, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce updates grabados contra el bot.")
+    parser.add_argument("grabacion", nargs="?", help="JSONL grabado con GRABAR_UPDATES")
+    parser.add_argument("--datos", default="data.json", help="data.json de partida (se usa una copia)")
+    parser.add_argument("--velocidad", type=float, default=1.0,
+                        help="factor de aceleración respecto al tráfico grabado; 0 = sin esperas")
+    parser.add_argument("--concurrencia", type=int, default=8, help="updates procesándose a la vez como máximo")
+    parser.add_argument("--latencia-api", type=float, default=0.0, help="demora simulada de Telegram, en segundos")
+    parser.add_argument("--generar", type=int, metavar="N", help="en vez de reproducir, imprime N updates sintéticos")
+    parser.add_argument("--ritmo", type=float, default=2.0, help="updates por segundo del tráfico sintético")
+    parser.add_argument("--chats", default="1", help="ids de chat del tráfico sintético, separados por coma")
+    parser.add_argument("--inquilinos", action="store_true",
+                        help="una tienda por chat (MULTI_INQUILINO=1); por defecto todo va a la principal")
+    args = parser.parse_args()
+
+    if args.generar:
+        generar(args.generar, args.datos, args.ritmo, [int(c) for c in args.chats.split(",")])
+        return 0
+    if not args.grabacion:
+        parser.error("falta el archivo de grabación")
+
+    grabacion = cargar_grabacion(args.grabacion)
+    carpeta = tempfile.mkdtemp(prefix="replay-")
+    if os.path.exists(args.datos):
+        shutil.copy(args.datos, os.path.join(carpeta, "data.json"))
+        if args.inquilinos:
+            for chat in {e["update"].get("message", {}).get("chat", {}).get("id") for e in grabacion} - {None}:
+                os.makedirs(os.path.join(carpeta, "inquilinos", str(chat)), exist_ok=True)
+                shutil.copy(args.datos, os.path.join(carpeta, "inquilinos", str(chat), "data.json"))
+
+    # El bot usa rutas relativas: se importa ya dentro de la carpeta temporal
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(carpeta)
+    os.environ.pop("GRABAR_UPDATES", None)
+    # Los ids grabados son seudónimos: no calzan con OPERADORES ni con tiendas de inquilinos reales
+    os.environ.pop("OPERADORES", None)
+    os.environ["MULTI_INQUILINO"] = "1" if args.inquilinos else "0"
+    os.environ["INQUILINOS_DIR"] = "inquilinos"
+    import bot
+
+    latencias, duracion, errores = asyncio.run(
+        reproducir(bot, grabacion, args.velocidad, args.concurrencia, args.latencia_api))
+    codigo = informe(bot, latencias, duracion, errores)
+    print(f"Datos resultantes en {carpeta}")
+    return codigo
+
+
+if __name__ == '__main__':
+    sys.exit(main())
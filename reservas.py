@@ -0,0 +1,36 @@
+import heapq
+import itertools
+
+
+class ColaReservas:
+    """Montículo de reservas ordenado por hora de vencimiento.
+
+    Las reservas que se confirman o liberan antes de tiempo no se sacan del
+    montículo: quedan como entradas obsoletas y se descartan al llegar a la
+    cima. Así expirar cuesta O(k log n) por las k reservas vencidas, sin
+    recorrer todas las cuentas.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._contador = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def agregar(self, cuenta):
+        heapq.heappush(self._heap, (cuenta.reserva_expira, next(self._contador), cuenta))
+
+    def proxima(self):
+        return self._heap[0][0] if self._heap else None
+
+    def vencidas(self, ahora):
+        """Saca del montículo y devuelve las cuentas cuya reserva ya venció."""
+        vencidas = []
+        while self._heap and self._heap[0][0] <= ahora:
+            expira, _, cuenta = heapq.heappop(self._heap)
+            # Entrada obsoleta: la reserva se confirmó, se liberó o se renovó
+            if cuenta.reserva_expira != expira:
+                continue
+            vencidas.append(cuenta)
+        return vencidas
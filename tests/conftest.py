@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+
+# Los módulos del bot están sueltos en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Mensaje:
+    def __init__(self, texto, demora=0):
+        self.text = texto
+        self.demora = demora
+        self.respuestas = []
+
+    async def reply_text(self, texto, **kwargs):
+        # `demora` simula la latencia de la API de Telegram
+        await asyncio.sleep(self.demora)
+        self.respuestas.append(texto)
+
+
+class Chat:
+    def __init__(self, id):
+        self.id = id
+
+
+class Update:
+    def __init__(self, texto, chat_id=1, demora=0):
+        self.message = Mensaje(texto, demora)
+        self.effective_message = self.message
+        self.effective_chat = Chat(chat_id)
+        self.effective_user = Chat(chat_id)
+        self.callback_query = None
+
+
+class Bot:
+    def __init__(self):
+        self.enviados = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.enviados.append((chat_id, text))
+
+
+class Aplicacion:
+    def __init__(self):
+        self.tareas = []
+
+    def create_task(self, coro):
+        tarea = asyncio.ensure_future(coro)
+        self.tareas.append(tarea)
+        return tarea
+
+
+class Contexto:
+    def __init__(self, args):
+        self.args = args
+        self.bot = Bot()
+        self.application = Aplicacion()
+
+
+async def ejecutar(registro, texto, chat_id=1, demora=0):
+    """Pasa `texto` por el registro como si llegara de Telegram y devuelve el update (con sus respuestas)."""
+    partes = texto.split()
+    nombre = partes[0].lstrip("/")
+    comando = next(c for c in registro.comandos.values() if nombre == c.nombre or nombre in c.alias)
+    update = Update(texto, chat_id, demora)
+    contexto = Contexto(partes[1:])
+    await registro.ejecutar(comando, update, contexto)
+    await asyncio.gather(*contexto.application.tareas)
+    return update
@@ -0,0 +1,99 @@
+import datetime
+
+import pytest
+
+import argumentos
+from argumentos import Arg, ErrorArgumentos, Esquema
+
+COMPRAR = Esquema("/comprarcc (número_cliente) (plataforma) (fecha_vencimiento) (ganancia)",
+                  Arg("número_cliente", argumentos.telefono, variadico=True), Arg("plataforma", argumentos.plataforma),
+                  Arg("fecha_vencimiento", argumentos.fecha), Arg("ganancia", argumentos.entero))
+AGREGAR = Esquema("/agregarcc (plataforma) (correo contraseña) / ...",
+                  Arg("plataforma", argumentos.plataforma), Arg("cuentas", variadico=True))
+HISTORIAL = Esquema("/historial [cantidad]", Arg("cantidad", argumentos.entero_positivo, opcional=True, defecto=10))
+RESTAURAR = Esquema("/restaurar (fecha) [hh:mm]", Arg("fecha", argumentos.fecha),
+                    Arg("hora", argumentos.hora, opcional=True, defecto=datetime.time(23, 59, 59)))
+
+
+def test_numero_variadico_junta_las_palabras_sobrantes():
+    a = COMPRAR.parse(["+51", "987", "654", "321", "Netflix", "30/12/26", "15"])
+    assert a.número_cliente == "51987654321"
+    assert a.plataforma == "netflix"
+    assert a.fecha_vencimiento == datetime.date(2026, 12, 30)
+    assert a.ganancia == 15
+
+
+def test_numero_variadico_de_una_palabra():
+    a = COMPRAR.parse(["987654321", "prime", "2026-12-30", "0"])
+    assert a.número_cliente == "987654321"
+    assert a.fecha_vencimiento == datetime.date(2026, 12, 30)
+
+
+def test_variadico_al_final_reune_el_cuerpo_con_espacios():
+    a = AGREGAR.parse(["prime", "a@x.com", "p1", "/", "b@x.com", "p2"])
+    assert a.cuentas == "a@x.com p1 / b@x.com p2"
+
+
+def test_opcionales_toman_su_defecto():
+    assert HISTORIAL.parse([]).cantidad == 10
+    assert HISTORIAL.parse(["3"]).cantidad == 3
+    a = RESTAURAR.parse(["01/02/26"])
+    assert (a.fecha, a.hora) == (datetime.date(2026, 2, 1), datetime.time(23, 59, 59))
+    assert RESTAURAR.parse(["01/02/26", "9:05"]).hora == datetime.time(9, 5)
+
+
+def test_palabras_vacias_no_cuentan():
+    assert HISTORIAL.parse(["", "  ", "4"]).cantidad == 4
+
+
+def test_faltan_obligatorios_muestra_el_uso():
+    with pytest.raises(ErrorArgumentos) as e:
+        COMPRAR.parse(["987654321", "prime"])
+    assert e.value.mensaje == f"Uso correcto:\n{COMPRAR.uso}"
+
+
+@pytest.mark.parametrize("valores, campo", [
+    (["98765", "prime", "30/12/26", "5"], "número_cliente"),
+    (["98765432a", "prime", "30/12/26", "5"], "número_cliente"),
+    (["987654321", "prime", "31/02/26", "5"], "fecha_vencimiento"),
+    (["987654321", "prime", "30-12-26", "5"], "fecha_vencimiento"),
+    (["987654321", "prime", "30/12/26", "5.5"], "ganancia"),
+])
+def test_rechaza_valores_invalidos(valores, campo):
+    with pytest.raises(ErrorArgumentos) as e:
+        COMPRAR.parse(valores)
+    assert e.value.campo == campo
+    assert COMPRAR.uso in e.value.mensaje
+
+
+def test_fecha_invalida_explica_el_formato():
+    with pytest.raises(ErrorArgumentos) as e:
+        COMPRAR.parse(["987654321", "prime", "mañana", "5"])
+    assert argumentos.AYUDA_FECHA in e.value.mensaje
+
+
+@pytest.mark.parametrize("crudo, numero", [
+    ("987654321", "987654321"),
+    ("+51 987-654-321", "51987654321"),
+    ("(01) 987.654.321", "01987654321"),
+])
+def test_telefono_normaliza_separadores(crudo, numero):
+    assert argumentos.telefono(crudo) == numero
+
+
+@pytest.mark.parametrize("crudo", ["12345", "1234567890123456", "98765432x", ""])
+def test_telefono_rechaza(crudo):
+    with pytest.raises(ValueError):
+        argumentos.telefono(crudo)
+
+
+def test_telefono_parcial_acepta_desde_tres_digitos():
+    assert argumentos.telefono_parcial("321") == "321"
+    with pytest.raises(ValueError):
+        argumentos.telefono_parcial("21")
+
+
+def test_entero_positivo_rechaza_cero():
+    with pytest.raises(ValueError):
+        argumentos.entero_positivo("0")
+    assert argumentos.entero("0") == 0
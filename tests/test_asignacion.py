@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+import asignacion
+from modelos import Inventario
+
+
+def inventario(politica, *cuentas):
+    """cuentas: correos, o (correo, {campos extra}) para fijar usos o liberada."""
+    datos = []
+    for c in cuentas:
+        correo, extra = c if isinstance(c, tuple) else (c, {})
+        datos.append({"plataforma": "prime", "correo": correo, "contraseña": "p", "estado": "disponible",
+                      "cliente": None, "fecha_vencimiento": "", **extra})
+    return Inventario.from_dict({"cuentas": datos}, asignacion=politica)
+
+
+def entregar(inv, n):
+    correos = []
+    for _ in range(n):
+        cuenta = inv.primera_disponible("prime")
+        if cuenta is None:
+            break
+        correos.append(cuenta.correo)
+        inv.vender(cuenta, "911111111", None)
+    return correos
+
+
+def liberar(inv, *correos):
+    # Una pausa entre una y otra para que cada una quede con su propia hora de liberación
+    for correo in correos:
+        inv.liberar(inv.buscar("prime", correo))
+        time.sleep(0.002)
+
+
+def test_primera_sigue_el_orden_de_la_lista():
+    inv = inventario(asignacion.PRIMERA, "a@x.com", "b@x.com", "c@x.com")
+    assert entregar(inv, 2) == ["a@x.com", "b@x.com"]
+    liberar(inv, "b@x.com", "a@x.com")
+    assert entregar(inv, 3) == ["a@x.com", "b@x.com", "c@x.com"]
+
+
+def test_primera_con_correo_cambiado_conserva_su_lugar():
+    inv = inventario(asignacion.PRIMERA, "a@x.com", "b@x.com")
+    inv.cambiar_correo(inv.buscar("prime", "a@x.com"), "z@x.com")
+    assert entregar(inv, 2) == ["z@x.com", "b@x.com"]
+
+
+def test_fifo_entrega_la_liberada_hace_mas_tiempo():
+    inv = inventario(asignacion.FIFO, ("a@x.com", {"liberada": "2024-03-01T00:00:00"}),
+                     ("b@x.com", {"liberada": "2024-01-01T00:00:00"}), "c@x.com")
+    assert entregar(inv, 3) == ["c@x.com", "b@x.com", "a@x.com"]
+    liberar(inv, "a@x.com", "c@x.com", "b@x.com")
+    assert entregar(inv, 3) == ["a@x.com", "c@x.com", "b@x.com"]
+
+
+def test_fifo_con_correo_cambiado_conserva_su_liberacion():
+    inv = inventario(asignacion.FIFO, ("a@x.com", {"liberada": "2024-03-01T00:00:00"}),
+                     ("b@x.com", {"liberada": "2024-01-01T00:00:00"}))
+    inv.cambiar_correo(inv.buscar("prime", "b@x.com"), "z@x.com")
+    assert entregar(inv, 2) == ["z@x.com", "a@x.com"]
+
+
+def test_menos_usada_reparte_el_uso():
+    inv = inventario(asignacion.MENOS_USADA, ("a@x.com", {"usos": 2}), "b@x.com", ("c@x.com", {"usos": 1}))
+    assert entregar(inv, 1) == ["b@x.com"]
+    liberar(inv, "b@x.com")
+    # b ya tiene 1 uso, como c, pero c lleva más tiempo disponible
+    assert entregar(inv, 3) == ["c@x.com", "b@x.com", "a@x.com"]
+    liberar(inv, "a@x.com", "b@x.com", "c@x.com")
+    assert entregar(inv, 3) == ["b@x.com", "c@x.com", "a@x.com"]
+
+
+def test_menos_usada_con_correo_cambiado_conserva_sus_usos():
+    inv = inventario(asignacion.MENOS_USADA, ("a@x.com", {"usos": 3}), ("b@x.com", {"usos": 1}))
+    inv.cambiar_correo(inv.buscar("prime", "a@x.com"), "z@x.com")
+    assert entregar(inv, 2) == ["b@x.com", "z@x.com"]
+
+
+CASILLAS = ("a@x.com", "a+1@x.com", "b@x.com", "c@y.com", "d@z.com")
+
+
+def test_dominios_rota_por_dominio_y_luego_por_casilla():
+    inv = inventario(asignacion.DOMINIOS, *CASILLAS)
+    assert entregar(inv, 5) == ["a@x.com", "c@y.com", "d@z.com", "b@x.com", "a+1@x.com"]
+
+
+def test_dominios_consultar_sin_entregar_no_rota():
+    inv = inventario(asignacion.DOMINIOS, *CASILLAS)
+    assert inv.primera_disponible("prime") is inv.primera_disponible("prime")
+    assert entregar(inv, 2) == ["a@x.com", "c@y.com"]
+
+
+def test_dominios_despues_de_liberar():
+    inv = inventario(asignacion.DOMINIOS, *CASILLAS)
+    entregar(inv, 5)
+    liberar(inv, "a@x.com", "a+1@x.com", "c@y.com")
+    # Tras a+1@x.com le toca a otro dominio; de la casilla a@x sale primero la liberada antes
+    assert entregar(inv, 4) == ["c@y.com", "a@x.com", "a+1@x.com"]
+
+
+def test_dominios_con_correo_cambiado_pasa_a_su_nuevo_dominio():
+    inv = inventario(asignacion.DOMINIOS, "a@x.com", "b@x.com", "c@y.com")
+    inv.cambiar_correo(inv.buscar("prime", "a@x.com"), "a@w.com")
+    assert entregar(inv, 3) == ["b@x.com", "c@y.com", "a@w.com"]
+
+
+def test_politica_desconocida():
+    with pytest.raises(ValueError):
+        asignacion.crear("azar")
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import boveda
+from historial import Historial, deshacer_en
+
+pytest.importorskip("cryptography")
+
+DATOS = {
+    "cuentas": [{"plataforma": "prime", "correo": "a@x.com", "contraseña": "nueva", "estado": "vendido",
+                 "cliente": "911111111", "fecha_vencimiento": "01/01/99"}],
+    "clientes": {"911111111": [{"plataforma": "prime", "correo": "a@x.com", "contraseña": "nueva",
+                                "fecha_vencimiento": "01/01/99"}]},
+    "ganancias": {},
+}
+ANTES_CUENTA = {"plataforma": "prime", "correo": "a@x.com", "contraseña": "vieja", "estado": "disponible",
+                "cliente": None, "fecha_vencimiento": ""}
+ANTES_COMPRA = {"plataforma": "prime", "correo": "a@x.com", "contraseña": "vieja", "fecha_vencimiento": ""}
+
+
+def test_cifrar_reescribe_el_historial_de_cada_inquilino(tmp_path):
+    b = boveda.Boveda(boveda.Fernet.generate_key().decode('ascii'))
+    carpetas = [tmp_path, tmp_path / "inquilinos" / "2"]
+    for carpeta in carpetas:
+        carpeta.mkdir(parents=True, exist_ok=True)
+        (carpeta / "data.json").write_text(json.dumps(DATOS), encoding="utf-8")
+        Historial(str(carpeta / "historial.jsonl")).registrar(
+            "comprarcc", {"cuentas": [["prime", "a@x.com", ANTES_CUENTA, None]],
+                          "clientes": [["911111111", [ANTES_COMPRA]], ["922222222", None]]})
+
+    for carpeta in carpetas:
+        assert boveda.cifrar_archivos(b, str(carpeta / "data.json"), str(carpeta / "historial.jsonl")) == 4
+        texto = (carpeta / "data.json").read_text(encoding="utf-8") + (carpeta / "historial.jsonl").read_text(encoding="utf-8")
+        assert "vieja" not in texto and "nueva" not in texto
+        # Ya cifrado: una segunda pasada no toca nada
+        assert boveda.cifrar_archivos(b, str(carpeta / "data.json"), str(carpeta / "historial.jsonl")) == 0
+
+    # /deshacer devuelve a data.json la imagen previa, ya cifrada, con el mismo id
+    entrada = Historial(str(tmp_path / "historial.jsonl")).ultimas(1)[0]
+    assert entrada["id"] == 1
+    data = json.loads((tmp_path / "data.json").read_text(encoding="utf-8"))
+    deshacer_en(data, entrada)
+    assert boveda.cifrada(data["cuentas"][0]["contraseña"])
+    assert b.descifrar(data["cuentas"][0]["contraseña"]) == "vieja"
+    assert b.descifrar(data["clientes"]["911111111"][0]["contraseña"]) == "vieja"
@@ -0,0 +1,42 @@
+from clientes import IndiceClientes
+
+
+def indice(*numeros):
+    i = IndiceClientes()
+    for n in numeros:
+        i.agregar(n)
+    return i
+
+
+def test_exacto_primero_luego_terminacion_luego_parte():
+    i = indice("51987654321", "987654321", "900004321", "943210000", "111222333")
+    assert list(i.buscar("987654321")) == ["987654321", "51987654321"]
+    # Terminan en 4321 (en orden de número invertido) y después los que solo lo contienen
+    assert list(i.buscar("4321")) == ["900004321", "987654321", "51987654321", "943210000"]
+
+
+def test_sin_duplicados_si_termina_y_contiene():
+    i = indice("123123", "999123")
+    resultado = list(i.buscar("123"))
+    assert sorted(resultado) == ["123123", "999123"]
+    assert len(resultado) == len(set(resultado))
+
+
+def test_consulta_corta_solo_por_terminacion():
+    i = indice("987654321", "921000000")
+    assert list(i.buscar("21")) == ["987654321"]
+
+
+def test_parte_exige_la_cadena_completa_no_solo_los_trigramas():
+    # 123 y 234 están en 1234999 y en 999234123, pero solo el primero contiene 1234
+    i = indice("1234999", "999234123")
+    assert list(i.buscar("1234")) == ["1234999"]
+
+
+def test_agregar_dos_veces_no_duplica():
+    i = indice("987654321", "987654321")
+    assert list(i.buscar("321")) == ["987654321"]
+
+
+def test_sin_resultados():
+    assert list(indice("987654321").buscar("555")) == []
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+import comandos
+from conftest import Contexto, Update, ejecutar
+from inquilinos import Inquilinos, Tienda
+
+
+def cuentas(*correos):
+    return {"cuentas": [{"plataforma": "prime", "correo": c, "contraseña": "p", "estado": "disponible",
+                         "cliente": None, "fecha_vencimiento": ""} for c in correos],
+            "clientes": {}, "ganancias": {}}
+
+
+@pytest.fixture
+def inquilinos(tmp_path):
+    principal = tuple(str(tmp_path / n) for n in ("data.json", "historial.jsonl", "notificaciones.json",
+                                                  "eventos.jsonl"))
+    inq = Inquilinos(str(tmp_path / "inquilinos"), principal, maximo=1, multi=True)
+    os.makedirs(tmp_path / "inquilinos" / "2")
+    with open(tmp_path / "inquilinos" / "2" / "data.json", "w", encoding="utf-8") as f:
+        json.dump(cuentas("a@x.com", "b@x.com"), f)
+    return inq
+
+
+@pytest.fixture
+def registro(inquilinos):
+    registro = comandos.Registro()
+    registro.usar(comandos.argumentos(),
+                  comandos.transaccion(lambda update: inquilinos.de(update.effective_chat.id), espera=0.05))
+
+    @registro.comando("vender", escribe=True)
+    async def vender(pedido):
+        cuenta = pedido.data.primera_disponible("prime")
+        pedido.data.vender(cuenta, pedido.context.args[0], None)
+        pedido.registrar()
+        await pedido.responder(cuenta.correo)
+
+    @registro.comando("ver", carga=True)
+    async def ver(pedido):
+        await pedido.responder(str(len(pedido.data.cuentas)))
+
+    return registro
+
+
+def leer(inquilinos, id):
+    with open(os.path.join(inquilinos.carpeta, id, "data.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_no_se_descarga_mientras_responde(inquilinos, registro):
+    # Con una sola tienda en memoria y respuestas lentas, un comando de otro chat no puede
+    # descargar la tienda del chat 2 a mitad de una venta (antes se vendía dos veces a@x.com)
+    async def correr():
+        primera = asyncio.ensure_future(ejecutar(registro, "/vender 911111111", chat_id=2, demora=0.3))
+        await asyncio.sleep(0.05)
+        otra = asyncio.ensure_future(ejecutar(registro, "/ver", chat_id=3, demora=0.3))
+        await asyncio.sleep(0.05)
+        segunda = asyncio.ensure_future(ejecutar(registro, "/vender 922222222", chat_id=2, demora=0.3))
+        await asyncio.gather(primera, otra, segunda)
+        await inquilinos.vaciar()
+        return primera.result(), segunda.result()
+
+    primera, segunda = asyncio.run(correr())
+    assert primera.message.respuestas != segunda.message.respuestas
+    clientes = leer(inquilinos, "2")["clientes"]
+    assert sorted(c["correo"] for compras in clientes.values() for c in compras) == ["a@x.com", "b@x.com"]
+
+
+def test_rafaga_de_cambios_se_escribe_una_vez(inquilinos, registro, monkeypatch):
+    escrituras = []
+    original = Tienda._escribir_archivo
+    monkeypatch.setattr(Tienda, "_escribir_archivo", lambda self, foto: escrituras.append(1) or original(self, foto))
+
+    async def correr():
+        await asyncio.gather(ejecutar(registro, "/vender 911111111", chat_id=2),
+                             ejecutar(registro, "/vender 922222222", chat_id=2))
+        assert escrituras == []
+        await asyncio.sleep(0.2)
+
+    asyncio.run(correr())
+    assert len(escrituras) == 1
+    assert leer(inquilinos, "2") == inquilinos.por_id("2").data.to_dict()
+    assert len(inquilinos.por_id("2").historial) == 2
+
+
+def test_solo_lectura_no_escribe_ni_crea_carpetas(inquilinos, registro, monkeypatch):
+    escrituras = []
+    monkeypatch.setattr(Tienda, "_escribir_archivo", lambda self, foto: escrituras.append(self.id))
+
+    async def correr():
+        await ejecutar(registro, "/ver", chat_id=2)
+        await ejecutar(registro, "/ver", chat_id=7)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(correr())
+    assert escrituras == []
+    assert sorted(os.listdir(inquilinos.carpeta)) == ["2"]
+
+
+def test_tienda_en_uso_no_se_descarga(inquilinos):
+    tienda = inquilinos.por_id("2")
+    with tienda.en_uso():
+        inquilinos.por_id("3")
+        assert inquilinos.en_memoria("2") is tienda
+    inquilinos.por_id("4")
+    assert inquilinos.en_memoria("2") is None
+
+
+def test_abrir_lee_en_otro_hilo_y_deja_la_tienda_en_uso(inquilinos, monkeypatch):
+    tienda = inquilinos.por_id("2")
+    leer = tienda._leer
+    vistos = []
+
+    def leer_y_ver(*args):
+        vistos.append((threading.current_thread() is threading.main_thread(), tienda.ocupada))
+        return leer(*args)
+
+    monkeypatch.setattr(tienda, "_leer", leer_y_ver)
+
+    async def correr():
+        # Otro inquilino llega mientras se lee el archivo: no debe descargar esta tienda
+        lectura = asyncio.ensure_future(tienda.abrir())
+        await asyncio.sleep(0)
+        inquilinos.por_id("3")
+        assert inquilinos.en_memoria("2") is tienda
+        return await lectura
+
+    data = asyncio.run(correr())
+    assert vistos == [(False, True)]
+    assert [c.correo for c in data.cuentas] == ["a@x.com", "b@x.com"]
+    assert not tienda.ocupada
+
+
+def test_foto_sigue_los_cambios(inquilinos):
+    tienda = inquilinos.por_id("2")
+    data = tienda.cargar()
+    antes = data.to_dict()
+    data.vender(data.primera_disponible("prime"), "911111111", None)
+    data.sumar_ganancia("prime", 5, "911111111")
+    despues = data.to_dict()
+    assert antes["cuentas"][0]["estado"] == "disponible"
+    assert despues["cuentas"][0]["estado"] == "vendido"
+    # Lo que no cambió se reutiliza tal cual
+    assert despues["cuentas"][1] is antes["cuentas"][1]
+    # Y la foto es la misma que daría un inventario recién leído
+    assert tienda.desde_dict(json.loads(json.dumps(despues))).to_dict() == despues
+    data.sumar_ganancia("prime", 2, "911111111")
+    assert data.to_dict()["fichas"]["911111111"]["ganancia"] == 7
+
+
+class Boton:
+    def __init__(self, data):
+        self.data = data
+        self.avisos = []
+
+    async def answer(self, texto=None, **kwargs):
+        self.avisos.append(texto)
+
+
+def test_botones_pasan_por_las_etapas_sin_crear_tiendas(inquilinos):
+    registro = comandos.Registro()
+    registro.usar(comandos.errores(), comandos.metricas(registro), comandos.autorizacion(["2"]),
+                  comandos.transaccion(lambda update: inquilinos.de(update.effective_chat.id)))
+    vistas = []
+
+    @registro.boton("aviso", r"^aviso:\d+$")
+    async def aviso(pedido):
+        vistas.append(inquilinos.en_memoria(inquilinos.id_de(pedido.update.effective_chat.id)))
+        await pedido.responder("listo")
+
+    async def apretar(chat_id):
+        update = Update("", chat_id)
+        update.callback_query = Boton("aviso:1")
+        await registro.ejecutar(registro.comandos["aviso"], update, Contexto([]))
+        return update.callback_query.avisos
+
+    assert asyncio.run(apretar(3)) == ["⛔ No tienes permiso para usar este bot."]
+    assert asyncio.run(apretar(2)) == ["listo"]
+    assert vistas == [None]
+    assert inquilinos.cargadas() == []
+    assert registro.metricas["aviso"].llamadas == 2
+    assert [type(h).__name__ for h in registro.handlers()] == ["CallbackQueryHandler"]
@@ -0,0 +1,106 @@
+import asyncio
+import datetime
+import json
+
+import pytest
+
+import bot
+from conftest import ejecutar
+
+DATOS = {
+    "cuentas": [
+        {"plataforma": "prime", "correo": "a@x.com", "contraseña": "pa", "estado": "disponible",
+         "cliente": None, "fecha_vencimiento": ""},
+        {"plataforma": "prime", "correo": "b@x.com", "contraseña": "pb", "estado": "disponible",
+         "cliente": None, "fecha_vencimiento": ""},
+        {"plataforma": "max", "correo": "c@x.com", "contraseña": "pc", "estado": "vendido",
+         "cliente": "911111111", "fecha_vencimiento": "01/01/24"},
+        {"plataforma": "max", "correo": "d@x.com", "contraseña": "pd", "estado": "disponible",
+         "cliente": None, "fecha_vencimiento": ""},
+    ],
+    "clientes": {
+        "911111111": [{"plataforma": "max", "correo": "c@x.com", "contraseña": "pc", "fecha_vencimiento": "01/01/24"}],
+    },
+    "ganancias": {"max": 10},
+}
+
+
+@pytest.fixture
+def tienda(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("data.json", "w", encoding="utf-8") as f:
+        json.dump(DATOS, f, ensure_ascii=False, indent=4)
+    bot.inquilinos._tiendas.clear()
+    yield bot.inquilinos.por_id(bot.PRINCIPAL)
+    bot.inquilinos._tiendas.clear()
+
+
+def leer():
+    with open("data.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_deshacer_vuelve_al_archivo_original(tienda):
+    async def correr():
+        await ejecutar(bot.registro, "/comprarcc 922222222 prime 30/12/99 5")
+        await ejecutar(bot.registro, "/reemplazar prime a@x.com z@x.com pz")
+        await ejecutar(bot.registro, "/eliminar max d@x.com")
+        await ejecutar(bot.registro, "/vencidos")
+        await tienda.vaciar()
+        assert leer() != DATOS
+        update = await ejecutar(bot.registro, "/deshacer 4")
+        await tienda.vaciar()
+        return update
+
+    update = asyncio.run(correr())
+    assert update.message.respuestas[0].startswith("Se deshicieron 4 operación(es)")
+    assert leer() == DATOS
+    assert len(tienda.historial) == 0
+
+
+@pytest.mark.parametrize("comando", [
+    "/comprarcc 922222222 prime 30/12/99 5",
+    "/reemplazar max c@x.com z@x.com pz",
+    "/eliminar prime b@x.com",
+    "/vencidos",
+])
+def test_deshacer_una_operacion(tienda, comando):
+    async def correr():
+        await ejecutar(bot.registro, comando)
+        await ejecutar(bot.registro, "/deshacer")
+        await tienda.vaciar()
+
+    asyncio.run(correr())
+    assert leer() == DATOS
+
+
+def test_deshacer_con_reserva_vencida_descarta_lo_que_deshizo(tienda):
+    # Si al cargar se libera una reserva vencida, esa entrada nueva es la que se deshace y se quita
+    async def correr():
+        await ejecutar(bot.registro, "/eliminar max d@x.com")
+        data = tienda.cargar()
+        data.reservar(data.buscar("prime", "b@x.com"), "933333333",
+                      datetime.datetime.now() - datetime.timedelta(minutes=1))
+        return await ejecutar(bot.registro, "/deshacer")
+
+    update = asyncio.run(correr())
+    deshechas = [e for e in update.message.respuestas[0].splitlines() if e.startswith("#")]
+    quedan = [bot.describir_entrada(e) for e in tienda.historial.ultimas(10)]
+    assert len(deshechas) == 1 and "reservas vencidas" in deshechas[0]
+    assert [e.split(" - ")[1] for e in quedan] == ["eliminar"]
+    assert deshechas[0] not in quedan
+
+
+def test_restaurar_antes_del_historial_no_hace_nada(tienda):
+    async def correr():
+        await ejecutar(bot.registro, "/eliminar max d@x.com")
+        await tienda.vaciar()
+        antes = leer()
+        update = await ejecutar(bot.registro, "/restaurar 01/01/20")
+        await tienda.vaciar()
+        return antes, update
+
+    antes, update = asyncio.run(correr())
+    assert update.message.respuestas[0].startswith("El historial empieza el")
+    assert leer() == antes
+    assert len(tienda.historial) == 1
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+import eventos
+from eventos import Feed
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return str(tmp_path / "eventos.jsonl")
+
+
+def publicar(feed, n):
+    return [feed.publicar("venta", {"n": i}, operacion=i) for i in range(n)]
+
+
+def test_offsets_correlativos_y_leer_desde(ruta):
+    feed = Feed(ruta)
+    assert feed.ultimo == 0 and feed.leer() == []
+    publicar(feed, 5)
+    assert feed.ultimo == 5
+    assert [e["offset"] for e in feed.leer(2, limite=2)] == [3, 4]
+    assert [e["n"] for e in feed.leer(3)] == [3, 4]
+    assert feed.leer(5) == [] and feed.leer(0, limite=0) == []
+
+
+def test_offsets_siguen_despues_de_reiniciar(ruta):
+    publicar(Feed(ruta), 3)
+    feed = Feed(ruta)
+    assert feed.ultimo == 3
+    assert feed.publicar("venta", {})["offset"] == 4
+    assert [e["offset"] for e in feed.leer(2)] == [3, 4]
+
+
+def test_offsets_no_empiezan_en_uno_si_el_archivo_fue_recortado(ruta):
+    publicar(Feed(ruta), 6)
+    with open(ruta, "rb") as f:
+        lineas = f.readlines()
+    with open(ruta, "wb") as f:
+        f.writelines(lineas[4:])
+    feed = Feed(ruta)
+    assert feed.ultimo == 6
+    assert [e["offset"] for e in feed.leer(0)] == [5, 6]
+    assert [e["offset"] for e in feed.leer(5)] == [6]
+
+
+def test_cursores_persisten_y_validan_el_rango(ruta):
+    feed = Feed(ruta)
+    publicar(feed, 4)
+    feed.confirmar("planilla", 3)
+    with pytest.raises(ValueError):
+        feed.confirmar("planilla", 5)
+    with pytest.raises(ValueError):
+        feed.confirmar("planilla", -1)
+    otro = Feed(ruta)
+    assert otro.posicion("planilla") == 3 and otro.posicion("tablero") == 0
+    assert [e["offset"] for e in otro.pendientes("planilla")] == [4]
+    otro.confirmar("planilla", 0)
+    assert len(Feed(ruta).pendientes("planilla")) == 4
+
+
+def test_lee_lo_que_agrega_otro_feed_del_mismo_archivo(ruta):
+    tienda, web = Feed(ruta), Feed(ruta)
+    publicar(tienda, 2)
+    assert [e["offset"] for e in web.leer()] == [1, 2]
+    web.confirmar("planilla", 2)
+    publicar(tienda, 1)
+    assert [e["offset"] for e in web.pendientes("planilla")] == [3]
+
+
+def test_linea_a_medio_escribir_se_lee_despues(ruta):
+    feed = Feed(ruta)
+    publicar(feed, 1)
+    web = Feed(ruta)
+    linea = json.dumps({"offset": 2, "tipo": "venta"}).encode()
+    with open(ruta, "ab") as f:
+        f.write(linea[:10])
+    assert [e["offset"] for e in web.leer()] == [1]
+    with open(ruta, "ab") as f:
+        f.write(linea[10:] + b"\n")
+    assert [e["offset"] for e in web.leer()] == [1, 2]
+
+
+def test_abrir_guarda_como_maximo_los_pedidos(tmp_path, monkeypatch):
+    monkeypatch.setattr(eventos, "_abiertos", type(eventos._abiertos)())
+    rutas = [str(tmp_path / f"{i}.jsonl") for i in range(4)]
+    primero = eventos.abrir(rutas[0], maximo=2)
+    assert eventos.abrir(rutas[0], maximo=2) is primero
+    for r in rutas[1:]:
+        eventos.abrir(r, maximo=2)
+    assert len(eventos._abiertos) == 2
+    assert eventos.abrir(rutas[0], maximo=2) is not primero